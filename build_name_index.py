@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+Build the offline name indexes used by depscan.py to check if a package exists without asking the registry.
+The names are downloaded from the registry (PyPI simple index, npm replicate _all_docs, rubygems names list) or read from a local dump file:
+one name per line, a JSON list of names or an npm _all_docs JSON document.
+Run it periodically (e.g. weekly), the packages not found in the index are always checked online.
+"""
+import argparse
+import json
+import logging
+import os
+
+import yaml
+
+from depscanner.HttpClient import HttpClient
+from depscanner.NameIndex import NameIndex
+
+logger = logging.getLogger(__name__)
+
+PYPI_SIMPLE_URL = "https://pypi.org/simple/"
+NPM_ALL_DOCS_URL = "https://replicate.npmjs.com/_all_docs"
+RUBYGEMS_NAMES_URL = "https://rubygems.org/names"
+
+
+def argument_parser():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser(description="Build the offline index of the package names of the public registries")
+    parser.add_argument(
+        "-R",
+        "--registry",
+        help="Registry to index (default: all)",
+        action="append",
+        choices=["pypi.org", "registry.npmjs.org", "rubygems.org"],
+    )
+    parser.add_argument("-f", "--file", help="Local dump file with the names of the registry, instead of downloading them")
+    parser.add_argument("-c", "--config", help="Configuration file (default: config.yml)", default="config.yml")
+    parser.add_argument("-D", "--directory", help="Directory of the indexes (default: name_index.directory of the config file)")
+    parser.add_argument("-P", "--proxy", help="Proxy for HTTP connections (debugging purposes)")
+    parser.add_argument(
+        "-L",
+        "--level",
+        help="Log level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    )
+    return parser.parse_args()
+
+
+def read_names_file(path: str) -> list[str]:
+    """Read the names from a local dump file"""
+    with open(path, "r", encoding="UTF-8") as f:
+        content = f.read()
+    try:
+        document = json.loads(content)
+    except json.JSONDecodeError:
+        return content.splitlines()
+    if isinstance(document, dict):
+        return [row["id"] for row in document.get("rows", [])]
+    return list(document)
+
+
+def download_pypi_names(http: HttpClient) -> list[str]:
+    """All the project names of the PyPI simple index (PEP 691 JSON)"""
+    response = http.get(PYPI_SIMPLE_URL, headers={"Accept": "application/vnd.pypi.simple.v1+json"}, timeout=300)
+    response.raise_for_status()
+    return [project["name"] for project in response.json()["projects"]]
+
+
+def download_npm_names(http: HttpClient, page_size: int = 10000) -> list[str]:
+    """All the package names of npm, paging through the _all_docs view of the replication endpoint"""
+    names = []
+    startkey = None
+    while True:
+        params = {"limit": page_size}
+        if startkey is not None:
+            params["startkey"] = json.dumps(startkey)
+            params["skip"] = 1
+        response = http.get(NPM_ALL_DOCS_URL, params=params, timeout=300)
+        response.raise_for_status()
+        rows = response.json().get("rows", [])
+        names += [row["id"] for row in rows if not row["id"].startswith("_design/")]
+        logger.debug(f"{len(names)} npm names downloaded")
+        if len(rows) < page_size:
+            return names
+        startkey = rows[-1]["id"]
+
+
+def download_rubygems_names(http: HttpClient) -> list[str]:
+    """All the gem names of the rubygems compact index"""
+    response = http.get(RUBYGEMS_NAMES_URL, timeout=300)
+    response.raise_for_status()
+    # The list starts after the '---' line
+    lines = response.text.splitlines()
+    if "---" in lines:
+        lines = lines[lines.index("---") + 1:]
+    return lines
+
+
+DOWNLOADERS = {
+    "pypi.org": download_pypi_names,
+    "registry.npmjs.org": download_npm_names,
+    "rubygems.org": download_rubygems_names,
+}
+
+
+############
+### Main ###
+############
+
+if __name__ == "__main__":
+    arguments = argument_parser()
+    logging.basicConfig(level=getattr(logging, arguments.level), format="%(asctime)s - %(levelname)s - %(message)s")
+
+    directory = arguments.directory
+    if directory is None:
+        with open(arguments.config, "r", encoding="UTF-8") as f:
+            directory = (yaml.safe_load(f).get("name_index") or {}).get("directory", "indexes")
+
+    registries = arguments.registry or list(DOWNLOADERS.keys())
+    if arguments.file and len(registries) != 1:
+        raise SystemExit("Specify the registry of the dump file with -R")
+
+    os.makedirs(directory, exist_ok=True)
+    proxies = {"http": arguments.proxy, "https": arguments.proxy} if arguments.proxy else None
+    http = HttpClient(logger=logger, proxies=proxies)
+    for registry in registries:
+        logger.info(f"Getting the names of {registry}")
+        if arguments.file:
+            names = read_names_file(arguments.file)
+        else:
+            names = DOWNLOADERS[registry](http)
+        path = NameIndex.get_path(directory, registry)
+        count = NameIndex.build(names, path=path, registry=registry)
+        logger.info(f"📇 Indexed {count} names of {registry} in {path}")
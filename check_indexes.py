@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+Check that the queries of the scanner are served by an index.
+Runs explain() on every query pattern of MongoManager and reports the ones scanning the whole collection (COLLSCAN)
+or sorting in memory. Use --ensure to create the missing indexes first.
+"""
+import argparse
+import logging
+import os
+
+import yaml
+
+from depscanner.MongoManager import MongoManager
+
+logger = logging.getLogger(__name__)
+
+
+def argument_parser():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser(description="Report the queries of the scanner that are not served by an index")
+    parser.add_argument("-c", "--config", help="Configuration file (default: config.yml)", default="config.yml")
+    parser.add_argument(
+        "-E",
+        "--ensure",
+        help="Create the indexes of the scanner before explaining the queries (default: False)",
+        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-L",
+        "--level",
+        help="Log level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    )
+    return parser.parse_args()
+
+
+############
+### Main ###
+############
+
+if __name__ == "__main__":
+    arguments = argument_parser()
+    logging.basicConfig(level=getattr(logging, arguments.level), format="%(asctime)s - %(levelname)s - %(message)s")
+
+    with open(arguments.config, "r", encoding="UTF-8") as f:
+        mongo = yaml.safe_load(f).get("mongo")
+    mongomgr = MongoManager(
+        host=mongo["host"],
+        port=mongo["port"],
+        database=mongo["database"],
+        username=mongo["username"],
+        # The password is replaced by envsubst in the containers, expand it when running outside of them
+        password=os.path.expandvars(str(mongo["password"])),
+        logger=logger,
+    )
+    if arguments.ensure:
+        mongomgr.ensure_indexes()
+
+    collection_scans = 0
+    for plan in mongomgr.explain_queries():
+        stages = " > ".join(plan["stages"])
+        if plan["collection_scan"]:
+            collection_scans += 1
+            logger.warning(f"❌ {plan['query']}: collection scan ({stages})")
+        elif plan["in_memory_sort"]:
+            logger.warning(f"⚠️ {plan['query']}: sorted in memory ({stages})")
+        else:
+            logger.info(f"✅ {plan['query']}: {stages}")
+    mongomgr.close_database()
+    if collection_scans > 0:
+        raise SystemExit(f"{collection_scans} queries scan a whole collection")
@@ -10,7 +10,7 @@ if the package does not exist, print the dependency and the repository where it
 """
 import argparse
 import logging
-from depscanner import DepScanner
+from depscanner import DepScanner, ShardedScan
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +26,8 @@ def argument_parser():
         "sources",
         description="Files containing domains, organisations names or repository names",
     )
-    exclusive_source = source_group.add_mutually_exclusive_group(required=True)
+    # Not required when an interrupted scan is resumed, it keeps its own targets
+    exclusive_source = source_group.add_mutually_exclusive_group()
     exclusive_source.add_argument(
         "-d", "--domains", help="File containing domain names", default=None
     )
@@ -43,7 +44,12 @@ def argument_parser():
         default=0,
         type=int,
     )
-    parser.add_argument("-t", "--token", help="GitHub PAT token for the API")
+    parser.add_argument(
+        "-t",
+        "--token",
+        help="GitHub PAT token for the API. Repeat it or separate the tokens with commas to rotate between several tokens",
+        action="append",
+    )
     parser.add_argument(
         "-P", "--proxy", help="Proxy for HTTP connections (debugging purposes)"
     )
@@ -57,6 +63,33 @@ def argument_parser():
         default=False,
         action="store_true",
     )
+    parser.add_argument(
+        "-I",
+        "--incremental",
+        help="Skip the repositories that didn't change since their last scan and report their known findings from the database (default: False)",
+        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-D",
+        "--distributed",
+        help="Queue the repositories in the database so workers (depscanner worker <scan id>) on other processes or machines share the scan (default: False)",
+        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Split the organisations or repositories between this number of local processes (default: 1)",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="SCAN_ID",
+        help="Continue an interrupted scan where it stopped, with its targets and options",
+        default=None,
+    )
     parser.add_argument(
         "-L",
         "--level",
@@ -64,7 +97,14 @@ def argument_parser():
         default="INFO",
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
     )
-    return parser.parse_args()
+    arguments = parser.parse_args()
+    if arguments.resume is None and not (arguments.domains or arguments.orgs or arguments.repos):
+        parser.error("one of the arguments -d/--domains -o/--orgs -r/--repos is required")
+    if arguments.workers < 1:
+        parser.error("argument -w/--workers must be at least 1")
+    if arguments.workers > 1 and (arguments.resume or arguments.distributed):
+        parser.error("argument -w/--workers can't be used with --resume or -D/--distributed")
+    return arguments
 
 
 def logging_setup(log_level: str, logfile: str = "depscan.log"):
@@ -85,23 +125,44 @@ def logging_setup(log_level: str, logfile: str = "depscan.log"):
 ### Main ###
 ############
 
-# Init logging
-arguments = argument_parser()
-logging_setup(log_level=arguments.level)
+# The processes of --workers import this module, the scan only runs in the main one
+if __name__ == "__main__":
+    # Init logging
+    arguments = argument_parser()
+    logging_setup(log_level=arguments.level)
 
-# Kikc off the scanner with the arguments provided
-ds = DepScanner(
-    organisation_file=arguments.orgs,
-    repositories_file=arguments.repos,
-    domains_file=arguments.domains,
-    gh_token=arguments.token,
-    force=bool(arguments.force),
-    proxy=arguments.proxy,
-    logger=logger,
-    webhook_url=arguments.webhook,
-    stars=arguments.stars,
-)
-if ds.is_user_authenticated():
-    ds.scan()
-else:
-    logger.error("User not autenticated successfully. Stopping")
+    if arguments.workers > 1:
+        # Each process scans a part of the targets with its own DepScanner, this one writes their logs and progress
+        ShardedScan(
+            workers=arguments.workers,
+            organisation_file=arguments.orgs,
+            repositories_file=arguments.repos,
+            domains_file=arguments.domains,
+            gh_token=arguments.token,
+            force=bool(arguments.force),
+            proxy=arguments.proxy,
+            logger=logger,
+            webhook_url=arguments.webhook,
+            stars=arguments.stars,
+            incremental=bool(arguments.incremental),
+        ).scan()
+    else:
+        # Kikc off the scanner with the arguments provided
+        ds = DepScanner(
+            organisation_file=arguments.orgs,
+            repositories_file=arguments.repos,
+            domains_file=arguments.domains,
+            gh_token=arguments.token,
+            force=bool(arguments.force),
+            proxy=arguments.proxy,
+            logger=logger,
+            webhook_url=arguments.webhook,
+            stars=arguments.stars,
+            incremental=bool(arguments.incremental),
+            resume=arguments.resume,
+            distributed=bool(arguments.distributed),
+        )
+        if ds.is_user_authenticated():
+            ds.scan()
+        else:
+            logger.error("User not autenticated successfully. Stopping")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+Worker of a distributed scan.
+A distributed scan is started with depscan.py --distributed, which queues one job per repository in the database.
+Any number of workers, on this machine or others sharing the same MongoDB, take the jobs of the scan until it's finished.
+Each worker uses its own GitHub tokens and proxy, so the requests can be spread between several tokens and egress IPs.
+"""
+import argparse
+import logging
+from depscanner import DepScanner
+
+logger = logging.getLogger(__name__)
+
+
+def argument_parser():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser(description="Work on the jobs of a distributed depscanner scan")
+    parser.add_argument("scan_id", help="Id of the scan, printed by depscan.py --distributed")
+    parser.add_argument(
+        "-t",
+        "--token",
+        help="GitHub PAT token for the API. Repeat it or separate the tokens with commas to rotate between several tokens",
+        action="append",
+    )
+    parser.add_argument(
+        "-P", "--proxy", help="Proxy for HTTP connections (debugging purposes)"
+    )
+    parser.add_argument(
+        "-W", "--webhook", help="Discord webhook to receive missing packages details"
+    )
+    parser.add_argument("-c", "--config", help="Configuration file (default: config.yml)", default="config.yml")
+    parser.add_argument("--worker-id", help="Name of this worker in the job leases (default: hostname-pid)", default=None)
+    parser.add_argument(
+        "-L",
+        "--level",
+        help="Log level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    )
+    return parser.parse_args()
+
+
+def logging_setup(log_level: str, logfile: str = "depscan-worker.log"):
+    """Setup the logging for the application"""
+    logging.basicConfig(
+        level=getattr(logging, log_level),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filename=logfile,
+    )
+    # Create console handler
+    console = logging.StreamHandler()
+    console.setLevel(getattr(logging, log_level))
+    console.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(console)
+
+
+############
+### Main ###
+############
+
+if __name__ == "__main__":
+    arguments = argument_parser()
+    logging_setup(log_level=arguments.level)
+
+    ds = DepScanner(
+        gh_token=arguments.token,
+        proxy=arguments.proxy,
+        logger=logger,
+        webhook_url=arguments.webhook,
+        config=arguments.config,
+    )
+    if ds.is_user_authenticated():
+        ds.run_worker(arguments.scan_id, worker_id=arguments.worker_id)
+        ds.close()
+    else:
+        logger.error("User not autenticated successfully. Stopping")
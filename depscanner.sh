@@ -1,3 +1,9 @@
 #!/bin/bash
 
-python /app/depscan.py "$@"
\ No newline at end of file
+# "depscanner worker <scan id>" joins a distributed scan, anything else runs a scan
+if [ "$1" = "worker" ]; then
+    shift
+    python /app/depscan_worker.py "$@"
+else
+    python /app/depscan.py "$@"
+fi
\ No newline at end of file
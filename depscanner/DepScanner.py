@@ -1,13 +1,15 @@
 import time
+import random
 import logging
+import threading
 import re
 import json
 from urllib.parse import urlparse
 # from collections import namedtuple
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import os
+import socket
 from os.path import exists as file_exist
-from functools import lru_cache
 import urllib3
 
 import yaml
@@ -17,6 +19,21 @@ from depscanner.Utils import get_response_emoji, get_stars_score
 from depscanner.ModfileParser import ModfileParser, DependencyInfo
 from depscanner.DiscordBell import DiscordBell
 from depscanner.MongoManager import MongoManager
+from depscanner.HttpClient import HttpClient
+from depscanner.ResponseCache import ResponseCache
+from depscanner.ParseCache import ParseCache
+from depscanner.ResolutionCache import ResolutionCache
+from depscanner.NameIndex import NameIndex
+from depscanner.GoModuleResolver import GoModuleResolver
+from depscanner.ScopeResolver import ScopeResolver
+from depscanner.ScanCheckpoint import ScanCheckpoint
+from depscanner.JobQueue import JobQueue
+from depscanner.RateLimiter import RateLimiter
+from depscanner.GithubGraphQL import GithubGraphQL
+from depscanner.OrgEnumerator import OrgEnumerator
+from depscanner.RegistryResolver import RegistryResolver
+from depscanner.WorkerPool import WorkerPool
+from depscanner.ScanPipeline import ScanPipeline, PipelineStage
 from depscanner.models.Package import Package
 from depscanner.models.Dependency import Dependency
 from depscanner.models.Scope import Scope
@@ -40,12 +57,23 @@ class SearchOutcome(Enum):
     INFORMATION=auto()
     UNKNOWN=auto()
 
+class DepfileJob:
+    """A dependency file of a repository travelling through the scan pipeline"""
+
+    def __init__(self, gh_repo: dict, item: dict):
+        self.gh_repo = gh_repo
+        self.item = item
+        self.content = None
+        self.required_packages = None  # None until the dependency file is parsed
+        self.results = []
+        self.finished = False  # Set when the file went through all the stages it needed without errors
+
 class DepScanner:
     """This class is responsible for scanning the dependencies of the repositories or domains provided"""
 
     def __init__(
         self,
-        gh_token: str,
+        gh_token: str | list[str],
         logger: logging.Logger,
         force: bool = False,
         proxy: str = None,
@@ -55,15 +83,25 @@ class DepScanner:
         config: str = "config.yml",
         webhook_url: str = None,
         stars: int = 0,
+        incremental: bool = False,
+        resume: str = None,
+        distributed: bool = False,
     ):
 
         self.targetfile = organisation_file
-        self.gh_token = gh_token
+        # One or more GitHub tokens. The requests are spread between them by the rate limiter
+        self.gh_tokens = self._parse_tokens(gh_token)
         self.proxy = proxy
         self.force = force
         self.logger = logger
         self.config = config
         self.minimum_stars = stars
+        # Skip the repositories that didn't change since their last scan
+        self.incremental = incremental
+        # Id of an interrupted scan to continue where it stopped
+        self.resume = resume
+        # Queue the repositories in the database so several workers can share the scan
+        self.distributed = distributed
         self.target_repository_names = self.load_repositories(repositories_file)
         self.target_organisation_names = self.load_organisations(organisation_file)
         self.domain_names = None
@@ -81,22 +119,11 @@ class DepScanner:
         self.webhook_url = webhook_url
         self.bell = DiscordBell(webhook_url=self.webhook_url, logger=self.logger)
 
-        # Setup search API token
-        if self.gh_token:
-            self.headers["Authorization"] = f"Bearer {self.gh_token}"
-        else:
-            self.logger.warning("No GitHub API token provided. Rate limits may apply.")
-
         # Set proxies
         if self.proxy:
             self.proxies["http"] = self.proxy
             self.proxies["https"] = self.proxy
 
-        # Init the modparser object
-        self.modparser = ModfileParser(
-            proxies=self.proxies, headers=self.headers, logger=self.logger
-        )
-
         # Read config settings
         self.api_base = None
         self.lang_repos = None
@@ -104,9 +131,112 @@ class DepScanner:
         self.pub_repos = None
         self.jitter = None
         self.backoffbase = None
+        self.request_timeout = 30
+        self.http_config = {}
+        self.resolver_mode = "async"
+        self.registry_concurrency = {}
+        self.workers_config = {}
+        self.pipeline_config = {}
+        self.depfile_discovery = "trees"
+        self.depfile_fetch = {}
+        self.http_cache_config = {}
+        self.rate_limit_config = {}
+        self.org_enumeration = {}
+        self.parse_cache = True
+        self.resolution_cache_config = {}
+        self.registry_probe = {}
+        self.name_index_config = {}
+        self.go_modules_config = {}
+        self.scope_cache_config = {}
+        self.write_buffer_config = {}
+        self.ensure_indexes = True
+        self.checkpoints = True
+        self.job_queue_config = {}
         self.mongo = None
+        # State of the last scan of each repository (pushed_at and tree of the default branch), for the incremental mode
+        self._scan_states = {}
+        self._repo_trees = {}
+        self._incomplete_repos = set()
+        self.unchanged_repos = 0
         # Load data from configuration file, including the mongo configuration
         self.load_config()
+
+        # Setup search API token. The Authorization header is replaced by HttpClient with the token picked for each request
+        self.gh_token = self.gh_tokens[0] if self.gh_tokens else None
+        if self.gh_token:
+            self.headers["Authorization"] = f"Bearer {self.gh_token}"
+            self.logger.debug(f"Using {len(self.gh_tokens)} GitHub API token(s)")
+        else:
+            self.logger.warning("No GitHub API token provided. Rate limits may apply.")
+
+        # Shared HTTP client with keep-alive pools for GitHub, the registries and the go-import lookups
+        self.http = HttpClient(
+            logger=self.logger,
+            proxies=self.proxies,
+            timeout=self.request_timeout,
+            pool_connections=self.http_config.get("pool_connections", 10),
+            pool_maxsize=self.http_config.get("pool_maxsize", 10),
+            host_pools=self.http_config.get("host_pools"),
+            max_retries=self.http_config.get("max_retries", 3),
+            backoff_factor=self.http_config.get("backoff_factor", 0.5),
+        )
+
+        # Pace the GitHub API requests with the quota reported in the response headers
+        self.rate_limiter = RateLimiter(
+            logger=self.logger,
+            tokens=self.gh_tokens,
+            jitter=self.jitter,
+            pace_below=self.rate_limit_config.get("pace_below", 0.2),
+            reserve=self.rate_limit_config.get("reserve", 0),
+        )
+        self.http.set_rate_limiter(
+            self.rate_limiter,
+            hosts=[urlparse(self.api_base or "https://api.github.com").netloc],
+        )
+
+        # Scan-wide pool of worker threads with a bounded submission queue
+        self.pool = WorkerPool(
+            logger=self.logger,
+            max_workers=self.workers_config.get("max_workers", 32),
+            queue_size=self.workers_config.get("queue_size", 256),
+        )
+
+        # Registry lookups already resolved in this process. Concurrent lookups of the same package share one request
+        self.resolution_cache = ResolutionCache(
+            logger=self.logger,
+            ttl=self.resolution_cache_config.get("ttl", 3600),
+            max_entries=self.resolution_cache_config.get("max_entries", 10000),
+        )
+
+        # Offline indexes of the names published in the registries (see build_name_index.py)
+        self.name_indexes = {}
+        self.name_index_hits = 0
+        if self.name_index_config.get("enabled", True):
+            self.name_indexes = NameIndex.load_all(
+                # Relative to the configuration file, the web application runs from another directory
+                directory=os.path.join(os.path.dirname(os.path.abspath(self.config)), self.name_index_config.get("directory", "indexes")),
+                registries=list((self.lang_repos or {}).values()),
+                logger=self.logger,
+            )
+
+        # asyncio engine for the registry lookups. The "threads" mode keeps the thread per dependency model
+        self.resolver = None
+        if self.resolver_mode == "async":
+            self.resolver = RegistryResolver(
+                dep_scanner=self,
+                logger=self.logger,
+                concurrency=self.registry_concurrency,
+                default_concurrency=self.registry_concurrency.get("default", 20),
+                timeout=self.request_timeout,
+                proxy=self.proxy,
+                pool=self.pool,
+                http=self.http,
+            )
+
+        # GraphQL client to fetch many dependency files in one request. The GraphQL API requires a token
+        self.graphql = GithubGraphQL(http=self.http, headers=self.headers, logger=self.logger, api_base=self.api_base)
+        use_graphql = self.depfile_fetch.get("mode", "graphql") == "graphql" and self.gh_token
+
         # Initialize mongo connection
         self.mongomgr = MongoManager(
             host=self.mongo["host"],
@@ -116,11 +246,106 @@ class DepScanner:
             password=self.mongo["password"],
             logger=self.logger
         )
+        # Indexes matching the queries of the scanner
+        if self.ensure_indexes:
+            self.mongomgr.ensure_indexes()
+
+        # Persistent state of the scan, to resume it if the process dies
+        self.checkpoint = ScanCheckpoint(mongomgr=self.mongomgr, logger=self.logger) if self.checkpoints or self.resume or self.distributed else None
+
+        # Jobs of the distributed scans, shared by all their workers
+        self.job_queue = JobQueue(
+            mongomgr=self.mongomgr,
+            logger=self.logger,
+            visibility_timeout=self.job_queue_config.get("visibility_timeout", 600),
+            max_attempts=self.job_queue_config.get("max_attempts", 5),
+        )
 
-        self.current_repo_index = 0  # Track the current repository being processed
+        # npm scopes known in memory or in the database are not asked online again
+        self.scope_resolver = ScopeResolver(
+            http=self.http,
+            mongomgr=self.mongomgr,
+            logger=self.logger,
+            ttl=self.scope_cache_config.get("ttl", 86400),
+            max_entries=self.scope_cache_config.get("max_entries", 10000),
+        )
+
+        # Repositories of the Go modules, resolved concurrently and cached by path prefix for the whole scan
+        self.go_resolver = GoModuleResolver(
+            http=self.http,
+            logger=self.logger,
+            pool=self.pool,
+            proxy=self.go_modules_config.get("proxy"),
+            timeout=self.go_modules_config.get("timeout", 10),
+        )
+
+        # Init the modparser object
+        self.modparser = ModfileParser(
+            proxies=self.proxies,
+            headers=self.headers,
+            logger=self.logger,
+            http=self.http,
+            graphql=self.graphql if use_graphql else None,
+            parse_cache=ParseCache(mongomgr=self.mongomgr, logger=self.logger) if self.parse_cache else None,
+            go_resolver=self.go_resolver,
+        )
+
+        # Enumeration of the repositories of the organisations, all the pages and several organisations at a time
+        self.org_enumerator = OrgEnumerator(
+            http=self.http,
+            headers=self.headers,
+            logger=self.logger,
+            pool=self.pool,
+            api_base=self.api_base,
+            graphql=self.graphql if self.org_enumeration.get("mode", "rest") == "graphql" and self.gh_token else None,
+            org_workers=self.org_enumeration.get("org_workers", 4),
+            backoff=self._backoff,
+        )
+
+        # Conditional requests (ETag/Last-Modified) to the GitHub API. A 304 Not Modified doesn't count against the rate limit
+        if self.http_cache_config.get("enabled", True):
+            self.http.set_cache(
+                ResponseCache(
+                    mongomgr=self.mongomgr,
+                    logger=self.logger,
+                    max_body_bytes=self.http_cache_config.get("max_body_bytes", 8 * 1024 * 1024),
+                ),
+                hosts=self.http_cache_config.get("hosts", [urlparse(self.api_base or "https://api.github.com").netloc]),
+            )
+
+        self.current_repo_index = 0  # Track the number of repositories completely processed
+        self.pipeline = None
+        self._progress_lock = threading.Lock()
+        self._repo_count = 0
+        self._pending_depfiles = {}  # Dependency files of each repository still going through the pipeline
+        self._resumed_repos = 0  # Repositories completed before the scan was resumed
+        # "index/count" of the process running this part of a sharded scan (--workers)
+        self.shard = None
+        self.findings = 0  # Missing packages reported during the scan
 
     #### Functions ####
-    def load_repositories(self, file: str) -> list:
+    @staticmethod
+    def _parse_tokens(tokens: str | list[str]) -> list[str]:
+        """Return the list of tokens from a token, a list of tokens or comma/whitespace separated tokens"""
+        if not tokens:
+            return []
+        if isinstance(tokens, str):
+            tokens = [tokens]
+        parsed = []
+        for value in tokens:
+            for token in re.split(r"[\s,]+", value or ""):
+                if token and token not in parsed:
+                    parsed.append(token)
+        return parsed
+
+    def set_targets(self, organisations: list = None, repositories: list = None, domains: list = None):
+        """Replace the targets loaded from the files, e.g. with the ones of a resumed scan or a shard"""
+        self.target_organisation_names = list(organisations or [])
+        self.target_repository_names = list(repositories or [])
+        self.domain_names = list(domains or [])
+
+    @staticmethod
+    def load_repositories(file: str) -> list:
         """Load the repositories from a file into the class variable"""
         valid_repos = []
         if file is not None and file_exist(file):
@@ -144,7 +369,8 @@ class DepScanner:
                 )
         return self.domain_names
 
-    def load_organisations(self, file: str) -> list:
+    @staticmethod
+    def load_organisations(file: str) -> list:
         """Load the organisations from a file into the class variable"""
         valid_orgs = []
         if file is not None and file_exist(file):
@@ -167,6 +393,31 @@ class DepScanner:
                 self.jitter = config.get("jitter")
                 self.backoffbase = config.get("backoffbase")
                 self.request_timeout = config.get("request_timeout")
+                self.http_config = config.get("http", {})
+                self.resolver_mode = config.get("resolver", "async")
+                self.registry_concurrency = config.get("registry_concurrency", {})
+                self.workers_config = config.get("workers", {})
+                self.pipeline_config = config.get("pipeline", {})
+                self.depfile_discovery = config.get("depfile_discovery", "trees")
+                self.depfile_fetch = config.get("depfile_fetch", {})
+                self.http_cache_config = config.get("http_cache", {})
+                self.rate_limit_config = config.get("rate_limit", {})
+                self.org_enumeration = config.get("org_enumeration", {})
+                self.parse_cache = config.get("parse_cache", True)
+                self.resolution_cache_config = config.get("resolution_cache", {})
+                self.registry_probe = config.get("registry_probe", {})
+                self.name_index_config = config.get("name_index", {})
+                self.go_modules_config = config.get("go_modules", {})
+                self.scope_cache_config = config.get("scope_cache", {})
+                self.write_buffer_config = config.get("write_buffer", {})
+                self.ensure_indexes = config.get("ensure_indexes", True)
+                self.incremental = self.incremental or config.get("incremental", False)
+                self.checkpoints = config.get("checkpoints", True)
+                self.job_queue_config = config.get("job_queue", {})
+                # Tokens of the config file are added to the ones given as arguments
+                for token in self._parse_tokens(config.get("github_tokens")):
+                    if token not in self.gh_tokens:
+                        self.gh_tokens.append(token)
                 self.mongo = config.get("mongo")
                 self.db_refresh_hours = config.get("db_refresh_hours")
                 self.logger.debug(f"Loaded configuration from {self.config}")
@@ -183,51 +434,76 @@ class DepScanner:
     
     def get_org_repositories_online(self, organisation: str) -> list:
         """Get the repositories in github for a given organisation"""
-        # If we don't have any repository in the
-        # We set the maximum number of repositories to pull
-        repos = []
-        url = f"https://api.github.com/orgs/{organisation}/repos?per_page=100"
-        response = requests.get(
-            url,
-            headers=self.headers,
-            proxies=self.proxies,
-            verify=False,
-            timeout=self.request_timeout,
-        )
-        if response.status_code == 200:
-            # Insert data into Mongo
-            self.mongomgr.save_company_repos(json.loads(response.text))
-            repos = response.json()
-            # Save the number of repositories of the organisation
-            self.mongomgr.save_or_update_explored_org(name=organisation, number_repos=len(repos))
-        elif response.status_code == 404:
-            self.mongomgr.save_or_update_explored_org(name=organisation, number_repos=0)
-        else:
-            self.logger.error(
-                f"Error getting repositories for {organisation}: {response.text}"
-            )
-
+        return self._save_org_repositories(organisation, self.org_enumerator.get_repositories(organisation))
+
+    def _save_org_repositories(self, organisation: str, repos: list) -> list:
+        """Store the repositories enumerated for an organisation. None means the enumeration failed and nothing is stored"""
+        if repos is None:
+            return []
+        # Insert data into Mongo
+        self.mongomgr.save_company_repos(repos)
+        # Save the number of repositories of the organisation (0 if it doesn't exist)
+        self.mongomgr.save_or_update_explored_org(name=organisation, number_repos=len(repos))
         return repos
 
+    def _load_dependency_package(self, dependency: Dependency) -> Package:
+        """Load from the database the package object linked to a dependency, without its registry metadata"""
+        return Package.from_dict(self.mongomgr.get_package_summary(dependency.package_id))
+
     def search_registries(self, dependency: Dependency) -> Dependency:
         """Search for a package in the public registries"""
         # Check if this is an URL
         # if so, search by url
         # The only case where URls are specified in the requirements is ruby
         # for Go, the url can also be found in pkg.go.dev by looking for the url deplib_url = f"https://pkg.go.dev/{url}"
-        package = Package.from_dict(list(self.mongomgr.get_packages(_id=dependency.package_id))[0])
+        package = self._load_dependency_package(dependency)
 
-        # Logic to see if the package.url is not None, if it is, we search it by name
-        if package.url is not None and len(package.url) > 0:
-            package = self.search_registries_by_url(package)
+        # The URLs given in the dependency file are searched as they are, the rest of the packages are searched by name
+        if not self._is_searched_by_name(package):
+            self._resolve_cached(package, self._get_resolution_key(package), self.search_registries_by_url)
         elif package.name is not None and len(package.name) > 0:
-            package = self.search_package_in_registries(package)
+            self._resolve_cached(package, self._get_resolution_key(package), self.search_package_in_registries)
         
         # Save dependency info after updating the package info we just retrieved
         dependency.package = package
         return dependency
 
-    @lru_cache
+    # Fields of the package filled by the registry lookup and shared through the resolution cache.
+    # The metadata is left out to keep the cache small, it's stored in the database by the lookup that got it
+    RESOLUTION_FIELDS = ("registry", "response_code", "present", "scope", "scope_response_code", "scope_present")
+
+    def _get_resolution_key(self, package: Package) -> tuple:
+        """
+        Key of the package in the resolution cache: the registry and the normalized name, or the URL if it's searched by URL.
+        The packages with their registry URL are searched by name, so they share the key of the name whatever the URL they were stored with.
+        """
+        if not self._is_searched_by_name(package):
+            package_url, package_netloc = self._get_package_request_url(package)
+            return (package_netloc, package_url)
+        return ResolutionCache.get_key(package.registry, package.name)
+
+    def _get_resolution(self, package: Package) -> dict:
+        return {field: getattr(package, field) for field in self.RESOLUTION_FIELDS}
+
+    def _apply_resolution(self, package: Package, resolution: dict):
+        for field, value in resolution.items():
+            setattr(package, field, value)
+
+    @staticmethod
+    def _is_resolution_cacheable(resolution: dict) -> bool:
+        """Only conclusive answers of the registries are cached, not the failures or rate limits"""
+        return resolution["response_code"] not in (None, 403, 429)
+
+    def _resolve_cached(self, package: Package, key: tuple, search) -> Package:
+        """Search the package with search(package) unless the key was resolved recently or is being resolved by another thread"""
+        resolution = self.resolution_cache.get_or_compute(
+            key,
+            lambda: self._get_resolution(search(package)),
+            cacheable=self._is_resolution_cacheable,
+        )
+        self._apply_resolution(package, resolution)
+        return package
+
     def _get_package_scope(self, package: Package) -> str:
         """This method parses the name of a package if it's in npmjs.org and returns the scope name if it has one"""
         scope = None
@@ -236,31 +512,51 @@ class DepScanner:
             scope = package.name.split("/")[0].replace("@", "")
         return scope
     
-    # If the package is JavaScript or TypeScript and the registry is npmjs.org, we need to see if it's a scoped package
-    # Scoped packages are the ones starting with @scop/packagename. In this case, we need to search for the package in the registry
-    # https://registry.npmjs.org/-/org/fmtorre/package
-    @lru_cache
-    def _search_scope_in_npm(self, package: Package) -> tuple:
-        """Search for a scope/organisation name in nmp registry"""
-        
-        if (package.scope is not None and len(package.scope)>0):
-            # This API call is made when nmp cli issues this command:
-            # npm access list packages @scope
-            scope_response = requests.head(
-                f"https://registry.npmjs.org/-/org/{package.scope}/package",
-                proxies=self.proxies,
-                verify=False,
-                allow_redirects=True,
-                timeout=self.request_timeout,
-            )
-            return scope_response.status_code
+    def _apply_scope_result(self, package_object: Package, scope: Scope):
+        """Fill the scope information of a package with the scope resolved in memory, in the database or online"""
+        package_object.scope_response_code = scope.response_code
+        package_object.scope_present = (scope.response_code == 200)
+
+    def _get_registry_request_headers(self) -> dict:
+        """Headers sent to the registries when requesting package information"""
+        return {
+            "Accept": "application/vnd.npm.install-v1+json; q=1.0, application/json; q=0.8, */*"
+        }
+
+    def _apply_registry_response(self, package_object: Package, package_netloc: str, status_code: int):
+        """Fill up the package object information with the response of its registry"""
+        # Default values for response codes
+        package_object.present = False
+        package_object.registry = package_netloc
+        # Update values of the package dependent on the returned status code
+        package_object.response_code = status_code
+        package_object.present = (package_object.response_code == 200)
+        # Deal with npmjs scopes:
+        # TODO: Refactors this. I shall remove the scope information from the package object and just link to the scope ObjectID 
+        # to reduce redundancy
+        package_object.scope = self._get_package_scope(package_object)
+
+    def _apply_registry_metadata(self, package_object: Package, content_type: str, text: str):
+        """Store the registry response as the package metadata"""
+        # Check if the URL is returning JSON and store the response as metadata
+        # Generalising the content-type to 'json', as npmjs returns this weird content-type 'application/vnd.npm.install-v1+json'
+        if 'json' in content_type:
+            package_object.metadata = json.loads(text)
         else:
-            return 0
+            package_object.metadata = text
+
+    def _get_package_request_url(self, package_object: Package) -> tuple:
+        """Returns the URL of the package with the schema prepended if not found and its netloc"""
+        package_url = package_object.url
+        if "://" not in package_url:
+            package_url = "https://" + package_url
+        return package_url, urlparse(package_url).netloc
 
-    def search_registries_by_url(self, package_object: Package) -> Package:
+    def search_registries_by_url(self, package_object: Package, probe: bool = False) -> Package:
         """
         Search for a package in the public repositories by its URL
         If the package dictionary already contains a valid 'url' key, it will use that URL to search for the package
+        In probe mode, the cheapest endpoint of the registry is used to know if the package exists, and the full document is only downloaded to enrich the packages found when configured.
         """
 
         # package_database = list(self.mongomgr.get_packages(package_name=package_object.name,language=package_object.language))
@@ -273,62 +569,40 @@ class DepScanner:
         repos_wall_hit_times = 0
         request_error_count = 0
         # Prepend the schema if not found in the url
-        package_url = package_object.url
-        if "://" not in package_url:
-            package_url = "https://" + package_url
-        package_netloc = urlparse(package_url).netloc
+        package_url, package_netloc = self._get_package_request_url(package_object)
+        method, request_url, request_headers = self._get_registry_request(package_object, probe=probe)
 
         while not success_search_pubrepo and repos_wall_hit_times<MAX_RETRIES and request_error_count<MAX_REQUEST_RETRIES:
             try:
                 # Get the information from the registry URL
-                headers = {
-                    "Accept": "application/vnd.npm.install-v1+json; q=1.0, application/json; q=0.8, */*"
-                }
-                response = requests.get(
-                    package_url,
-                    proxies=self.proxies,
-                    verify=False,
+                response = self.http.request(
+                    method,
+                    request_url,
                     allow_redirects=True,
-                    headers=headers,
-                    timeout=self.request_timeout,
+                    headers=request_headers,
                 )
             except requests.exceptions.RequestException as re:
                 self.logger.error(f"Exception when contacting the HTTP server: {re}")
                 request_error_count+=1
                 break
 
+            # The registry doesn't answer to the probe, ask for the full document instead
+            if response.status_code == 405 and method != "GET":
+                method, request_url, request_headers = self._get_registry_request(package_object, probe=False)
+                probe = False
+                continue
+
             # Now, fill up the package object information
             try:
-                # Default values for response codes
-                package_object.present = False
-                package_object.registry = package_netloc
-                # Update values of the package dependent on the returned status code
-                package_object.response_code = response.status_code
-                package_object.present = (package_object.response_code == 200)
-                
-                # Deal with npmjs scopes:
-                # TODO: Refactors this. I shall remove the scope information from the package object and just link to the scope ObjectID 
-                # to reduce redundancy
-                package_object.scope = self._get_package_scope(package_object)
+                self._apply_registry_response(
+                    package_object,
+                    package_netloc=package_netloc,
+                    status_code=self._get_probe_status_code(response.status_code),
+                )
                 # If the package has a scope
                 if (package_object.scope is not None and len(package_object.scope)>0):
-                    scopes=list(self.mongomgr.get_scopes(name=package_object.scope))
-                    # The scope was not in our DB, so ask online
-                    package_object.scope_response_code = self._search_scope_in_npm(package_object)
-                    if  (len(scopes)==0):
-                        self.mongomgr.update_scope(
-                            Scope(
-                                name=package_object.scope,
-                                response_code=package_object.scope_response_code,
-                                present=(package_object.scope_response_code==200)
-                            )
-                        )
-                    else:
-                        if (len(scopes)>1):
-                            self.logger.warning(f"More than one scope in the db with name {package_object.scope}. Investigate.")
-                        scope=Scope.from_dict(scopes[0])
-                        package_object.scope_response_code = scope.response_code
-                        package_object.scope_present = (package_object.scope_response_code == scope.response_code)
+                    # Ask npm only if the scope is not known in memory nor in the DB
+                    self._apply_scope_result(package_object, self.scope_resolver.resolve(package_object.scope))
 
                 # Check if we have to backoff for a while as we received a forbidden or rate limit response
                 if package_object.response_code  in [429, 403]:
@@ -340,12 +614,10 @@ class DepScanner:
                     self._backoff(repos_wall_hit_times)
                 else: #if package_object.response_code == 200:
                     success_search_pubrepo = True
-                    # Check if the URL is returning JSON and store the response as metadata
-                    # Generalising the content-type to 'json', as npmjs returns this weird content-type 'application/vnd.npm.install-v1+json'
-                    if 'json' in response.headers['Content-Type']:
-                        package_object.metadata = json.loads(response.text)
-                    else:
-                        package_object.metadata = response.text
+                    if not probe:
+                        self._apply_registry_metadata(package_object, content_type=response.headers.get('Content-Type', ''), text=response.text)
+                    elif package_object.present and self.registry_probe.get("enrich_present", False):
+                        self._enrich_package(package_object)
 
             except json.JSONDecodeError as je:
                 self.logger.error(f"Error decoding the JSON response of {package_url}. Did we store the correct API endpoint?: {je}")
@@ -361,55 +633,154 @@ class DepScanner:
         
         return package_object
 
-    # Use a cache of packages, so it does not go out online if we recently resolved the package localy
-    @lru_cache(maxsize=128)
-    def search_package_in_registries(self, package: Package) -> Package:
+    # Cheapest endpoints of the registries answering whether a package exists
+    PYPI_SIMPLE_URL = "https://pypi.org/simple/{name}/"
+    GO_PROXY_LIST_URL = "https://proxy.golang.org/{module}/@v/list"
+
+    @staticmethod
+    def _escape_go_module(module: str) -> str:
+        """Case-encode a module path for the Go module proxy: uppercase letters are replaced by '!' and the lowercase letter"""
+        return re.sub(r"[A-Z]", lambda m: "!" + m.group(0).lower(), module)
+
+    def _get_registry_request(self, package_object: Package, probe: bool) -> tuple:
         """
-        Search for a package in the public repositories by its name.
-        This function will build an URL based on the language and the package name.
-        Returns a tuple with the package object, and two HTTP response codes for the package itself and the scope for npmjs packages.
-        The function uses an lru_cache for previously searched packages.
-        This should speed up the search and prevent HTTP communications.
+        Request sent to the registry to search for a package: method, URL and headers.
+        Without probe, the full document of the package URL. With probe, the cheapest request telling if the package exists:
+         - PyPI: HEAD of the simple index (PEP 691 JSON flavour)
+         - npm: HEAD of the abbreviated packument
+         - rubygems: HEAD of the gem API document
+         - Go: list of versions in the module proxy
         """
+        package_url, _ = self._get_package_request_url(package_object)
+        if probe:
+            if package_object.language == "Python":
+                return "HEAD", self.PYPI_SIMPLE_URL.format(name=ResolutionCache.normalize_name("pypi.org", package_object.name)), {
+                    "Accept": "application/vnd.pypi.simple.v1+json"
+                }
+            elif package_object.language in ("JavaScript", "TypeScript", "Ruby"):
+                return "HEAD", package_url, self._get_registry_request_headers()
+            elif package_object.language == "Go":
+                return "GET", self.GO_PROXY_LIST_URL.format(module=self._escape_go_module(package_object.name)), {}
+        return "GET", package_url, self._get_registry_request_headers()
+
+    @staticmethod
+    def _get_probe_status_code(status_code: int) -> int:
+        """The Go module proxy answers 410 Gone for the modules that don't exist"""
+        return 404 if status_code == 410 else status_code
+
+    def _enrich_package(self, package_object: Package):
+        """Download the full registry document of a package found with a probe and store it as metadata"""
+        package_url, _ = self._get_package_request_url(package_object)
+        try:
+            response = self.http.get(package_url, allow_redirects=True, headers=self._get_registry_request_headers())
+            if response.status_code == 200:
+                self._apply_registry_metadata(package_object, content_type=response.headers.get('Content-Type', ''), text=response.text)
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            self.logger.debug(f"Error downloading the metadata of {package_url}: {e}")
+
+    @staticmethod
+    def _get_registry_url(package: Package) -> str:
+        """Build the registry URL of a package based on its language. Returns None if the language has no known registry"""
         if package.language == "Python":
-            package.url = f"https://pypi.org/pypi/{package.name}/json"
+            return f"https://pypi.org/pypi/{package.name}/json"
         elif package.language == "JavaScript" or package.language == "TypeScript":
-            package.url = f"https://registry.npmjs.org/{package.name}"
+            return f"https://registry.npmjs.org/{package.name}"
         elif package.language == "Ruby":
-            package.url = f"https://rubygems.org/api/v1/gems/{package.name}.json"
+            return f"https://rubygems.org/api/v1/gems/{package.name}.json"
         elif package.language == "Go":
             # AFAIK, there is no API to retrieve JSON data from go.dev
-            package.url = f"https://pkg.go.dev/{package.name}"
-        else:
+            return f"https://pkg.go.dev/{package.name}"
+        return None
+
+    def _set_registry_url(self, package: Package) -> bool:
+        """Set the registry URL of a package based on its language. Returns False if the language has no known registry"""
+        registry_url = self._get_registry_url(package)
+        if registry_url is None:
             self.logger.error(f"Unknown registry for: {package.language}")
+            return False
+        package.url = registry_url
+        return True
+
+    def _is_searched_by_name(self, package: Package) -> bool:
+        """
+        Tell if a package has to be searched by name, with the name index and the probe, instead of by URL.
+        Only the URLs given in the dependency files (git repositories, tarballs, private registries...) are searched by URL,
+        unless they point to the registry URL of the package, so every package of the public registries is checked in the name index first.
+        The registry URL stored by a previous lookup is the one _set_registry_url builds from the name, so it's searched by name again.
+        """
+        if package.url is None or len(package.url) == 0:
+            return True
+        registry_url = self._get_registry_url(package)
+        return registry_url is not None and self._normalize_package_url(package.url) == self._normalize_package_url(registry_url)
+
+    @staticmethod
+    def _normalize_package_url(url: str) -> str:
+        """
+        Host and path of a package URL, to compare the URLs of the dependency files with the registry ones.
+        e.g. a gem of "source 'http://RubyGems.org/'" gets 'http://RubyGems.org//api/v1/gems/rails.json', which is 'rubygems.org/api/v1/gems/rails.json'
+        """
+        parsed = urlparse(url if "://" in url else "https://" + url)
+        return parsed.netloc.lower() + re.sub(r"/+", "/", parsed.path)
+
+    def search_package_in_registries(self, package: Package) -> Package:
+        """
+        Search for a package in the public repositories by its name.
+        This function will build an URL based on the language and the package name.
+        Returns the package object with the HTTP response codes for the package itself and the scope for npmjs packages.
+        The lookups are shared through the resolution cache by search_registries.
+        """
+        if not self._set_registry_url(package):
+            return package
+
+        # No need to ask the registry for the packages we know are published
+        if self._found_in_name_index(package):
             return package
 
         # Now we search for the url that we built
-        return self.search_registries_by_url(package)
+        return self.search_registries_by_url(package, probe=self.registry_probe.get("enabled", True))
 
-    def _backoff(self, wall_hit_times: int):
+    def _found_in_name_index(self, package: Package) -> bool:
+        """
+        Check the package in the offline name index of its registry, and mark it as present if it's there.
+        The packages not in the index (or without index) have to be searched online: they may have been published after the index was built.
+        """
+        name_index = self.name_indexes.get(package.registry)
+        if name_index is None or package.name not in name_index:
+            return False
+        self._apply_registry_response(package, package_netloc=package.registry, status_code=200)
+        with self._progress_lock:
+            self.name_index_hits += 1
+        return True
+
+    def _backoff(self, wall_hit_times: int, url: str = None):
         """Sleep for an increasing amount of time to avoid hitting the rate limit"""
-        t = self.backoffbase * wall_hit_times
-        self.logger.info(f"😴 Sleeping for {t} seconds")
+        if url is not None and self.rate_limiter.is_blocked(url):
+            # GitHub told us when to retry, the rate limiter will hold the next request until then
+            return
+        t = self.backoffbase * wall_hit_times + random.uniform(0, self.jitter or 0)
+        self.logger.info(f"😴 Sleeping for {t:.0f} seconds")
         time.sleep(t)
 
     def is_user_authenticated(self):
-        """Check if the user is authenticated against the GitHub API"""
-        response = requests.get(
-            "https://api.github.com/user",
-            headers=self.headers,
-            proxies=self.proxies,
-            verify=False,
-            timeout=self.request_timeout,
-        )
-        if "login" in response.json().keys() and "id" in response.json().keys():
-            self.logger.debug(f"Authenticated as {response.json()['login']}")
-            return True
-        else:
-            self.logger.error(
-                f"Error authenticating user against github API: {response.text}"
+        """
+        Check if the user is authenticated against the GitHub API.
+        With several tokens, each one is checked and the rejected ones are taken out of the rotation.
+        """
+        authenticated = False
+        for token in self.gh_tokens or [None]:
+            response = self.http.get(
+                "https://api.github.com/user",
+                headers=self.headers,
+                token=token,
             )
-            return False
+            if "login" in response.json().keys() and "id" in response.json().keys():
+                self.logger.debug(f"Authenticated as {response.json()['login']} ({RateLimiter.mask(token)})")
+                authenticated = True
+            else:
+                self.logger.error(
+                    f"Error authenticating user against github API ({RateLimiter.mask(token)}): {response.text}"
+                )
+        return authenticated
 
     def _build_log_message(
         self,
@@ -529,6 +900,8 @@ class DepScanner:
         )
         # Send discord message if there is a good outcome (good for the hacker, of course)
         if outcome == SearchOutcome.GOOD:
+            with self._progress_lock:
+                self.findings += 1
             discord_msg = self._build_discord_message(
                 package_name=package.name,
                 package_url=package.url,
@@ -541,30 +914,24 @@ class DepScanner:
             )
             self.bell.ping(msg=discord_msg)
 
-    def search_dependencies_in_registries(
-        self,
-        dependencies_to_search: list,
-        repo_stars: int
-    ):
+    def _search_dependencies(self, dependencies_to_search: list) -> list:
         """
-        Search for packages of the GitHub repository in the public registries
-        It will do a parallel search of the packages names using the ThreadPoolExecutor to speed up the search
+        Search for packages of the GitHub repository in the public registries and return the dependencies with their package updated
+        It will do a parallel search of the packages names using the asyncio resolver, or the scan-wide worker pool in the "threads" resolver mode
         """
+        results = []
         try:
-            with ThreadPoolExecutor(max_workers=len(dependencies_to_search)) as executor:
-                futures = [
-                    # Create a Package object for each call
-                    executor.submit(
-                        self.search_registries,
-                        dependency,
-                    )
-                    for dependency in dependencies_to_search
-                ]
-                # Change from set() to list() since dictionaries are not hashable
-                results = [future.result() for future in futures]
+            if self.resolver is not None:
+                results = self.resolver.resolve(dependencies_to_search)
+            else:
+                # A failed search is logged and skipped, the rest of the results are kept
+                results = self.pool.run_all(self.search_registries, dependencies_to_search)
         except Exception as e:
             self.logger.exception(f"Error searching for one of the dependencies: {dependencies_to_search}. Moving on.")
+        return results
 
+    def _persist_search_results(self, results: list, repo_stars: int):
+        """Report and save in the database the results of the registries search"""
         # The scope_response_code is used to check if the scope exists in the npm registry, but not of the other package registries
         # If the scope exists, it's not hijackable
         for returned_dependency in results:
@@ -582,6 +949,15 @@ class DepScanner:
             # Create the relation between the package and the repository
             self.mongomgr.update_repository_dependency(returned_dependency)
 
+    def search_dependencies_in_registries(
+        self,
+        dependencies_to_search: list,
+        repo_stars: int
+    ):
+        """Search for packages of the GitHub repository in the public registries, then report and save the results"""
+        results = self._search_dependencies(dependencies_to_search)
+        self._persist_search_results(results, repo_stars=repo_stars)
+
     def _is_date_fresh(self, updated: datetime) -> bool:
         d = datetime.now()-updated
         return ((d.seconds)<(self.db_refresh_hours*3600)) 
@@ -601,12 +977,9 @@ class DepScanner:
 
         repository={}
         url = f"https://api.github.com/repos/{repo_name}"
-        response = requests.get(
+        response = self.http.get(
             url,
             headers=self.headers,
-            proxies=self.proxies,
-            verify=False,
-            timeout=self.request_timeout,
         )
         if response.status_code == 200:
             self.mongomgr.save_single_repository(json.loads(response.text))
@@ -621,52 +994,177 @@ class DepScanner:
     def _retrieve_dependencies_from_files(self, repo_name: str, repo_language: str):
         """Search for dependency files in the repository from GitHub API"""
 
-        success_searching = False
-        github_wall_hit_times=0
+        MAX_RETRIES=5
         dependencies = []
-        while not success_searching:
-            self.logger.info(
-                f"Searching for dependencies of {repo_name} ({github_wall_hit_times} times attempted)"
-            )
+        self.logger.info(
+            f"Searching for dependencies of {repo_name}"
+        )
 
-            # query for each dependency file
-            # Using GitHub search API: https://api.github.com/search/code?q=filename:package.json+repo:org/repo
-            # Note: This requires authentication for better rate limits
+        # query for each dependency file
+        # Using GitHub search API: https://api.github.com/search/code?q=filename:package.json+repo:org/repo
+        # Note: This requires authentication for better rate limits
 
-            # Search for requirement files that match the language this project is written with
-            gb_target_repo = self.lang_repos[repo_language]
-            for dep_file_name in self.repos_depfiles[gb_target_repo]:
-                # for dep_file_name in set(PUB_REPOS.keys()):
-                self.logger.debug(
-                    f"Searching for {dep_file_name} in repository {repo_name}..."
-                )
-                endpoint = f"{self.api_base}/search/code?q=filename:{dep_file_name}+repo:{repo_name}"
-                response = requests.get(
+        # Search for requirement files that match the language this project is written with
+        gb_target_repo = self.lang_repos[repo_language]
+        for dep_file_name in self.repos_depfiles[gb_target_repo]:
+            # for dep_file_name in set(PUB_REPOS.keys()):
+            self.logger.debug(
+                f"Searching for {dep_file_name} in repository {repo_name}..."
+            )
+            endpoint = f"{self.api_base}/search/code?q=filename:{dep_file_name}+repo:{repo_name}"
+            github_wall_hit_times=0
+            while github_wall_hit_times<=MAX_RETRIES:
+                response = self.http.get(
                     endpoint,
                     headers=self.headers,
-                    proxies=self.proxies,
-                    verify=False,
-                    timeout=self.request_timeout,
                 )
 
                 # Check the status of the request
                 if response.status_code == 200:
                     dependencies += response.json()["items"]
-                    success_searching = True
+                    break
                 elif response.status_code == 403 or response.status_code == 429:
-                    self.logger.info(f"Rate limit exceeded searching the dependency {dep_file_name} of {repo_name}")
+                    self.logger.info(f"Rate limit exceeded searching the dependency {dep_file_name} of {repo_name} ({github_wall_hit_times} times attempted)")
                     # Throttle the requests
                     github_wall_hit_times += 1
-                    self._backoff(github_wall_hit_times)
+                    self._backoff(github_wall_hit_times, url=endpoint)
                 else:
+                    # Any other error won't go away by retrying
                     self.logger.error(
                         f"Error searching for {dep_file_name} of {repo_name}: {response.text} [{response.status_code}]"
                     )
+                    self._mark_incomplete(repo_name)
+                    break
+            else:
+                self.logger.error(f"Giving up searching for {dep_file_name} of {repo_name} after {github_wall_hit_times} attempts")
+                self._mark_incomplete(repo_name)
       
         return dependencies
+
+    def _mark_incomplete(self, repo_full_name: str):
+        """The dependency files of the repository could not all be listed or processed. It's not checkpointed nor marked as scanned"""
+        with self._progress_lock:
+            self._incomplete_repos.add(repo_full_name)
+
+    def _retrieve_dependencies_from_tree(self, gh_repo: dict):
+        """
+        List the files of the default branch of the repository with a single recursive call to the Git Trees API
+        and match the names of all the known dependency files locally.
+        Falls back to the code search API if the tree is too large to be returned in one response.
+        """
+        MAX_RETRIES=5
+        repo_name = gh_repo["full_name"]
+        branch = gh_repo.get("default_branch") or "HEAD"
+        endpoint = f"{self.api_base}/repos/{repo_name}/git/trees/{branch}?recursive=1"
+        self.logger.info(
+            f"Listing the files of {repo_name} ({branch})"
+        )
+
+        github_wall_hit_times=0
+        while github_wall_hit_times<=MAX_RETRIES:
+            response = self.http.get(
+                endpoint,
+                headers=self.headers,
+            )
+            if response.status_code == 200:
+                break
+            elif response.status_code == 403 or response.status_code == 429:
+                self.logger.info(f"Rate limit exceeded listing the files of {repo_name} ({github_wall_hit_times} times attempted)")
+                github_wall_hit_times += 1
+                self._backoff(github_wall_hit_times, url=endpoint)
+            elif response.status_code == 409:
+                # The repository is empty, there is nothing to scan
+                self.logger.info(f"The repository {repo_name} is empty")
+                return []
+            else:
+                self.logger.error(
+                    f"Error listing the files of {repo_name}: {response.text} [{response.status_code}]"
+                )
+                self._mark_incomplete(repo_name)
+                return []
+        else:
+            self.logger.error(f"Giving up listing the files of {repo_name} after {github_wall_hit_times} attempts")
+            self._mark_incomplete(repo_name)
+            return []
+
+        tree = response.json()
+        # Identifies the content of the default branch, for the incremental mode
+        with self._progress_lock:
+            self._repo_trees[repo_name] = tree.get("sha")
+        if tree.get("truncated"):
+            self.logger.warning(f"The file tree of {repo_name} is too large and was truncated. Using the code search API instead.")
+            if gh_repo["language"] in self.lang_repos.keys():
+                return self._retrieve_dependencies_from_files(repo_name=repo_name, repo_language=gh_repo["language"])
+            return []
+
+        # Build items with the same shape as the ones returned by the code search API
+        dependencies = []
+        for entry in tree.get("tree", []):
+            if entry.get("type") != "blob":
+                continue
+            dep_file_name = entry["path"].rsplit("/", 1)[-1]
+            if dep_file_name in self.pub_repos.keys():
+                dependencies.append(
+                    {
+                        "name": dep_file_name,
+                        "path": entry["path"],
+                        "sha": entry["sha"],
+                        # The Git Blobs API returns the base64 content like the contents API
+                        "url": entry["url"],
+                        "repository": {"full_name": repo_name},
+                    }
+                )
+        return dependencies
+
+    def _get_registry_language(self, registry_name: str, repo_language: str) -> str:
+        """Language used to build the registry URL of a package. Depfiles can be found in repositories written in another language"""
+        if self.lang_repos.get(repo_language) == registry_name:
+            return repo_language
+        for language, registry in self.lang_repos.items():
+            if registry == registry_name:
+                return language
+        return repo_language
     
+    def _report_local_finding(self, package: Package, dependency: Dependency, repo_stars: int):
+        """Report a package already known to be missing from its registry without searching online again"""
+        if not package.present and package.response_code is not None:
+            # If the package has a scope, check if it's not present:
+            if package.scope is None or (package.scope is not None and package.scope_response_code==404):
+                # Report it in the log and discord
+                log_msg = self._build_log_message(
+                    outcome=SearchOutcome.GOOD,
+                    package_name=package.name,
+                    dependency_semver=dependency.semver,
+                    gh_repo=dependency.repo_name,
+                    depfile_path=dependency.dependency_file,
+                    package_url=package.url,
+                    response_code=package.response_code,
+                    scope_response_code=package.scope_response_code,
+                    local=True
+                )
+                self.logger.info(log_msg)
+                with self._progress_lock:
+                    self.findings += 1
+                # Now discord message
+                discord_msg = self._build_discord_message(
+                    package_name=package.name,
+                    dependency_semver=dependency.semver,
+                    package_url=package.url,
+                    gh_repo=dependency.repo_name,
+                    repo_stars=repo_stars,
+                    response_code=package.response_code,
+                    scope_response_code=package.scope_response_code,
+                    depfile_path=dependency.dependency_file,
+                    local=True
+                )
+                self.bell.ping(discord_msg)
+
     def _populate_dependencies(self, gh_repo: dict, dep: dict, required_packages: list) -> list:
-        """This function populates an array with the dependencies we need to analyse"""
+        """
+        This function populates an array with the dependencies we need to analyse.
+        All the packages of the dependency file are resolved against the database in batch:
+        one query for the known packages, one bulk write for the new ones, one query for the existing dependency links and one bulk write for the new links.
+        """
         
         # Initialize the depencendies list
         dependencies=[]
@@ -681,55 +1179,70 @@ class DepScanner:
         repo_full_name = gh_repo["full_name"]
         repo_stars = gh_repo["stargazers_count"]
 
+        if dep_file_name not in self.pub_repos.keys():
+            self.logger.error(
+                f"Dependency file {dep_file_name} not found in the recogniced dependency files. Skipping."
+            )
+            return dependencies
+
+        registry_name = self.pub_repos[dep_file_name]
+
+        # Discard the required packages without a valid name
+        valid_required_packages = []
         for required_package in required_packages:
-            if dep_file_name not in self.pub_repos.keys():
+            if required_package.name is not None and len(required_package.name) > 0:
+                valid_required_packages.append(required_package)
+            else:
                 self.logger.error(
-                    f"Dependency file {dep_file_name} not found in the recogniced dependency files. Skipping."
+                    f"There was an error with the name of required package: '{required_package.name}'"
                 )
+        required_names = set(rp.name for rp in valid_required_packages)
+        if len(required_names) == 0:
+            return dependencies
+
+        # Retrieve in one query the packages of this file we have already explored. Leave the registry metadata out, we don't need it here
+        packages_in_db = {}
+        for package_doc in self.mongomgr.get_package_summaries_by_names(names=required_names, registry=registry_name):
+            if package_doc["name"] in packages_in_db:
+                self.logger.warning(f"Warning: More than one document in the database with package name {package_doc['name']} in the registry {registry_name}. Investigate.")
                 continue
+            packages_in_db[package_doc["name"]] = Package.from_dict(package_doc)
 
-            registry_name = self.pub_repos[dep_file_name]
-
-            # Retrieve all packages we have already explored (no filter in the query)
-            repo_packages_in_db = self.mongomgr.get_packages(
-                registry=registry_name
-            )
-            repo_package_in_db_names = set()
-            for ep in repo_packages_in_db:
-                repo_package_in_db_names.add(ep["name"])
-
-            # If the required package is already in the database
-            if required_package.name in repo_package_in_db_names:
-                self.logger.debug(
-                    f"[{Colors.gray('i')}] Package {required_package.name} is already in the database. Creating the dependency only."
-                )
-                
-                packages = list(self.mongomgr.get_packages(package_name=required_package.name,registry=registry_name))
-                if (len(packages)>1):
-                    self.logger.warning(f"Warning: More than one document in the database with package name {required_package.name} in the registry {registry_name}. Investigate.")
-                
-                package_obj=Package.from_dict(packages[0])
-            # If the package name is not in our local database
-            elif (
-                required_package.name is not None
-                and len(required_package.name) > 0
-            ):
-                
-                # Create empty package and save it in the database
-                package_obj = Package(
+        # Create empty packages for the ones not in our local database and save them all in one bulk write
+        new_packages = {}
+        for required_package in valid_required_packages:
+            if required_package.name not in packages_in_db and required_package.name not in new_packages:
+                new_packages[required_package.name] = Package(
                     name=required_package.name,
                     registry=registry_name,
-                    language=repo_language,
+                    language=self._get_registry_language(registry_name, repo_language),
                     url = required_package.url
-                ) 
-                
-                # Once the package object is created, either from the database or dummy (as it's not in the DB)
-                self.mongomgr.save_package(package_obj)
-            else:
-                self.logger.error(
-                    f"There was an error with the name of required package: '{required_package.name}'"
                 )
-            
+        if len(new_packages) > 0:
+            inserted = self.mongomgr.save_packages(list(new_packages.values()))
+            packages_in_db.update({p.name: p for p in inserted})
+            # Another thread inserted the rest of the packages first, so use the documents from the database
+            raced_names = set(new_packages.keys()) - set(p.name for p in inserted)
+            if len(raced_names) > 0:
+                for package_doc in self.mongomgr.get_package_summaries_by_names(names=raced_names, registry=registry_name):
+                    packages_in_db[package_doc["name"]] = Package.from_dict(package_doc)
+
+        # Retrieve in one query the packages already linked to this repository
+        linked_package_ids = set(
+            d["package_id"] for d in self.mongomgr.get_dependencies_by_packages(
+                repo_id=repo_id,
+                package_ids=[p._id for p in packages_in_db.values()],
+                projection={"package_id": 1}
+            )
+        )
+
+        new_dependencies = []
+        for required_package in valid_required_packages:
+            package_obj = packages_in_db.get(required_package.name)
+            if package_obj is None:
+                self.logger.error(f"Package {required_package.name} could not be saved in the database. Skipping.")
+                continue
+
             # We create a dependency object and save it in the database, then we update the package info in the database
             dependency = Dependency(
                 repo_id=repo_id,
@@ -741,10 +1254,10 @@ class DepScanner:
             )
             
             # Check if the dependency link already exists
-            existent_dependencies = list(self.mongomgr.get_dependencies(repo_id=repo_id,package_id=package_obj._id))
-            if (len(existent_dependencies)==0):
+            if package_obj._id not in linked_package_ids:
                 # Save the dependency with dummy package record
-                self.mongomgr.save_repository_dependency(dependency=dependency) 
+                new_dependencies.append(dependency)
+                linked_package_ids.add(package_obj._id)
                 # The dependency was not in the database, so store it for later online search
                 dependencies.append(dependency)
             else:
@@ -758,116 +1271,250 @@ class DepScanner:
                     dependencies.append(dependency)   
                 else:
                     # No need to search/refresh this dependency, but if the package was a 404, it should reported anyway
-                    package=Package.from_dict(self.mongomgr.get_packages(_id=dependency.package_id)[0])
-                    if not package.present and package.response_code is not None:
-                        # If the package has a scope, check if it's not present:
-                        if package.scope is None or (package.scope is not None and package.scope_response_code==404):
-                            # Report it in the log and discord
-                            log_msg = self._build_log_message(
-                                outcome=SearchOutcome.GOOD,
-                                package_name=package.name,
-                                dependency_semver=dependency.semver,
-                                gh_repo=repo_full_name,
-                                depfile_path=dependency.dependency_file,
-                                package_url=package.url,
-                                response_code=package.response_code,
-                                scope_response_code=package.scope_response_code,
-                                local=True
-                            )
-                            self.logger.info(log_msg)
-                            # Now discord message
-                            discord_msg = self._build_discord_message(
-                                package_name=package.name,
-                                dependency_semver=dependency.semver,
-                                package_url=package.url,
-                                gh_repo=repo_full_name,
-                                repo_stars=repo_stars,
-                                response_code=package.response_code,
-                                scope_response_code=package.scope_response_code,
-                                depfile_path=dependency.dependency_file,
-                                local=True
-                            )
-                            self.bell.ping(discord_msg)
+                    self._report_local_finding(package=package_obj, dependency=dependency, repo_stars=repo_stars)
+
+        # Save all the new dependency links in one bulk write
+        self.mongomgr.save_repository_dependencies(new_dependencies)
 
         return dependencies
 
-    def scan_repositories(self):
-        """Scan a list of repository names provided by the user"""
-        github_wall_hit_times = 0
-        # valid_languages = set([pb for pb in self.lang_repos.keys()])
-        current_iteration_existing_packages = []
-        not_found_packages = []
-        repo_count = 0
+    def _stage_discover(self, gh_repo: dict) -> list:
+        """Pipeline stage: search the dependency files of a repository in GitHub"""
+        repo_language = gh_repo["language"]
+        # Get the repository path
+        repo_full_name = gh_repo["full_name"]
+        repo_stars = gh_repo["stargazers_count"]
+        # Make the stars easily readable from 1 to 5
+        with self._progress_lock:
+            self._repo_count += 1
+            repo_count = self._repo_count
+        header_msg = f"* 👀 Repository #{repo_count}/{len(self.repos_to_explore)}: {repo_full_name} - {get_stars_score(repo_stars=repo_stars)} [{repo_stars}] (Lang: {repo_language}) 👀 *"
+        self.logger.info("*" * len(header_msg))
+        self.logger.info(header_msg)
+        self.logger.info("*" * len(header_msg))
+
+        # Skip repos not written in the languages we cover here. Listing the whole tree finds the dependency files of any language
+        if self.depfile_discovery != "trees" and repo_language not in self.lang_repos.keys():
+            self.logger.info(
+                f"⏭️ 👅 Skipping analysis of repository {repo_full_name} because it is not any of {', '.join(self.lang_repos.keys())}"
+            )
+            return []
 
-        for gh_repo in self.repos_to_explore:
-            self.current_repo_index += 1
-            repo_id = gh_repo["id"]
-            repo_language = gh_repo["language"]
-            # Get the repository path
-            repo_full_name = gh_repo["full_name"]
-            repo_stars = gh_repo["stargazers_count"]
-            # Make the stars easily readable from 1 to 5
-            repo_count += 1
-            header_msg = f"* 👀 Repository #{repo_count}/{len(self.repos_to_explore)}: {repo_full_name} - {get_stars_score(repo_stars=repo_stars)} [{repo_stars}] (Lang: {repo_language}) 👀 *"
-            self.logger.info("*" * len(header_msg))
-            self.logger.info(header_msg)
-            self.logger.info("*" * len(header_msg))
-
-            # Skip repos not written in the languages we cover here
-            if repo_language not in self.lang_repos.keys():
-                self.logger.info(
-                    f"⏭️ 👅 Skipping analysis of repository {repo_full_name} because it is not any of {', '.join(self.lang_repos.keys())}"
-                )
-                continue
+        if repo_stars < self.minimum_stars:
+            self.logger.info(
+                f"⏭️ ⭐ Skipping analysis of repository {repo_full_name} because it has less than {self.minimum_stars}"
+            )
+            return []
+
+        # Nothing was pushed since the last scan, report what we found then
+        if self._is_repository_unchanged(gh_repo):
+            self._report_known_findings(gh_repo)
+            return []
 
-            if repo_stars < self.minimum_stars:
-                self.logger.info(
-                    f"⏭️ ⭐ Skipping analysis of repository {repo_full_name} because it has less than {self.minimum_stars}"
+        # Search for dependencies in the files of the repository
+        try:
+            if self.depfile_discovery == "trees":
+                dependencies = self._retrieve_dependencies_from_tree(gh_repo)
+                # Pushes to other branches change pushed_at, but the default branch is the same
+                if self._is_repository_unchanged(gh_repo, tree_sha=self._repo_trees.get(repo_full_name)):
+                    self._report_known_findings(gh_repo)
+                    return []
+            else:
+                dependencies = self._retrieve_dependencies_from_files(
+                    repo_name=repo_full_name,
+                    repo_language=repo_language
                 )
-                continue
+                with self._progress_lock:
+                    self._repo_trees[repo_full_name] = None
+        except Exception:
+            # The pipeline reports the repository as done, it must not be taken as scanned
+            self._mark_incomplete(repo_full_name)
+            raise
+        
+        self.logger.debug(
+            f"Found {len(dependencies)} dependency files in {repo_full_name}: {', '.join(map(lambda x: x['path'], dependencies))}"
+        )
 
-            # Search for dependencies in the files of the repository
-            dependencies = self._retrieve_dependencies_from_files(
-                repo_name=repo_full_name,
-                repo_language=repo_language
-            )
-            
-            self.logger.debug(
-                f"Found {len(dependencies)} dependency files in {repo_full_name}: {', '.join(map(lambda x: x['path'], dependencies))}"
+        # Register how many dependency files of this repository are going through the pipeline before handing them over
+        if len(dependencies) > 0:
+            with self._progress_lock:
+                self._pending_depfiles[repo_full_name] = len(dependencies)
+        return [DepfileJob(gh_repo=gh_repo, item=dep_item) for dep_item in dependencies]
+
+    def _stage_fetch(self, jobs: list[DepfileJob]) -> list:
+        """
+        Pipeline stage: download a batch of dependency files, possibly from several repositories.
+        The files whose blob was already parsed in a previous scan are not downloaded.
+        """
+        for job, cached in zip(jobs, self.modparser.get_cached_dependencies([job.item for job in jobs])):
+            job.required_packages = cached
+        to_download = [job for job in jobs if job.required_packages is None]
+        if to_download:
+            contents = self.modparser.fetch_depfiles([job.item for job in to_download])
+            for job, content in zip(to_download, contents):
+                job.content = content
+        return [
+            [job] if job.required_packages is not None or job.content is not None else []
+            for job in jobs
+        ]
+
+    def _stage_parse(self, job: DepfileJob) -> list:
+        """Pipeline stage: parse the dependency file, unless its dependencies came from the cache"""
+        if job.required_packages is None:
+            job.required_packages = self.modparser.parse_depfile(job.item, job.content)
+            job.content = None
+        return [job]
+
+    def _stage_resolve(self, job: DepfileJob) -> list:
+        """Pipeline stage: link the packages to the repository and search the registries for the ones we need to analyse"""
+        # Populate a list of dependencies to search in parallel
+        dependencies_to_search = self._populate_dependencies(
+            gh_repo=job.gh_repo,
+            dep=job.item,
+            required_packages=job.required_packages
+            )  
+
+        # =================================== #
+        # = Parallel search of dependencies = #
+        # =================================== #
+        if (len(dependencies_to_search)>0):
+            if self.checkpoint is not None:
+                self.checkpoint.add_pending(job.gh_repo["id"], [d.package_id for d in dependencies_to_search])
+            job.results = self._search_dependencies(dependencies_to_search)
+            return [job]
+        self.logger.debug("All packages were already in our database. Not searching online for these. Only dependencies may have been updated in the database")
+        job.finished = True
+        return []
+
+    def _stage_persist(self, job: DepfileJob) -> list:
+        """Pipeline stage: report and save the results of the registries search"""
+        self._persist_search_results(job.results, repo_stars=job.gh_repo["stargazers_count"])
+        job.finished = True
+        return []
+
+    def _on_pipeline_item_done(self, stage_name: str, item):
+        """Mark the repository as completed once all its dependency files left the pipeline"""
+        with self._progress_lock:
+            if isinstance(item, DepfileJob):
+                gh_repo = item.gh_repo
+                repo_full_name = gh_repo["full_name"]
+                if not item.finished:
+                    self._incomplete_repos.add(repo_full_name)
+                self._pending_depfiles[repo_full_name] -= 1
+                if self._pending_depfiles[repo_full_name] > 0:
+                    return
+                del self._pending_depfiles[repo_full_name]
+            else:
+                # The repository had no dependency files, or it was skipped
+                gh_repo = item
+                repo_full_name = gh_repo["full_name"]
+            self.current_repo_index += 1
+            completed = repo_full_name not in self._incomplete_repos
+            self._incomplete_repos.discard(repo_full_name)
+            if not completed:
+                self._repo_trees.pop(repo_full_name, None)
+        # The next incremental scan skips this repository if nothing is pushed meanwhile
+        if completed:
+            self._save_repository_scan_state(gh_repo)
+            if self.checkpoint is not None:
+                self.checkpoint.complete_repository(gh_repo["id"], repo_full_name)
+
+    def _load_repository_scan_states(self):
+        """Load the state of the last scan of the repositories, for the incremental mode"""
+        self._scan_states = {}
+        if not self.incremental or self.force:
+            return
+        for repo in self.mongomgr.get_repository_scan_states():
+            self._scan_states[repo["full_name"].casefold()] = repo["last_scan"]
+        self.logger.info(f"🔁 Incremental scan: {len(self._scan_states)} repositories were scanned before")
+
+    def _is_repository_unchanged(self, gh_repo: dict, tree_sha: str = None) -> bool:
+        """
+        Whether the repository is the same as in its last scan, in incremental mode.
+        Without tree_sha the pushed_at date reported by GitHub is compared, otherwise the tree of the default branch.
+        """
+        last_scan = self._scan_states.get(gh_repo["full_name"].casefold())
+        if last_scan is None:
+            return False
+        if tree_sha is None:
+            unchanged = gh_repo.get("pushed_at") is not None and gh_repo.get("pushed_at") == last_scan.get("pushed_at")
+        else:
+            unchanged = tree_sha == last_scan.get("tree_sha")
+        if unchanged:
+            self.logger.info(f"⏭️ 🔁 Skipping analysis of repository {gh_repo['full_name']} because it didn't change since its last scan")
+            with self._progress_lock:
+                self.unchanged_repos += 1
+        return unchanged
+
+    def _save_repository_scan_state(self, gh_repo: dict):
+        """Store the state of a repository whose scan is completed. Repositories not listed (filtered or failed) are not stored"""
+        repo_full_name = gh_repo["full_name"]
+        with self._progress_lock:
+            if repo_full_name not in self._repo_trees:
+                return
+            tree_sha = self._repo_trees.pop(repo_full_name)
+        try:
+            self.mongomgr.save_repository_scan_state(repo_full_name, pushed_at=gh_repo.get("pushed_at"), tree_sha=tree_sha)
+        except Exception as e:
+            self.logger.error(f"Error saving the scan state of {repo_full_name}: {e}")
+
+    def _report_known_findings(self, gh_repo: dict):
+        """Report the missing packages found in a repository by previous scans, without searching anything"""
+        dependencies = {}
+        for dependency_doc in self.mongomgr.get_dependencies(repo_id=gh_repo["id"]):
+            dependencies.setdefault(dependency_doc["package_id"], []).append(Dependency.from_dict(dependency_doc))
+        if len(dependencies) == 0:
+            return
+        for package_doc in self.mongomgr.get_missing_package_summaries(list(dependencies.keys())):
+            package = Package.from_dict(package_doc)
+            for dependency in dependencies[package._id]:
+                self._report_local_finding(package=package, dependency=dependency, repo_stars=gh_repo["stargazers_count"])
+
+    def _get_fetch_batch_size(self) -> int:
+        """Number of dependency files downloaded together. Without GraphQL they are downloaded one by one"""
+        if self.modparser.graphql is None:
+            return 1
+        return self.depfile_fetch.get("batch_size", 50)
+
+    def _build_pipeline(self) -> ScanPipeline:
+        """Build the scan pipeline: GitHub discovery -> depfile fetch -> parse -> registry resolve -> persist/report"""
+        stages = []
+        for name, func in [
+            ("discovery", self._stage_discover),
+            ("fetch", self._stage_fetch),
+            ("parse", self._stage_parse),
+            ("resolve", self._stage_resolve),
+            ("persist", self._stage_persist),
+        ]:
+            stage_config = self.pipeline_config.get(name, {})
+            stages.append(
+                PipelineStage(
+                    name=name,
+                    func=func,
+                    workers=stage_config.get("workers", 1),
+                    queue_size=stage_config.get("queue_size", 100),
+                    # The fetch stage receives a list of jobs, one GraphQL query per batch
+                    batch_size=self._get_fetch_batch_size() if name == "fetch" else None,
+                )
             )
+        return ScanPipeline(stages=stages, logger=self.logger, on_item_done=self._on_pipeline_item_done)
 
-            # Parse each dependency file
-            for dep_item in dependencies:
-                # Parse the dependency file
-                required_packages = self.modparser.get_and_parse_depfile(item=dep_item)
-                
-                # Populate a list of dependencies to search in parallel
-                dependencies_to_search = self._populate_dependencies(
-                    gh_repo=gh_repo,
-                    dep=dep_item,
-                    required_packages=required_packages
-                    )  
-
-                # =================================== #
-                # = Parallel search of dependencies = #
-                # =================================== #
-                if (len(dependencies_to_search)>0):
-                    # Search packages in parallel
-                    self.search_dependencies_in_registries(
-                        # packages_to_search=packages_to_search,
-                        dependencies_to_search=dependencies_to_search,
-                        repo_stars=repo_stars
-                    )
-                else:
-                    self.logger.debug("All packages were already in our database. Not searching online for these. Only dependencies may have been updated in the database")
+    def scan_repositories(self):
+        """Scan a list of repository names provided by the user"""
+        self._repo_count = 0
+        self._pending_depfiles = {}
+        self._repo_trees = {}
+        self._incomplete_repos = set()
+        self._load_repository_scan_states()
+        self.pipeline = self._build_pipeline()
+        self.pipeline.run(self.repos_to_explore)
 
     def _get_explored_repositories(self) -> dict:
         # Obtain the repositories we already explored
-        explored_repositories = list(self.mongomgr.get_repositories())
         explored_repositories_updated = dict()
-        if (explored_repositories is not None):
-            for eo in list(explored_repositories):
-                explored_repositories_updated[eo['full_name'].casefold()]=eo['updated']
+        # Only the name and date of each repository, not the whole GitHub document
+        for eo in self.mongomgr.get_repository_summaries():
+            explored_repositories_updated[eo['full_name'].casefold()]=eo['updated']
 
         return explored_repositories_updated
 
@@ -895,33 +1542,41 @@ class DepScanner:
         # Get the list of organisation names and repositories with their updated status
         explored_organisation_updated=self._get_explored_organisations()
 
-        org_count=0
-        download_from_gh=False
-        # Iterate through the target organisations specified
+        # First decide which organisations have to be downloaded from GitHub
+        download_from_gh={}
         for target_org_name in self.target_organisation_names:
-            org_count+=1
             # Check wether the oganisation is in the local database
+            organisation_is_known=False
             organisation_is_fresh=False
             organisation_num_repos=None
             # If the organisation is currently in the database, check if it's fresh and the number of repositories it has
             if target_org_name.casefold() in explored_organisation_updated:
-                organisation_is_fresh=self._is_date_fresh(explored_organisation_updated[target_org_name]['updated'])
-                organisation_num_repos=explored_organisation_updated[target_org_name]['number_repos']
-            
+                organisation_is_known=True
+                organisation_is_fresh=self._is_date_fresh(explored_organisation_updated[target_org_name.casefold()]['updated'])
+                organisation_num_repos=explored_organisation_updated[target_org_name.casefold()]['number_repos']
+
             # Now, take the decisions of using the local database cache or pull from GitHub
-            # If force was specified, download from GitHub
-            if self.force:
-                download_from_gh=True
+            # If force was specified, or we never explored the organisation, download from GitHub
+            if self.force or not organisation_is_known:
+                download_from_gh[target_org_name]=True
             # If the data in the local cache is not fresh, download from GitHub
             elif not organisation_is_fresh and (organisation_num_repos and organisation_num_repos>0):
-                download_from_gh=True
+                download_from_gh[target_org_name]=True
             # If the number of repos we found last time was 0, no need to download anything from GitHub, they have no repositories
             else:
-                download_from_gh=False
-            
-            # If download flag is set, download, else use the local database cache
-            if download_from_gh:
-                org_repos = self.get_org_repositories_online(target_org_name)
+                download_from_gh[target_org_name]=False
+
+        # Enumerate the organisations to download in parallel
+        online_org_repos=self.org_enumerator.get_many(
+            [org_name for org_name, download in download_from_gh.items() if download]
+        )
+
+        org_count=0
+        for target_org_name in self.target_organisation_names:
+            org_count+=1
+            # If download flag is set, store what we got from GitHub, else use the local database cache
+            if download_from_gh[target_org_name]:
+                org_repos = self._save_org_repositories(target_org_name, online_org_repos[target_org_name])
             # No need to download from GitHub, use the local database cache
             else:
                 org_repos = self.get_org_repositories_from_database(target_org_name)
@@ -932,18 +1587,14 @@ class DepScanner:
             self.logger.info(org_header_msg)
             self.logger.info("=" * len(org_header_msg))
             msg=f" Obtained {len(org_repos)} repositories "
-            if not download_from_gh:
+            if not download_from_gh[target_org_name]:
                 msg+="from the local database"
             else:
                 msg+="from GitHub API"
             self.logger.info(msg)
 
-            """
-            TODO: Check now the freshnes of each repository
-            If the repository is fresh and the force flag has not been specified, we ignore the repository to explore.
-            For now, we just add all repositories of this organisation to the list of repositories to explore.
-            """
-            # Append the repositories obtained to the list of repositories to explore
+            # Append the repositories obtained to the list of repositories to explore.
+            # In incremental mode, the ones that didn't change since their last scan are skipped by the discovery stage
             self.repos_to_explore += org_repos
 
         return len(self.repos_to_explore)
@@ -999,8 +1650,232 @@ class DepScanner:
         return len(self.repos_to_explore)
             
 
+    def _start_checkpoint(self):
+        """Store the targets and options of a new scan, so it can be resumed"""
+        scan_id = self.checkpoint.start(
+            targets={
+                "organisations": list(self.target_organisation_names or []),
+                "repositories": list(self.target_repository_names or []),
+                "domains": list(self.domain_names or []),
+            },
+            options={"force": self.force, "stars": self.minimum_stars, "incremental": self.incremental, "distributed": self.distributed},
+        )
+        self.logger.info(f"💾 Scan id {scan_id}. If it's interrupted, continue it with --resume {scan_id}")
+
+    def _restore_scan(self, scan_id: str) -> dict:
+        """Load an interrupted scan and restore its targets and options"""
+        scan = self.checkpoint.load(scan_id)
+        targets = scan.get("targets", {})
+        self.set_targets(targets.get("organisations"), targets.get("repositories"), targets.get("domains"))
+        self._apply_scan_options(scan)
+        self.logger.info(f"⏯️ Resuming scan {scan_id}: {len(self.checkpoint.completed)} repositories were already completed")
+        return scan
+
+    def _apply_scan_options(self, scan: dict):
+        """Use the options the scan was started with"""
+        options = scan.get("options", {})
+        self.force = options.get("force", self.force)
+        self.minimum_stars = options.get("stars", self.minimum_stars)
+        self.incremental = options.get("incremental", self.incremental)
+        self.distributed = options.get("distributed", self.distributed)
+
+    def _restore_repositories(self, scan: dict):
+        """Rebuild the list of repositories to explore of a resumed scan, leaving the completed ones out"""
+        remaining = [name for name in scan["repos"] if name not in self.checkpoint.completed]
+        repositories = {}
+        for repo in self.mongomgr.get_repositories_by_names(remaining):
+            repositories[repo["full_name"]] = repo
+        self.repos_to_explore = [repositories[name] for name in remaining if name in repositories]
+        self._resumed_repos = len(scan["repos"]) - len(remaining)
+        if len(self.repos_to_explore) < len(remaining):
+            self.logger.warning(f"{len(remaining) - len(self.repos_to_explore)} repositories of the scan are not in the database anymore")
+
+    def _search_pending_lookups(self, pending: dict):
+        """Search again the packages that were being searched when the scan was interrupted"""
+        repositories = {str(repo["id"]): repo for repo in self.repos_to_explore}
+        for repo_id, package_ids in (pending or {}).items():
+            gh_repo = repositories.get(repo_id)
+            if gh_repo is None or len(package_ids) == 0:
+                continue
+            dependencies = [
+                Dependency.from_dict(d) for d in self.mongomgr.get_dependencies_by_packages(repo_id=gh_repo["id"], package_ids=package_ids)
+            ]
+            self.logger.info(f"⏯️ Searching again {len(dependencies)} packages of {gh_repo['full_name']} interrupted by the previous run")
+            results = self._search_dependencies(dependencies)
+            self._persist_search_results(results, repo_stars=gh_repo["stargazers_count"])
+
+    def _start_write_buffer(self):
+        if self.write_buffer_config.get("enabled", True):
+            self.mongomgr.enable_write_buffer(
+                max_operations=self.write_buffer_config.get("max_operations", 500),
+                flush_interval=self.write_buffer_config.get("flush_interval", 2),
+            )
+
+    #### Distributed scans ####
+    def _enqueue_repositories(self):
+        """Queue a job per repository to explore. Repositories already queued by a previous run are not queued again"""
+        queued = self.job_queue.enqueue(
+            self.checkpoint.scan_id,
+            JobQueue.REPOSITORY,
+            [(repo["full_name"], {"full_name": repo["full_name"]}) for repo in self.repos_to_explore],
+        )
+        self.checkpoint.set_queued()
+        scan_id = str(self.checkpoint.scan_id)
+        self.logger.info(f"📬 {queued} repositories queued. Add workers to the scan with: depscanner worker {scan_id}")
+
+    def _process_repository_job(self, scan_id, job: dict, worker_id: str):
+        """Discover, fetch and parse the dependency files of a repository, link its packages and queue the ones to search"""
+        repo_full_name = job["payload"]["full_name"]
+        repositories = list(self.mongomgr.get_repositories_by_names([repo_full_name]))
+        if len(repositories) == 0:
+            raise ValueError(f"Repository {repo_full_name} not found in the database")
+        gh_repo = repositories[0]
+
+        # A failed previous lease of this repository in this process may have left it marked
+        with self._progress_lock:
+            self._incomplete_repos.discard(repo_full_name)
+        depfile_jobs = self._stage_discover(gh_repo)
+        with self._progress_lock:
+            self._pending_depfiles.pop(repo_full_name, None)
+        failed_depfiles = 0
+        batch_size = self._get_fetch_batch_size()
+        for start in range(0, len(depfile_jobs), batch_size):
+            self.job_queue.extend(job, worker_id)
+            batch = depfile_jobs[start:start + batch_size]
+            package_jobs = []
+            for depfile_job, outputs in zip(batch, self._stage_fetch(batch)):
+                if not outputs:
+                    failed_depfiles += 1
+                    continue
+                self._stage_parse(depfile_job)
+                for dependency in self._populate_dependencies(
+                    gh_repo=gh_repo, dep=depfile_job.item, required_packages=depfile_job.required_packages
+                ):
+                    package_jobs.append((
+                        f"{gh_repo['id']}:{dependency.package_id}",
+                        {"repo_id": gh_repo["id"], "package_id": dependency.package_id, "stars": gh_repo["stargazers_count"]},
+                    ))
+            # Queued as soon as they are linked: a retried repository job takes its linked packages as fresh
+            self.job_queue.enqueue(scan_id, JobQueue.PACKAGE, package_jobs)
+        with self._progress_lock:
+            self._repo_trees.pop(repo_full_name, None)
+        # The job is released and leased again to retry what failed
+        if repo_full_name in self._incomplete_repos:
+            self._incomplete_repos.discard(repo_full_name)
+            raise RuntimeError(f"Could not list the dependency files of {repo_full_name}")
+        if failed_depfiles > 0:
+            raise RuntimeError(f"Could not download {failed_depfiles} dependency files of {repo_full_name}")
+        # The state of the repository for the incremental mode is not saved here: its packages are searched by other jobs,
+        # maybe in other workers, and a repository must not be skipped by the next scan if they fail
+
+    def _process_package_jobs(self, jobs: list[dict]) -> set:
+        """
+        Search in the registries the packages of a batch of jobs, of any repositories, and save the results.
+        Returns the (repo_id, package_id) of the jobs whose result was saved. The lookups that failed are not in the results.
+        """
+        package_ids = {}
+        stars = {}
+        for job in jobs:
+            payload = job["payload"]
+            package_ids.setdefault(payload["repo_id"], []).append(payload["package_id"])
+            stars[payload["repo_id"]] = payload.get("stars", 0)
+        dependencies = []
+        for repo_id, ids in package_ids.items():
+            dependencies += [
+                Dependency.from_dict(d) for d in self.mongomgr.get_dependencies_by_packages(repo_id=repo_id, package_ids=ids)
+            ]
+        results = {}
+        for dependency in self._search_dependencies(dependencies):
+            results.setdefault(dependency.repo_id, []).append(dependency)
+        saved = set()
+        for repo_id, repo_results in results.items():
+            self._persist_search_results(repo_results, repo_stars=stars.get(repo_id, 0))
+            saved.update((str(repo_id), str(dependency.package_id)) for dependency in repo_results)
+        # The results must be stored before the jobs are acknowledged
+        self.mongomgr.flush()
+        return saved
+
+    def _is_scan_drained(self, scan_id) -> bool:
+        """Whether all the repositories of the scan were queued and there is no job left"""
+        scan = self.mongomgr.get_scan(scan_id)
+        if scan is None or scan.get("status") == "completed":
+            return True
+        return bool(scan.get("queued")) and self.job_queue.is_drained(scan_id)
+
+    def _worker_loop(self, scan_id, worker_id: str):
+        """Lease and run jobs of the scan until it's drained"""
+        package_batch = self.job_queue_config.get("package_batch", 100)
+        poll_interval = self.job_queue_config.get("poll_interval", 5)
+        while True:
+            # Repositories first, they produce the package jobs
+            jobs = self.job_queue.lease(scan_id, worker_id, [JobQueue.REPOSITORY])
+            if jobs:
+                try:
+                    self._process_repository_job(scan_id, jobs[0], worker_id)
+                    self.job_queue.ack(jobs[0], worker_id)
+                    with self._progress_lock:
+                        self.current_repo_index += 1
+                except Exception as e:
+                    self.logger.exception(f"Error running the job {jobs[0]['key']}")
+                    self.job_queue.release(jobs[0], worker_id, error=str(e))
+                continue
+
+            jobs = self.job_queue.lease(scan_id, worker_id, [JobQueue.PACKAGE], count=package_batch)
+            if jobs:
+                try:
+                    saved = self._process_package_jobs(jobs)
+                    for job in jobs:
+                        payload = job["payload"]
+                        if (str(payload["repo_id"]), str(payload["package_id"])) in saved:
+                            self.job_queue.ack(job, worker_id)
+                        else:
+                            # The lookup failed, retry it in another lease
+                            self.job_queue.release(job, worker_id, error="Package not found in the search results")
+                except Exception as e:
+                    self.logger.exception(f"Error running {len(jobs)} package jobs")
+                    for job in jobs:
+                        self.job_queue.release(job, worker_id, error=str(e))
+                continue
+
+            if self._is_scan_drained(scan_id):
+                return
+            # Other workers may still be queuing package jobs
+            time.sleep(poll_interval)
+
+    def run_worker(self, scan_id: str, worker_id: str = None):
+        """
+        Work on the job queue of a distributed scan until all its jobs are done.
+        Several threads lease jobs in this process, and any number of processes or machines can work on the same scan.
+        The results are saved in the same collections as a local scan.
+        """
+        scan = ScanCheckpoint(mongomgr=self.mongomgr, logger=self.logger).get(scan_id)
+        self._apply_scan_options(scan)
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.logger.info(f"👷 Worker {worker_id} working on the scan {scan_id}")
+
+        self._start_write_buffer()
+        try:
+            threads = [
+                threading.Thread(target=self._worker_loop, args=(scan["_id"], f"{worker_id}-{n}"), name=f"worker-{n}", daemon=True)
+                for n in range(self.job_queue_config.get("threads", 4))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.mongomgr.stop_write_buffer()
+        self.logger.info(f"👷 Worker {worker_id} finished: {self.job_queue.get_counts(scan['_id'])}")
+
     def scan(self):
         """Scan the repositories for dependencies and identify potential hijackable ones"""
+        # Restore the interrupted scan, or store the new one to be able to resume it
+        resumed_scan = None
+        if self.resume:
+            resumed_scan = self._restore_scan(self.resume)
+        elif self.checkpoint is not None:
+            self._start_checkpoint()
+
         # Get the organisations
         item_name = "Unknown"
         item_len = 0
@@ -1017,10 +1892,15 @@ class DepScanner:
 
         # Notify the start of the scan via Discord
         discord_msg = f"Starting scan of {item_len} {item_name} at {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+        if self.shard is not None:
+            discord_msg += f" (process {self.shard})"
         self.bell.ping(msg=discord_msg, title="🎬 Starting scan 🎬")
 
         target_orgs_n = len(self.target_organisation_names) or 0
-        if self.target_organisation_names is not None and  target_orgs_n > 0:
+        if resumed_scan is not None and resumed_scan.get("repos") is not None:
+            # The repositories were resolved before the scan was interrupted
+            self._restore_repositories(resumed_scan)
+        elif self.target_organisation_names is not None and  target_orgs_n > 0:
             # Search repos of each organisation
             self.logger.info(
                 "⬇️ Pulling repositories information from a list of organisations names or domains provided ⬇️"
@@ -1031,6 +1911,8 @@ class DepScanner:
                 "Pulling repositories information from the list of repositories provided"
             )
             self._prepare_repositories_scan()
+        if self.checkpoint is not None and (resumed_scan is None or resumed_scan.get("repos") is None):
+            self.checkpoint.set_repositories([repo["full_name"] for repo in self.repos_to_explore])
 
         # Notify the number of repositories we are going to explore via Discord    
         self.bell.ping(
@@ -1039,17 +1921,90 @@ class DepScanner:
         )
 
         # Now, scan all the repositories
-        self.scan_repositories()
+        if self.distributed:
+            # This process works on the queue like the rest of the workers until it's drained
+            self._enqueue_repositories()
+            self.run_worker(str(self.checkpoint.scan_id))
+        else:
+            self._start_write_buffer()
+            try:
+                if resumed_scan is not None:
+                    self._search_pending_lookups(resumed_scan.get("pending"))
+                self.scan_repositories()
+            finally:
+                # Write what is left in the buffer before reporting the end of the scan
+                self.mongomgr.stop_write_buffer()
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
 
         # Notify about the scan is finished
         discord_msg = f"Finished scan of {len(self.repos_to_explore)} repositories at {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
+        if self.shard is not None:
+            discord_msg += f" (process {self.shard})"
         self.bell.ping(msg=discord_msg, title="🏁 Scan finished 🏁")
 
+        self.close()
+
+        # Log the number of requests sent to each host
+        for host, stats in self.http.get_stats().items():
+            self.logger.info(
+                f"📡 {host}: {stats['requests']} requests, {stats['errors']} errors, {stats['not_modified']} not modified"
+            )
+        if self.incremental:
+            self.logger.info(f"🔁 {self.unchanged_repos} repositories skipped because they didn't change since their last scan")
+        if self.name_indexes:
+            self.logger.info(f"📇 {self.name_index_hits} packages found in the offline name indexes")
+        cache_stats = self.resolution_cache.get_stats()
+        self.logger.info(
+            f"📦 Resolution cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['coalesced']} coalesced lookups, {cache_stats['evictions']} evictions"
+        )
+        write_stats = self.mongomgr.get_write_buffer_stats()
+        if write_stats is not None:
+            self.logger.info(
+                f"💾 Write buffer: {write_stats['operations']} operations in {write_stats['flushes']} flushes, "
+                f"{write_stats['errors']} errors, flush latency {write_stats['avg_latency']*1000:.0f}ms avg / {write_stats['max_latency']*1000:.0f}ms max"
+            )
+        scope_stats = self.scope_resolver.get_stats()
+        self.logger.info(
+            f"🔭 npm scopes: {scope_stats['hits']} memory hits, {scope_stats['database_hits']} database hits, "
+            f"{scope_stats['requests']} requests"
+        )
+        go_stats = self.go_resolver.get_stats()
+        self.logger.info(
+            f"🐹 Go modules: {go_stats['roots']} repository roots cached, {go_stats['misses']} go-import lookups, "
+            f"{go_stats['coalesced']} coalesced lookups"
+        )
+        for resource, quota in self.rate_limiter.get_stats().items():
+            self.logger.info(
+                f"⏳ GitHub {resource} API: {quota['remaining']}/{quota['limit']} requests left ({quota['tokens']} tokens)"
+            )
+
+    def close(self):
+        """Stop the event loop of the registry lookups and the worker threads"""
+        if self.resolver is not None:
+            self.resolver.close()
+        self.pool.shutdown()
+
     def get_scan_progress(self) -> dict:
         """Return the current progress of the repository scan."""
-        total_repos = len(self.repos_to_explore)
+        # The repositories of a distributed scan are done by all its workers
+        if self.distributed and self.checkpoint is not None and self.checkpoint.scan_id is not None:
+            repository_jobs = self.job_queue.get_counts(self.checkpoint.scan_id).get(JobQueue.REPOSITORY, {})
+            total_repos = sum(repository_jobs.values())
+            current = repository_jobs.get("done", 0) + repository_jobs.get("failed", 0)
+            percentage = int((current / total_repos) * 100) if total_repos else 0
+            return {"current": current, "total": total_repos, "percentage": percentage}
+
+        # A resumed scan counts the repositories completed before it was interrupted
+        total_repos = len(self.repos_to_explore) + self._resumed_repos
         if total_repos == 0:
             return {"current": 0, "total": 0, "percentage": 0}
 
-        percentage = int((self.current_repo_index / total_repos) * 100)
-        return {"current": self.current_repo_index, "total": total_repos, "percentage": percentage}
+        current = self.current_repo_index + self._resumed_repos
+        percentage = int((current / total_repos) * 100)
+        progress = {"current": current, "total": total_repos, "percentage": percentage}
+        # Number of items queued, in progress, processed and failed in each stage of the pipeline
+        if self.pipeline is not None:
+            progress["stages"] = self.pipeline.get_progress()
+        return progress
@@ -32,11 +32,21 @@ class DepScannerDaemon:
             self.logger.error(f"Error: {str(e)}")
             self.status = f"Error: {str(e)}"
         finally:
+            self._flush_database()
             self.running = False
 
+    def _flush_database(self):
+        """Write the database operations buffered by the scanner"""
+        if self.dep_scanner and self.dep_scanner.mongomgr:
+            try:
+                self.dep_scanner.mongomgr.flush()
+            except Exception as e:
+                self.logger.error(f"Error flushing the database writes: {str(e)}")
+
     def stop(self):
         """Stop the daemon."""
         self.running = False
+        self._flush_database()
         self.logger.info("FAKE: Stopping the scan")
         self.status = "FAKE: Stopped"
 
@@ -0,0 +1,71 @@
+import json
+import logging
+
+from depscanner.HttpClient import HttpClient
+
+
+class GithubGraphQL:
+    """Client of the GitHub GraphQL API used to batch many lookups into a single request"""
+
+    def __init__(self, http: HttpClient, headers: dict, logger: logging.Logger, api_base: str = "https://api.github.com"):
+        self.http = http
+        self.headers = headers
+        self.logger = logger
+        self.endpoint = f"{api_base}/graphql"
+
+    def query(self, query: str, variables: dict = None) -> dict:
+        """
+        Run a GraphQL query and return the response document.
+        Partial errors (e.g. a repository not found) are logged and the data of the rest of the query is returned.
+        Returns None if the request failed.
+        """
+        response = self.http.post(
+            self.endpoint,
+            headers=self.headers,
+            json={"query": query, "variables": variables or {}},
+        )
+        if response.status_code != 200:
+            self.logger.error(f"Error querying the GitHub GraphQL API: {response.text} [{response.status_code}]")
+            return None
+        document = response.json()
+        for error in document.get("errors", []):
+            self.logger.debug(f"GitHub GraphQL API error: {error.get('message')}")
+        return document
+
+    def fetch_blobs(self, items: list) -> list:
+        """
+        Fetch the text of many dependency files in a single query, using one alias per repository and one per file.
+        The items are code search or tree items with the 'path' and 'repository.full_name' keys.
+        Returns the contents aligned with the items, None for the files that could not be retrieved (not found, binary or too large)
+        """
+        repositories = {}
+        for index, item in enumerate(items):
+            repositories.setdefault(item["repository"]["full_name"], []).append(index)
+
+        # e.g. r0: repository(owner: "org", name: "repo") { f3: object(expression: "HEAD:package.json") { ... on Blob { text } } }
+        repo_queries = []
+        for repo_index, (full_name, indexes) in enumerate(repositories.items()):
+            owner, name = full_name.split("/", 1)
+            file_queries = " ".join(
+                f"f{index}: object(expression: {json.dumps('HEAD:' + items[index]['path'])}) {{ ... on Blob {{ text isBinary isTruncated }} }}"
+                for index in indexes
+            )
+            repo_queries.append(
+                f"r{repo_index}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {file_queries} }}"
+            )
+
+        contents = [None] * len(items)
+        document = self.query("query { " + " ".join(repo_queries) + " }")
+        if document is None or document.get("data") is None:
+            return contents
+
+        for repo_index, (full_name, indexes) in enumerate(repositories.items()):
+            repository = document["data"].get(f"r{repo_index}")
+            if repository is None:
+                continue
+            for index in indexes:
+                blob = repository.get(f"f{index}")
+                if blob is None or blob.get("isBinary") or blob.get("isTruncated"):
+                    continue
+                contents[index] = blob.get("text")
+        return contents
@@ -0,0 +1,178 @@
+import logging
+import re
+import threading
+from urllib.parse import urljoin
+
+import requests
+
+from depscanner.HttpClient import HttpClient
+from depscanner.ResolutionCache import ResolutionCache
+from depscanner.WorkerPool import WorkerPool
+
+
+class GoModule:
+    """Repository of a Go module: the import path prefix of the repository root, the VCS and the repository URL"""
+
+    def __init__(self, root: str, vcs: str, repo_url: str):
+        self.root = root
+        self.vcs = vcs
+        self.repo_url = repo_url
+
+
+class GoModuleResolver:
+    """
+    Find the repository of Go module paths following https://go.dev/ref/mod#vcs-find
+    - Paths of the well-known code hosting sites and paths with a VCS qualifier are resolved without any request.
+    - The rest are resolved with the go-import <meta> tag of https://<path>?go-get=1 (or the Origin of the module proxy, when configured),
+      concurrently in the worker pool.
+    - The repository roots are cached by path prefix for the whole scan, so the modules under a known root are not requested again,
+      and concurrent lookups of the same path share one request.
+    """
+
+    KNOWN_HOSTS = {
+        "github.com": "git",
+        "gitlab.com": "git",
+        "bitbucket.org": "git",
+    }
+    VCS_QUALIFIERS = (".bzr", ".fossil", ".git", ".hg", ".svn")
+    GO_IMPORT_REGEX = re.compile(
+        r"<meta\s+name=[\"']go-import[\"']\s+content=[\"'](?P<content>[^\"']*)[\"']",
+        re.IGNORECASE,
+    )
+
+    def __init__(
+        self,
+        http: HttpClient,
+        logger: logging.Logger,
+        pool: WorkerPool = None,
+        proxy: str = None,
+        headers: dict = None,
+        timeout: int = 10,
+    ):
+        self.http = http
+        self.logger = logger
+        self.pool = pool
+        # Module proxy (e.g. https://proxy.golang.org) to read the repository from the Origin of the latest version
+        self.proxy = proxy.rstrip("/") if proxy else None
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._roots = {}  # root path -> GoModule
+        self._roots_lock = threading.Lock()
+        # Single in-flight request per path. The paths without go-import information are cached too, the request errors are not
+        self._lookups = ResolutionCache(logger=logger)
+
+    def _get_cached_root(self, path: str) -> GoModule:
+        """Return the cached module whose root is the path or one of its prefixes"""
+        components = path.split("/")
+        with self._roots_lock:
+            for end in range(len(components), 0, -1):
+                module = self._roots.get("/".join(components[:end]))
+                if module is not None:
+                    return module
+        return None
+
+    def _cache_root(self, module: GoModule):
+        with self._roots_lock:
+            self._roots[module.root] = module
+
+    def _resolve_statically(self, path: str) -> GoModule:
+        """Resolve the paths that don't need any request: known code hosting sites and VCS qualifiers"""
+        components = path.split("/")
+        vcs = self.KNOWN_HOSTS.get(components[0])
+        if vcs is not None and len(components) >= 3:
+            root = "/".join(components[:3])
+            return GoModule(root=root, vcs=vcs, repo_url=f"https://{root}")
+        # If the module path has a VCS qualifier at the end of a path component, everything up to it is the repository
+        for index, component in enumerate(components):
+            for qualifier in self.VCS_QUALIFIERS:
+                if index > 0 and component.endswith(qualifier):
+                    root = "/".join(components[:index + 1])
+                    return GoModule(root=root, vcs=qualifier[1:], repo_url=f"https://{root}")
+        return None
+
+    def _lookup_go_import(self, path: str) -> GoModule:
+        """Read the go-import <meta> tag of https://<path>?go-get=1"""
+        response = self.http.get(
+            urljoin(f"https://{path}", "?go-get=1"),
+            headers=self.headers,
+            timeout=self.timeout,
+        )
+        for match in self.GO_IMPORT_REGEX.finditer(response.text):
+            parts = match.group("content").split()
+            if len(parts) != 3:
+                continue
+            root, vcs, repo_url = parts
+            # The mod entries point to a module proxy, not to the repository
+            if vcs != "mod" and (path == root or path.startswith(root + "/")):
+                return GoModule(root=root, vcs=vcs, repo_url=repo_url)
+        return None
+
+    def _lookup_proxy(self, path: str) -> GoModule:
+        """Read the repository from the Origin of the latest version in the module proxy"""
+        escaped = re.sub(r"[A-Z]", lambda m: "!" + m.group(0).lower(), path)
+        response = self.http.get(f"{self.proxy}/{escaped}/@latest", timeout=self.timeout)
+        if response.status_code != 200:
+            return None
+        origin = response.json().get("Origin") or {}
+        if not origin.get("URL"):
+            return None
+        return GoModule(root=path, vcs=origin.get("VCS", "git"), repo_url=origin["URL"])
+
+    def _lookup(self, path: str):
+        """Resolve a path online. Returns the module, False if the path has no repository information or None on errors"""
+        module = None
+        try:
+            if self.proxy is not None:
+                module = self._lookup_proxy(path)
+            if module is None:
+                module = self._lookup_go_import(path)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.debug(f"Error resolving the Go module {path}: {e}")
+            return None
+        if module is None:
+            self.logger.debug(f"No go-import information found for the Go module {path}")
+            return False
+        self._cache_root(module)
+        return module
+
+    def _resolve(self, path: str):
+        """Return the repository of a module path, False if the path has no repository information or None on errors"""
+        module = self._get_cached_root(path) or self._resolve_statically(path)
+        if module is not None:
+            return module
+        return self._lookups.get_or_compute(
+            ResolutionCache.get_key("go-import", path),
+            lambda: self._lookup(path),
+            cacheable=lambda value: value is not None,
+        )
+
+    def resolve(self, path: str) -> GoModule:
+        """Return the repository of a module path, or None if it could not be found"""
+        return self._resolve(path) or None
+
+    def resolve_many(self, paths: list[str], failed: set = None) -> dict:
+        """
+        Resolve many module paths concurrently. Returns the module (or None) of each path.
+        The paths that could not be resolved because of an error (not the ones without repository information) are added to failed
+        """
+        unique_paths = list(dict.fromkeys(paths))
+        if self.pool is None or len(unique_paths) < 2:
+            results = {path: self._resolve(path) for path in unique_paths}
+        else:
+            futures = [(path, self.pool.submit(self._resolve, path)) for path in unique_paths]
+            results = {}
+            for path, future in futures:
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    self.logger.error(f"Error resolving the Go module {path}: {e}")
+                    results[path] = None
+        if failed is not None:
+            failed.update(path for path, module in results.items() if module is None)
+        return {path: module or None for path, module in results.items()}
+
+    def get_stats(self) -> dict:
+        """Return the number of repository roots cached and the online lookups counters"""
+        with self._roots_lock:
+            roots = len(self._roots)
+        return {"roots": roots, **self._lookups.get_stats()}
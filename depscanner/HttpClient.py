@@ -0,0 +1,166 @@
+import logging
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient:
+    """
+    Shared HTTP client for the GitHub API, the public registries and the go-import lookups.
+    It keeps one requests.Session with a keep-alive connection pool per host, so the TCP+TLS handshake is paid once per connection instead of once per request.
+    All the requests share the same timeout and retry policy, and the client counts the requests sent to each host.
+    The requests to the GitHub API are paced by the rate limit scheduler.
+    GET requests to the hosts with a response cache are sent with the stored validators, and a 304 Not Modified is answered from the cache.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        proxies: dict = None,
+        timeout: int = 30,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        host_pools: dict = None,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        verify: bool = False,
+    ):
+        self.logger = logger
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = verify
+        if proxies:
+            self.session.proxies.update(proxies)
+
+        # Retry connection errors and transient server errors. Rate limits (403/429) are handled by the callers
+        self.retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        )
+
+        # Default pool for the hosts without a specific pool size
+        default_adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=self.retry,
+        )
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+
+        # Dedicated pools for the hosts we talk to the most, e.g. api.github.com, pypi.org or registry.npmjs.org
+        for host, maxsize in (host_pools or {}).items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(maxsize), max_retries=self.retry)
+            self.session.mount(f"https://{host}/", adapter)
+            self.session.mount(f"http://{host}/", adapter)
+
+        self._counters_lock = threading.Lock()
+        self.requests_per_host = Counter()
+        self.errors_per_host = Counter()
+        self.not_modified_per_host = Counter()
+
+        # Conditional request cache (see set_cache)
+        self.cache = None
+        self.cache_hosts = set()
+        # Rate limit scheduler (see set_rate_limiter)
+        self.rate_limiter = None
+        self.rate_limit_hosts = set()
+
+    def set_cache(self, cache, hosts: list):
+        """Send conditional GET requests to the given hosts, using the validators stored in the ResponseCache"""
+        self.cache = cache
+        self.cache_hosts = set(hosts)
+
+    def set_rate_limiter(self, rate_limiter, hosts: list):
+        """Schedule the requests to the given hosts with the RateLimiter, and feed it with the rate limit headers of their responses"""
+        self.rate_limiter = rate_limiter
+        self.rate_limit_hosts = set(hosts)
+
+    def request(self, method: str, url: str, token: str = None, **kwargs) -> requests.Response:
+        """
+        Send a request through the shared session and update the per-host counters.
+        The requests to the rate limited hosts are sent with the token picked by the rate limiter, or with the given token.
+        """
+        host = urlparse(url).netloc
+        kwargs.setdefault("timeout", self.timeout)
+        self.count_request(host)
+
+        rate_limited = self.rate_limiter is not None and host in self.rate_limit_hosts
+        if rate_limited:
+            token = self.rate_limiter.acquire(url, token=token)
+            if token is not None:
+                kwargs["headers"] = dict(kwargs.get("headers") or {})
+                kwargs["headers"]["Authorization"] = f"Bearer {token}"
+
+        # The cache is read once the token is known: the entries of a token are not served to another one
+        cached = None
+        conditional = self.cache is not None and method == "GET" and host in self.cache_hosts
+        if conditional:
+            kwargs["headers"] = dict(kwargs.get("headers") or {})
+            token_id = self.cache.get_token_id(kwargs["headers"])
+            try:
+                cached = self.cache.add_validators(url, token_id, kwargs["headers"])
+            except Exception as e:
+                self.logger.debug(f"Error reading the response cache of {url}: {e}")
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self.count_error(host)
+            raise
+
+        if rate_limited:
+            self.rate_limiter.update(url, response, token=token)
+
+        if not conditional:
+            return response
+        try:
+            if response.status_code == 304 and cached is not None:
+                with self._counters_lock:
+                    self.not_modified_per_host[host] += 1
+                return self.cache.build_response(cached, response)
+            if response.status_code == 200:
+                self.cache.save(url, token_id, response)
+        except Exception as e:
+            self.logger.debug(f"Error updating the response cache of {url}: {e}")
+        return response
+
+    def count_request(self, host: str):
+        """Count a request sent to a host. Also used by the clients with their own connections (the asyncio registry lookups), so the stats cover all the requests"""
+        with self._counters_lock:
+            self.requests_per_host[host] += 1
+
+    def count_error(self, host: str):
+        """Count a request to a host that failed without a response"""
+        with self._counters_lock:
+            self.errors_per_host[host] += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_stats(self) -> dict:
+        """Return the number of requests, errors and 304 Not Modified responses per host"""
+        with self._counters_lock:
+            return {
+                host: {
+                    "requests": count,
+                    "errors": self.errors_per_host[host],
+                    "not_modified": self.not_modified_per_host[host],
+                }
+                for host, count in self.requests_per_host.items()
+            }
+
+    def close(self):
+        """Close all the pooled connections"""
+        self.session.close()
@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from depscanner.MongoManager import MongoManager
+
+
+class JobQueue:
+    """
+    Work queue of a scan stored in the jobs collection, shared by all the workers (processes or machines) of the scan.
+    - A worker leases a job for visibility_timeout seconds. If it doesn't acknowledge it in time (e.g. it died),
+      the job becomes visible again and another worker takes it.
+    - A failed job is released to be retried, up to max_attempts leases. Then it's marked as failed, also when its last
+      lease expired (a job that kills or hangs its workers).
+    - Each job has a key unique in its scan, so queuing the same work twice (e.g. a resumed coordinator) is a no-op.
+    """
+
+    REPOSITORY = "repository"
+    PACKAGE = "package"
+
+    def __init__(self, mongomgr: MongoManager, logger: logging.Logger, visibility_timeout: int = 600, max_attempts: int = 5):
+        self.mongomgr = mongomgr
+        self.logger = logger
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def enqueue(self, scan_id: ObjectId, job_type: str, jobs: list[tuple[str, dict]]) -> int:
+        """Queue (key, payload) jobs of a type. Returns the number of new jobs"""
+        now = datetime.now()
+        return self.mongomgr.save_jobs([
+            {
+                "scan_id": scan_id,
+                "type": job_type,
+                "key": f"{job_type}:{key}",
+                "payload": payload,
+                "status": "queued",
+                "attempts": 0,
+                "created": now,
+                "updated": now,
+            }
+            for key, payload in jobs
+        ])
+
+    def lease(self, scan_id: ObjectId, worker_id: str, types: list[str], count: int = 1) -> list[dict]:
+        """Lease up to count jobs of the given types to the worker"""
+        jobs = []
+        while len(jobs) < count:
+            now = datetime.now()
+            job = self.mongomgr.lease_job(
+                scan_id,
+                types,
+                worker_id,
+                now=now,
+                lease_expires=now + timedelta(seconds=self.visibility_timeout),
+                max_attempts=self.max_attempts,
+            )
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    def extend(self, job: dict, worker_id: str):
+        """Renew the lease of a job that is taking long"""
+        self.mongomgr.update_leased_job(
+            job["_id"], worker_id, {"$set": {"lease_expires": datetime.now() + timedelta(seconds=self.visibility_timeout)}}
+        )
+
+    def ack(self, job: dict, worker_id: str):
+        """Mark a job as done"""
+        self.mongomgr.update_leased_job(job["_id"], worker_id, {"$set": {"status": "done"}, "$unset": {"lease_expires": ""}})
+
+    def release(self, job: dict, worker_id: str, error: str = None):
+        """Give a job back to be retried, or mark it as failed when it ran out of attempts"""
+        status = "failed" if job.get("attempts", 0) >= self.max_attempts else "queued"
+        if status == "failed":
+            self.logger.error(f"Job {job['key']} failed {job.get('attempts', 0)} times, giving up: {error}")
+        self.mongomgr.update_leased_job(
+            job["_id"], worker_id, {"$set": {"status": status, "error": error}, "$unset": {"lease_expires": ""}}
+        )
+
+    def get_counts(self, scan_id: ObjectId) -> dict:
+        """Return the number of jobs of the scan by type and status"""
+        return self.mongomgr.count_jobs(scan_id)
+
+    def fail_expired(self, scan_id: ObjectId) -> int:
+        """Mark as failed the jobs whose lease expired max_attempts times, their workers died or hung every time"""
+        failed = self.mongomgr.fail_expired_jobs(scan_id, now=datetime.now(), max_attempts=self.max_attempts)
+        if failed > 0:
+            self.logger.error(f"{failed} jobs of the scan {scan_id} failed: their lease expired {self.max_attempts} times")
+        return failed
+
+    def is_drained(self, scan_id: ObjectId) -> bool:
+        """Whether no job of the scan is queued or leased. The jobs out of attempts are marked as failed first"""
+        self.fail_expired(scan_id)
+        return all(
+            statuses.get("queued", 0) == 0 and statuses.get("leased", 0) == 0
+            for statuses in self.get_counts(scan_id).values()
+        )
@@ -0,0 +1,78 @@
+import re
+from json.decoder import scanstring
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_LITERALS = {"true": ("boolean", True), "false": ("boolean", False), "null": ("null", None)}
+
+
+def iter_json_events(content: str):
+    """
+    Event based JSON parser: yields (path, event, value) tuples while reading the document, without building it in memory.
+    - path is the tuple of the keys leading to the value ("item" for the elements of an array).
+    - event is one of start_map, map_key, end_map, start_array, end_array, string, number, boolean or null.
+    - map_key events carry the key and the path of the map, the rest of the events the path of the value.
+    e.g. {"a": [1]} yields ((), start_map), ((), map_key, "a"), (("a",), start_array), (("a", "item"), number, 1),
+    (("a",), end_array), ((), end_map).
+    Raises ValueError if the document is not valid JSON.
+    """
+    path = []
+    containers = []  # "map" or "array" for each open container
+    expect_key = False
+    pos = 0
+    end = len(content)
+    while True:
+        pos = _WHITESPACE.match(content, pos).end()
+        if pos >= end:
+            break
+        char = content[pos]
+        if char == '"':
+            value, pos = scanstring(content, pos + 1)
+            if expect_key:
+                pos = _WHITESPACE.match(content, pos).end()
+                if content[pos:pos + 1] != ":":
+                    raise ValueError(f"Expecting ':' delimiter at position {pos}")
+                pos += 1
+                path[-1] = value
+                expect_key = False
+                yield tuple(path[:-1]), "map_key", value
+            else:
+                yield tuple(path), "string", value
+        elif char == "{":
+            yield tuple(path), "start_map", None
+            containers.append("map")
+            path.append(None)
+            expect_key = True
+            pos += 1
+        elif char == "[":
+            yield tuple(path), "start_array", None
+            containers.append("array")
+            path.append("item")
+            pos += 1
+        elif char in "}]":
+            if not containers or containers.pop() != ("map" if char == "}" else "array"):
+                raise ValueError(f"Unexpected '{char}' at position {pos}")
+            path.pop()
+            expect_key = False
+            pos += 1
+            yield tuple(path), "end_map" if char == "}" else "end_array", None
+        elif char == ",":
+            if not containers:
+                raise ValueError(f"Unexpected ',' at position {pos}")
+            expect_key = containers[-1] == "map"
+            pos += 1
+        else:
+            for literal, (event, value) in _LITERALS.items():
+                if content.startswith(literal, pos):
+                    pos += len(literal)
+                    yield tuple(path), event, value
+                    break
+            else:
+                number = _NUMBER.match(content, pos)
+                if number is None or number.end() == pos:
+                    raise ValueError(f"Unexpected character {char!r} at position {pos}")
+                pos = number.end()
+                text = number.group()
+                yield tuple(path), "number", float(text) if any(c in text for c in ".eE") else int(text)
+    if containers:
+        raise ValueError("Unexpected end of the document")
@@ -1,21 +1,36 @@
 from base64 import b64decode
 from urllib.parse import urlparse, urljoin
+import io
 import json
 import re
 import logging
-import requests
+import threading
 import toml
 import semver
 from packaging.requirements import Requirement, InvalidRequirement
 
 from collections import namedtuple
 
+from depscanner.HttpClient import HttpClient
+from depscanner.GithubGraphQL import GithubGraphQL
+from depscanner.GoModuleResolver import GoModuleResolver
+from depscanner.JsonEvents import iter_json_events
+
 class DependencyInfo:
     def __init__(self, name: str=None, url: str=None, semver_string: str= None):
         self.name = name
         self.semver = semver_string
         self.url = url
 
+    def to_dict(self) -> dict:
+        """Converts the object into a MongoDB-compatible dictionary."""
+        return {k: v for k, v in self.__dict__.items() if v is not None}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Creates a DependencyInfo object from a dictionary."""
+        return cls(name=data.get("name"), url=data.get("url"), semver_string=data.get("semver"))
+
 class ModfileParser:
     """Class to parse the dependency files of the repositories"""
 
@@ -24,30 +39,120 @@ class ModfileParser:
         proxies: dict,
         headers: dict,
         logger: logging.Logger,
+        http: HttpClient = None,
+        graphql: GithubGraphQL = None,
+        parse_cache=None,
+        go_resolver: GoModuleResolver = None,
     ):
         self.proxies = proxies
         self.headers = headers
         self.logger = logger
+        # Share the HTTP connection pools of the scanner when provided
+        self.http = http if http else HttpClient(logger=logger, proxies=proxies)
+        # When provided, the contents of many dependency files are fetched in one GraphQL query
+        self.graphql = graphql
+        # When provided, the parsed dependencies are stored by blob sha and unchanged files are not downloaded again
+        self.parse_cache = parse_cache
+        # Finds the repositories of the Go modules, shared by all the go.mod files of the scan
+        self.go_resolver = go_resolver if go_resolver else GoModuleResolver(http=self.http, logger=logger)
+        # State of the file being parsed in each thread
+        self._parsing = threading.local()
 
     def get_and_parse_depfile(self, item) -> list[DependencyInfo]:
-        """Wrapper for all the other parsing functions"""
+        """
+        Wrapper for all the other parsing functions: downloads the dependency file and parses it.
+        If the same blob was parsed before, the cached dependencies are returned without downloading the file.
+        """
+        cached = self.get_cached_dependencies([item])[0]
+        if cached is not None:
+            return cached
+        content = self.fetch_depfile(item)
+        if content is None:
+            return []
+        return self.parse_depfile(item, content)
+
+    def get_cached_dependencies(self, items: list) -> list:
+        """Returns the cached dependencies aligned with the items, None for the files that were not parsed before"""
+        if self.parse_cache is None:
+            return [None] * len(items)
+        try:
+            return self.parse_cache.get_many(items)
+        except Exception as e:
+            self.logger.error(f"Error reading the parsed dependency files cache: {e}")
+            return [None] * len(items)
+
+    def fetch_depfile(self, item) -> str:
+        """Downloads the contents of a dependency file from the GitHub API. Returns None if the file could not be downloaded"""
+        self.logger.debug(f"Downloading contents of {item['name']} from {item['url']}")
+        response = self.http.get(
+            item["url"],
+            headers=self.headers,
+            timeout=10,
+        )
+        if response.status_code == 200:
+            return b64decode(response.json()["content"]).decode("utf-8")
+        self.logger.error(
+            f"Error downloading {item['path']}: [{response.status_code}]"
+        )
+        return None
+
+    def fetch_depfiles(self, items: list) -> list:
+        """
+        Downloads the contents of many dependency files. Returns the contents aligned with the items, None for the files that could not be downloaded.
+        The files are fetched in a single GraphQL query if possible, the ones it could not return are downloaded one by one from the REST API.
+        """
+        contents = [None] * len(items)
+        if self.graphql is not None:
+            self.logger.debug(f"Downloading contents of {len(items)} dependency files with one GraphQL query")
+            contents = self.graphql.fetch_blobs(items)
+        for index, item in enumerate(items):
+            if contents[index] is None:
+                contents[index] = self.fetch_depfile(item)
+        return contents
+
+    def parse_depfile(self, item, content: str) -> list[DependencyInfo]:
+        """Parses the contents of a dependency file with the parser matching its name"""
         dep_file_name = item["name"]
         dependencies = []
+        # Cleared by the parsers whose result depends on lookups that failed, e.g. the Go module resolution
+        self._parsing.cacheable = True
         if re.match(".*requirements.txt$", dep_file_name):
-            dependencies = self.get_and_parse_requirements(item)
+            dependencies = self.parse_requirements(item, content)
         elif re.match("package.json$", dep_file_name):
-            dependencies = self.get_and_parse_package_json(item)
+            dependencies = self.parse_package_json(item, content)
         elif re.match(".*Pipfile$", dep_file_name):
-            dependencies = self.get_and_parse_pipfile(item)
+            dependencies = self.parse_pipfile(item, content)
         elif re.match(".*poetry.toml$", dep_file_name):
-            dependencies = self.get_and_parse_toml(item)
+            dependencies = self.parse_toml(item, content)
         elif re.match(".*Gemfile$", dep_file_name):
-            dependencies = self.get_and_parse_gemfile(item)
+            dependencies = self.parse_gemfile(item, content)
         elif dep_file_name == "go.mod":
-            dependencies = self.get_and_parse_gomod(item)
+            dependencies = self.parse_gomod(item, content)
+        elif dep_file_name == "package-lock.json":
+            dependencies = self.parse_package_lock(item, content)
+        elif dep_file_name == "yarn.lock":
+            dependencies = self.parse_yarn_lock(item, content)
+        elif dep_file_name == "pnpm-lock.yaml":
+            dependencies = self.parse_pnpm_lock(item, content)
+        elif dep_file_name == "poetry.lock":
+            dependencies = self.parse_poetry_lock(item, content)
+        elif dep_file_name == "Pipfile.lock":
+            dependencies = self.parse_pipfile_lock(item, content)
+        elif dep_file_name == "Gemfile.lock":
+            dependencies = self.parse_gemfile_lock(item, content)
+        elif dep_file_name == "go.sum":
+            dependencies = self.parse_gosum(item, content)
         else:
             self.logger.error(f"Unknown dependency file: {item['path']}")
+            return dependencies
 
+        if self.parse_cache is not None and not self._parsing.cacheable:
+            self.logger.debug(f"Not caching the dependencies of {item['path']}, some of them could not be resolved")
+        elif self.parse_cache is not None:
+            try:
+                self.parse_cache.save(item, dependencies)
+            except Exception as e:
+                self.logger.error(f"Error caching the dependencies of {item['path']}: {e}")
         return dependencies
 
     def _iter_requirement_lines(self, content: str):
@@ -157,7 +262,7 @@ class ModfileParser:
 
         return depinfo
 
-    def get_and_parse_requirements(self, item) -> list:
+    def parse_requirements(self, item, content: str) -> list:
         """
         Parse requirements.txt file
         Handles:
@@ -171,74 +276,54 @@ class ModfileParser:
            - Direct download URLs (https://example.com/pkg.tar.gz)
         """
         dependencies = []
-        self.logger.debug(f"Downloading contents of {item['name']} from {item['url']}")
-        response = requests.get(
-            item["url"],
-            proxies=self.proxies,
-            verify=False,
-            headers=self.headers,
-            timeout=10,
-        )
-        if response.status_code == 200:
-            decoded_content = b64decode(response.json()["content"]).decode("utf-8")
-            for line in self._iter_requirement_lines(decoded_content):
-                try:
-                    req = Requirement(line)
-                    dependencies.append(self._parse_requirement_line(req))
-                except InvalidRequirement as e:
-                    # packaging.Requirement only accepts PEP 508 syntax (name @ url).
-                    # Older-style bare URLs/VCS refs (e.g. "git+https://...#egg=pkg")
-                    # that pkg_resources used to accept will land here instead.
-                    if line.startswith(self._VCS_PREFIXES) or self.is_url(line):
-                        dependencies.append(self._parse_bare_url_line(line))
-                    else:
-                        self.logger.debug(
-                            f"Error parsing requirement line '{line}' in {item['name']}: {e}"
-                        )
+        for line in self._iter_requirement_lines(content):
+            try:
+                req = Requirement(line)
+                dependencies.append(self._parse_requirement_line(req))
+            except InvalidRequirement as e:
+                # packaging.Requirement only accepts PEP 508 syntax (name @ url).
+                # Older-style bare URLs/VCS refs (e.g. "git+https://...#egg=pkg")
+                # that pkg_resources used to accept will land here instead.
+                if line.startswith(self._VCS_PREFIXES) or self.is_url(line):
+                    dependencies.append(self._parse_bare_url_line(line))
+                else:
+                    self.logger.debug(
+                        f"Error parsing requirement line '{line}' in {item['name']}: {e}"
+                    )
         return dependencies
 
-    def get_and_parse_pipfile(self, item) -> list:
+    def parse_pipfile(self, item, content: str) -> list:
         """Parser for Pipfile"""
-        return self.get_and_parse_toml(item=item)
+        return self.parse_toml(item=item, content=content)
 
-    def get_and_parse_toml(self, item) -> list:
+    def parse_toml(self, item, content: str) -> list:
         """Pipfiles are just toml syntax"""
 
         dependencies = []
-        self.logger.debug(f"Downloading contents of {item['name']} from {item['url']}")
-        response = requests.get(
-            item["url"],
-            proxies=self.proxies,
-            verify=False,
-            headers=self.headers,
-            timeout=10,
-        )
-        if response.status_code == 200:
-            decoded_content = b64decode(response.json()["content"]).decode("utf-8")
-            try:
-                toml_content = toml.loads(decoded_content)
-
-                for section in ("packages", "dev-packages"):
-                    if section in toml_content:
-                        for name, details in toml_content[section].items():
-                            if isinstance(details, str):
-                                semver_string = details
-                                url = None
-                            elif isinstance(details, dict):
-                                semver_string = details.get("version", "*")
-                                url = details.get("path") or details.get("git")
-                            else:
-                                continue
-
-                            dependencies.append(
-                                DependencyInfo(
-                                    name=name,
-                                    semver_string=semver_string,
-                                    url=url
-                                ) 
-                            )
-            except Exception as e:
-                self.logger.error(f"Error parsing toml file {item['name']}: {e}")
+        try:
+            toml_content = toml.loads(content)
+
+            for section in ("packages", "dev-packages"):
+                if section in toml_content:
+                    for name, details in toml_content[section].items():
+                        if isinstance(details, str):
+                            semver_string = details
+                            url = None
+                        elif isinstance(details, dict):
+                            semver_string = details.get("version", "*")
+                            url = details.get("path") or details.get("git")
+                        else:
+                            continue
+
+                        dependencies.append(
+                            DependencyInfo(
+                                name=name,
+                                semver_string=semver_string,
+                                url=url
+                            ) 
+                        )
+        except Exception as e:
+            self.logger.error(f"Error parsing toml file {item['name']}: {e}")
 
         return dependencies
 
@@ -328,7 +413,7 @@ class ModfileParser:
         """Check if the value is a remote tarball URL"""
         return value.endswith(".tgz") or value.endswith(".tar.gz")
 
-    def get_and_parse_package_json(self, item) -> list:
+    def parse_package_json(self, item, content: str) -> list:
         """
         Parser for package.json
         https://docs.npmjs.com/cli/v11/configuring-npm/package-json#dependencies
@@ -338,171 +423,121 @@ class ModfileParser:
         """
         dependencies = []
 
-        self.logger.debug(f"Downloading contents of {item['name']} from {item['url']}")
-        response = requests.get(
-            item["url"],
-            proxies=self.proxies,
-            verify=False,
-            headers=self.headers,
-            timeout=10,
-        )
-        if response.status_code == 200:
-            decoded_content = b64decode(response.json()["content"]).decode("utf-8")
-            try:
-                package_data = json.loads(decoded_content)
-                for section in [
-                    "dependencies",
-                    "devDependencies",
-                    "peerDependencies",
-                    "optionalDependencies",
-                ]:
-                    if section in package_data:
-                        for dependency_name, value in package_data[section].items():
-                            semver_string = "latest"
-                            dependency_url = ""
-                            if value=="*":
-                                semver_string = value
-                            elif self._is_semver(value):
-                                semver_string = value
-                            elif self._is_package_npm_url(value):
-                                dependency_url = value
-                            elif self._is_package_github_url(value):
-                                dependency_url, semver_string = (
-                                    self._parse_github_dependency(value)
-                                )
-                            elif self._is_package_remote_tar_url(value):
-                                dependency_url = value
-                            elif self._is_package_local_path(value):
-                                dependency_url = value
-                                self.logger.debug(
-                                    f"Package {dependency_name} with value {value} looks like a local path. Ignoring this one."
-                                )
-                                continue
-                            else:
-                                self.logger.warning(
-                                    f"Unknown dependency value format: {value}"
-                                )
-                            dependencies.append(
-                                DependencyInfo(
-                                    name=dependency_name,
-                                    semver_string=semver_string,
-                                    url=dependency_url
-                                ) 
-                            )
-            except Exception as e:
-                self.logger.error(f"Error parsing json of file {item['name']}: {e}")
-        return dependencies
-
-    def get_and_parse_gomod(self, item) -> list:
-        """Parses the go.mod file and try to find the modules following the same rules as described here: https://go.dev/ref/mod#vcs-find"""
-        modules = []
-        module_path = ""
-        vcs_protos = ["https", "bzr+ssh", "git+ssh", "ssh", "svn-ssh"]
-        vcs_qualifiers = [".bzr", ".fossil", ".git", ".hg", ".svn"]
-        append_query = "?go-get=1"
         try:
-            self.logger.debug(
-                f"Downloading contents of {item['name']} from {item['url']}"
-            )
-            response = requests.get(
-                item["url"],
-                proxies=self.proxies,
-                verify=False,
-                headers=self.headers,
-                timeout=10,
-            )
-            if response.status_code == 200:
-                decoded_content = b64decode(response.json()["content"]).decode("utf-8")
-
-                # Parse go.mod file to extract dependencies
-                in_require_block = False
-                for line in decoded_content.splitlines():
-                    line = line.strip()
-                    if line.startswith("require ("):
-                        in_require_block = True
-                        continue
-                    if line.startswith(")"):
-                        in_require_block = False
-                        continue
-
-                    # If we are within a require block or the line starts with the require keyword:
-                    if ((re.match(r" v\d", line)) is not None) and (
-                        in_require_block or line.startswith("require ")
-                    ):
-                        # Remove any trailining comments from the line
-                        sline = line.split(" ")
-                        # go.mod parts (1: path, 2: version)
-                        path = sline[0]
-                        semver_string = sline[1]
-                        module_path = path
-
-                        # If the module path has a VCS qualifier (one of .bzr, .fossil, .git, .hg, .svn) at the end of a path component, the go command will use everything up to that path qualifier as the repository URL.
-                        # https://go.dev/ref/mod#vcs-find
-                        present_vcs = set(
-                            map(
-                                lambda vcs: vcs if vcs in module_path else None,
-                                vcs_qualifiers,
+            package_data = json.loads(content)
+            for section in [
+                "dependencies",
+                "devDependencies",
+                "peerDependencies",
+                "optionalDependencies",
+            ]:
+                if section in package_data:
+                    for dependency_name, value in package_data[section].items():
+                        semver_string = "latest"
+                        dependency_url = ""
+                        if value=="*":
+                            semver_string = value
+                        elif self._is_semver(value):
+                            semver_string = value
+                        elif self._is_package_npm_url(value):
+                            dependency_url = value
+                        elif self._is_package_github_url(value):
+                            dependency_url, semver_string = (
+                                self._parse_github_dependency(value)
                             )
-                        )
-                        present_vcs.remove(None)
-                        if len(present_vcs) > 0:
-                            # Get the module url up tho the vcs part
-                            vcs = present_vcs.pop()
+                        elif self._is_package_remote_tar_url(value):
+                            dependency_url = value
+                        elif self._is_package_local_path(value):
+                            dependency_url = value
                             self.logger.debug(
-                                f"The module {module_path} of repository {item['name']} has the vcs {vcs}"
+                                f"Package {dependency_name} with value {value} looks like a local path. Ignoring this one."
                             )
-                            rec = re.compile(r"^(?P<url_vcs>.*" + vcs + r").*$")
-                            m = re.match(rec, item["url"])
-                            if m is not None:
-                                module_path = m.groupdict()["url_vcs"]
-
-                        # Separate the module path into its components https://go.dev/ref/mod#vcs-find
-                        # Typically, a module path consists of a repository root path, a directory within the repository (usually empty), and a major version suffix (only for major version 2 or higher).
-                        # This is a simplification of the process. I'm not going to try all the protocols, and default to https://
-                        # Example returning a <meta> tag with the repo info:
-                        # https://k8s.io/apimachinery?go-get=1
-                        goimport_content = ""
-                        if "://" not in module_path and not any(
-                            map(lambda prot: prot in module_path, vcs_protos)
-                        ):
-                            module_path = "https://" + module_path
-
-                        resp = requests.get(
-                            urljoin(module_path, append_query),
-                            proxies=self.proxies,
-                            verify=False,
-                            headers=self.headers,
-                            timeout=10,
-                        )
-                        m = re.match(
-                            r"<meta\s+name=\"go-import\"\s+content=[\"'](?P<goimport_content>.*)[\"']>",
-                            resp.text,
-                        )
-                        repo_path = ""
-                        root_path = ""
-                        if m is not None:
-                            goimport_content = m.groupdict()["goimport_content"]
-                            gcp = goimport_content.split(" ")
-                            root_path = gcp[0]
-                            vcs = gcp[1]
-                            repo_path = gcp[2]
-
-                        modules.append(
+                            continue
+                        else:
+                            self.logger.warning(
+                                f"Unknown dependency value format: {value}"
+                            )
+                        dependencies.append(
                             DependencyInfo(
-                                name=root_path,
+                                name=dependency_name,
                                 semver_string=semver_string,
-                                url=repo_path
-                            )
+                                url=dependency_url
+                            ) 
                         )
+        except Exception as e:
+            self.logger.error(f"Error parsing json of file {item['name']}: {e}")
+        return dependencies
+
+    def _iter_gomod_requirements(self, content: str):
+        """Yields the (module path, version) of the require directives of a go.mod file, in blocks or single lines"""
+        in_require_block = False
+        for line in content.splitlines():
+            # Remove the comments (e.g. // indirect)
+            line = line.split("//", 1)[0].strip()
+            if not line:
+                continue
+            if re.match(r"^require\s*\($", line):
+                in_require_block = True
+                continue
+            if in_require_block and line.startswith(")"):
+                in_require_block = False
+                continue
+            if not in_require_block:
+                if not line.startswith("require "):
+                    continue
+                line = line[len("require "):].strip()
+            # go.mod parts (1: path, 2: version)
+            parts = line.split()
+            if len(parts) >= 2 and re.match(r"^v\d", parts[1]):
+                yield parts[0].strip('"'), parts[1]
+
+    def _resolve_go_modules(self, item, requirements: list) -> list:
+        """
+        Finds the repositories of the (module path, version) requirements following the rules described here: https://go.dev/ref/mod#vcs-find
+        All the modules are resolved at once (concurrently) by the Go module resolver, which caches the repository roots for the whole scan.
+        The modules without repository information keep their module path as name, to be searched in the Go registry.
+        """
+        modules = []
+        failed = set()
+        resolved = self.go_resolver.resolve_many([path for path, _ in requirements], failed=failed)
+        if failed:
+            # Parse the file again in the next scan instead of caching the modules without their repository
+            self._parsing.cacheable = False
+        seen = set()
+        for path, semver_string in requirements:
+            module = resolved.get(path)
+            if module is None:
+                self.logger.debug(f"Could not find the repository of the module {path} of {item['name']}")
+                name, url = path, ""
+            else:
+                name, url = module.root, module.repo_url
+            # Several modules can live in the same repository
+            if (name, url) in seen:
+                continue
+            seen.add((name, url))
+            modules.append(
+                DependencyInfo(
+                    name=name,
+                    semver_string=semver_string,
+                    url=url
+                )
+            )
+        return modules
+
+    def parse_gomod(self, item, content: str) -> list:
+        """Parses the go.mod file and finds the repositories of its modules"""
+        modules = []
+        try:
+            modules = self._resolve_go_modules(item, list(self._iter_gomod_requirements(content)))
         except Exception as e:
             self.logger.error(
-                f"Error downloading and parsing go.mod file {item['name']}: {e}"
+                f"Error parsing go.mod file {item['name']}: {e}"
             )
         return modules
 
-    def get_and_parse_gemfile(self, item) -> list:
+    def parse_gemfile(self, item, content: str) -> list:
         """
-        Downloads the Gemfile and parses it to extract the dependencies
+        Parses the Gemfile to extract the dependencies
         Syntax of gemfiles: https://bundler.io/guides/gemfile.html
         """
         DEFAULT_SOURCE = "https://rubygems.org"
@@ -521,129 +556,400 @@ class ModfileParser:
         gem_name_regex_compiled = re.compile(gem_name_regex)
         version_regex_compiled = re.compile(version_regex)
 
-        self.logger.debug(f"Downloading contents of {item['name']} from {item['url']}")
-        response = requests.get(
-            item["url"],
-            proxies=self.proxies,
-            verify=False,
-            headers=self.headers,
-            timeout=10,
-        )
-        if response.status_code == 200:
-            decoded_content = b64decode(response.json()["content"]).decode("utf-8")
-
-            # Parse lines that start with 'gem'
-            alternate_source_block = False
-            for line in decoded_content.splitlines():
-                line = line.strip()
-                # Find the source if there is one e.g.
-                # source 'http://rubygems.org'
-                previous_source = source = DEFAULT_SOURCE
-                msource = re.match(
-                    r"source\s+['\"](?P<source_url>.*)['\"]\s+(?P<do_keyword>do)$", line
-                )
-                if msource is not None:
-                    msg = msource.groupdict()
-                    if "source_url" in msg:
-                        source = msg["source_url"]
-                    if "do_keyword" in msg:
-                        # We are in a block with an alternative source, so we save the previous source to restore it back when we find the keyword
-                        previous_source = source
-                        source = msg["source_url"]
-                        alternate_source_block = True
-
-                # If we were inside an alternate source block and we find an "end", the block ends
-                if re.match(r"^end$", line) is not None and alternate_source_block:
-                    alternate_source_block = False
-                    source = previous_source
-
-                # Find the gems and their attributes
-                # e.g.:
-                # gem 'nokogiri', :git => 'https://github.com/tenderlove/nokogiri.git', :branch => '1.4'
-                # gem 'rails', '5.0.0'
-                # gem 'rack',  '>=1.0'
-                # gem 'thin',  '~>1.1'
-                if line.startswith("gem"):
-                    # Remove all appended comments in this line
-                    line = re.sub(r"#.*$", "", line).strip()
-                    # Split by commas
-                    parts = [l.strip() for l in line.split(",")]
-                    for part in parts:
-                        # The gem name is specified at the begining as "gem 'gemfile_name'"
-                        m = gem_name_regex_compiled.match(part)
-                        if m is not None:
-                            gem_name = m.groupdict()["gem_name"]
-
-                        # Check if this is the version of the gemfile, which is usually after the gem name
-                        m = version_regex_compiled.match(part)
-                        if m is not None:
-                            semver_string = m.groupdict()["gem_version"]
-
-                        # Alternate sources: for each gem its possible
-                        # e.g.: gem 'my_gem', '1.0', :source => 'https://gems.example.com'
-                        if ":source " in part:
-                            source = (
-                                part.split("=>")[-1]
-                                .strip()
-                                .replace("'", "")
-                                .replace('"', "")
-                            )
+        # Parse lines that start with 'gem'
+        alternate_source_block = False
+        for line in content.splitlines():
+            line = line.strip()
+            # Find the source if there is one e.g.
+            # source 'http://rubygems.org'
+            previous_source = source = DEFAULT_SOURCE
+            msource = re.match(
+                r"source\s+['\"](?P<source_url>.*)['\"]\s+(?P<do_keyword>do)$", line
+            )
+            if msource is not None:
+                msg = msource.groupdict()
+                if "source_url" in msg:
+                    source = msg["source_url"]
+                if "do_keyword" in msg:
+                    # We are in a block with an alternative source, so we save the previous source to restore it back when we find the keyword
+                    previous_source = source
+                    source = msg["source_url"]
+                    alternate_source_block = True
+
+            # If we were inside an alternate source block and we find an "end", the block ends
+            if re.match(r"^end$", line) is not None and alternate_source_block:
+                alternate_source_block = False
+                source = previous_source
+
+            # Find the gems and their attributes
+            # e.g.:
+            # gem 'nokogiri', :git => 'https://github.com/tenderlove/nokogiri.git', :branch => '1.4'
+            # gem 'rails', '5.0.0'
+            # gem 'rack',  '>=1.0'
+            # gem 'thin',  '~>1.1'
+            if line.startswith("gem"):
+                # Remove all appended comments in this line
+                line = re.sub(r"#.*$", "", line).strip()
+                # Split by commas
+                parts = [l.strip() for l in line.split(",")]
+                for part in parts:
+                    # The gem name is specified at the begining as "gem 'gemfile_name'"
+                    m = gem_name_regex_compiled.match(part)
+                    if m is not None:
+                        gem_name = m.groupdict()["gem_name"]
+
+                    # Check if this is the version of the gemfile, which is usually after the gem name
+                    m = version_regex_compiled.match(part)
+                    if m is not None:
+                        semver_string = m.groupdict()["gem_version"]
+
+                    # Alternate sources: for each gem its possible
+                    # e.g.: gem 'my_gem', '1.0', :source => 'https://gems.example.com'
+                    if ":source " in part:
+                        source = (
+                            part.split("=>")[-1]
+                            .strip()
+                            .replace("'", "")
+                            .replace('"', "")
+                        )
 
-                        # There could be a local path:
-                        # e.g.: :path => './vendor/extracted_library'
-                        if ":path " in part or "path: " in part:
-                            gem_path = (
-                                part.split("=>")[-1]
-                                .strip()
-                                .replace("'", "")
-                                .replace('"', "")
-                            )
-                            if len(gem_path) > 0:
-                                # Ignore this gem, as its pulling it from the local hard drive
-                                continue
-
-                        # This part is an attribute like :git => https://xxx.com/bla. E.g.:
-                        # gem 'measurebation', :git => 'git://github.com/tijn/measurebation.git'
-                        m = None
-                        git_url = None
-                        if "git: " in part:
-                            m = re.match(
-                                r"^:git\s+=>\s+['\"](?P<git_url>.*)['\"]$", part
-                            )
-                        if ":git" in part and "=>" in part:
-                            m = re.match(r"^git:\s+['\"](?P<git_url>.*)['\"]$", part)
-
-                        # If there is a match, extract the package
-                        if m is not None:
-                            # Extract the source URL
-                            # TODO: Use regexp to prevent quotes or git@github.com parts in the url, or the protocol
-                            git_url = m.groupdict()["git_url"]
-                            parsed_url = urlparse(git_url)
-                            base = parsed_url.scheme + "://" + parsed_url.netloc
-                            path = parsed_url.path
-                            gem_url = urljoin(base=base, url=path)
-                        # package=part.split(":")[1].strip().replace("git://","https://").replace("'","").replace('"',"")
-
-                    # Build gem URL
-                    # if (urlparse(DEFAULT_SOURCE).netloc!=urlparse(source).netloc):
-                    if git_url is not None and len(git_url) > 0:
-                        # The url is pointed in the gem line to a git repository
-                        gem_url = git_url
-                    else:
-                        # TODO: Check the /gems/ part is required when a gem specify an alternate source
-                        gem_url = f"{source}/api/v1/gems/{gem_name}.json"
-
-                    if len(gem_name) > 0:
-                        dependencies.append(
-                            DependencyInfo(
-                                name=gem_name,
-                                semver_string=semver_string,
-                                url=gem_url
-                            )
+                    # There could be a local path:
+                    # e.g.: :path => './vendor/extracted_library'
+                    if ":path " in part or "path: " in part:
+                        gem_path = (
+                            part.split("=>")[-1]
+                            .strip()
+                            .replace("'", "")
+                            .replace('"', "")
+                        )
+                        if len(gem_path) > 0:
+                            # Ignore this gem, as its pulling it from the local hard drive
+                            continue
+
+                    # This part is an attribute like :git => https://xxx.com/bla. E.g.:
+                    # gem 'measurebation', :git => 'git://github.com/tijn/measurebation.git'
+                    m = None
+                    git_url = None
+                    if "git: " in part:
+                        m = re.match(
+                            r"^:git\s+=>\s+['\"](?P<git_url>.*)['\"]$", part
                         )
+                    if ":git" in part and "=>" in part:
+                        m = re.match(r"^git:\s+['\"](?P<git_url>.*)['\"]$", part)
+
+                    # If there is a match, extract the package
+                    if m is not None:
+                        # Extract the source URL
+                        # TODO: Use regexp to prevent quotes or git@github.com parts in the url, or the protocol
+                        git_url = m.groupdict()["git_url"]
+                        parsed_url = urlparse(git_url)
+                        base = parsed_url.scheme + "://" + parsed_url.netloc
+                        path = parsed_url.path
+                        gem_url = urljoin(base=base, url=path)
+                    # package=part.split(":")[1].strip().replace("git://","https://").replace("'","").replace('"',"")
+
+                # Build gem URL
+                # if (urlparse(DEFAULT_SOURCE).netloc!=urlparse(source).netloc):
+                if git_url is not None and len(git_url) > 0:
+                    # The url is pointed in the gem line to a git repository
+                    gem_url = git_url
+                else:
+                    # TODO: Check the /gems/ part is required when a gem specify an alternate source
+                    gem_url = f"{source}/api/v1/gems/{gem_name}.json"
+
+                if len(gem_name) > 0:
+                    dependencies.append(
+                        DependencyInfo(
+                            name=gem_name,
+                            semver_string=semver_string,
+                            url=gem_url
+                        )
+                    )
 
         return dependencies
 
+    #### Lockfiles ####
+    # The lockfiles list the transitive dependencies too, and can be tens of MB long. They are read line by line or as a stream
+    # of JSON events, without building the whole document in memory, and each name is kept only once while reading.
+
+    @staticmethod
+    def _add_unique(dependencies: dict, locked: tuple):
+        """Adds the (name, semver, url) of a locked package unless its name was already added. Lockfiles repeat names once per version and parent"""
+        if locked is not None and locked[0] and locked[0] not in dependencies:
+            dependencies[locked[0]] = DependencyInfo(name=locked[0], semver_string=locked[1], url=locked[2])
+
+    @staticmethod
+    def _iter_json_entries(content: str, is_entry):
+        """Yields the (path, scalar fields) of the JSON objects whose path matches is_entry, reading the document as a stream of events"""
+        open_entries = {}
+        for path, event, value in iter_json_events(content):
+            if event == "start_map" and is_entry(path):
+                open_entries[path] = {}
+            elif event == "end_map" and path in open_entries:
+                yield path, open_entries.pop(path)
+            elif event in ("string", "number", "boolean") and path[:-1] in open_entries:
+                open_entries[path[:-1]][path[-1]] = value
+
+    @staticmethod
+    def _split_npm_descriptor(descriptor: str) -> tuple:
+        """Splits "name@range" or "@scope/name@range" into the name and the range (empty if there is none)"""
+        at = descriptor.find("@", 1)
+        if at == -1:
+            return descriptor, ""
+        return descriptor[:at], descriptor[at + 1:]
+
+    _NPM_LOCAL_PROTOCOLS = ("workspace:", "link:", "portal:", "file:", "patch:", "exec:")
+
+    def _get_npm_locked_dependency(self, name: str, spec: str, version: str) -> tuple:
+        """
+        Returns the (name, semver, url) of a locked npm package, or None for the local ones (workspaces, links, paths...).
+        spec is where the package comes from: a range, an alias (npm:name@range), a git URL or the tarball it was resolved to.
+        The packages of the registries (the public or a private one) are searched by name in the public registry.
+        """
+        spec = spec or ""
+        if spec.startswith("npm:"):
+            alias_name, alias_range = self._split_npm_descriptor(spec[4:])
+            if alias_range:
+                name, spec = alias_name, alias_range
+            else:
+                spec = spec[4:]
+            if version and version.startswith("npm:"):
+                version = spec
+        if spec.startswith(self._NPM_LOCAL_PROTOCOLS) or self._is_package_local_path(spec):
+            return None
+        if spec.startswith(("git+", "git:", "github:")) or (not self._is_package_remote_tar_url(spec) and self._is_package_github_url(spec)):
+            dependency_url, semver_string = self._parse_github_dependency(spec)
+            return name, semver_string, dependency_url
+        return name, version or spec or "*", ""
+
+    @staticmethod
+    def _is_package_lock_entry(path: tuple) -> bool:
+        # lockfileVersion 2 and 3: {"packages": {"node_modules/a/node_modules/b": {...}}}
+        if len(path) == 2 and path[0] == "packages":
+            return True
+        # lockfileVersion 1: {"dependencies": {"a": {"dependencies": {"b": {...}}}}}
+        return len(path) > 0 and len(path) % 2 == 0 and all(key == "dependencies" for key in path[::2])
+
+    def parse_package_lock(self, item, content: str) -> list:
+        """
+        Parser for package-lock.json (and npm-shrinkwrap.json), all the lockfile versions
+        https://docs.npmjs.com/cli/v11/configuring-npm/package-lock-json
+        """
+        dependencies = {}
+        try:
+            for path, fields in self._iter_json_entries(content, self._is_package_lock_entry):
+                if path[0] == "packages":
+                    # The root package ("") and the workspaces are not installed from a registry
+                    if "node_modules/" not in path[1] or fields.get("link"):
+                        continue
+                    name = fields.get("name") or path[1].rsplit("node_modules/", 1)[1]
+                else:
+                    name = path[-1]
+                version = str(fields.get("version") or "")
+                spec = version if version.startswith("npm:") else fields.get("resolved") or version
+                self._add_unique(dependencies, self._get_npm_locked_dependency(name, spec, version))
+        except Exception as e:
+            self.logger.error(f"Error parsing json of file {item['name']}: {e}")
+        return list(dependencies.values())
+
+    def _iter_yarn_lock_entries(self, content: str):
+        """Yields the (first descriptor, version) of the entries of a yarn.lock file, classic (v1) or berry (v2+) syntax"""
+        descriptor = None
+        for line in io.StringIO(content):
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            if not line[0].isspace():
+                # 'a@^1.0.0, a@^1.1.0:', '"@s/a@^1.0.0", "@s/a@^1.1.0":' or '"a@npm:^1.0.0, a@npm:^1.1.0":'
+                descriptor = line.rstrip(":").split(",")[0].strip().strip('"')
+                if descriptor == "__metadata":
+                    descriptor = None
+                continue
+            # 'version "1.2.0"' in the classic syntax, 'version: 1.2.0' in berry. The fields of the entry are indented by two spaces
+            m = re.match(r'^  version:?\s+"?(?P<version>[^"\s]+)"?$', line)
+            if m is not None and descriptor is not None:
+                yield descriptor, m.group("version")
+                descriptor = None
+
+    def parse_yarn_lock(self, item, content: str) -> list:
+        """
+        Parser for yarn.lock
+        https://classic.yarnpkg.com/lang/en/docs/yarn-lock/ and https://yarnpkg.com/configuration/yarnrc#lockfileFilename
+        """
+        dependencies = {}
+        try:
+            for descriptor, version in self._iter_yarn_lock_entries(content):
+                name, spec = self._split_npm_descriptor(descriptor)
+                self._add_unique(dependencies, self._get_npm_locked_dependency(name, spec, version))
+        except Exception as e:
+            self.logger.error(f"Error parsing yarn.lock file {item['name']}: {e}")
+        return list(dependencies.values())
+
+    def _iter_pnpm_lock_packages(self, content: str):
+        """Yields the keys of the packages section of a pnpm-lock.yaml file"""
+        in_packages = False
+        for line in io.StringIO(content):
+            line = line.rstrip()
+            if not line or line.lstrip().startswith("#"):
+                continue
+            if not line[0].isspace():
+                in_packages = line == "packages:"
+                continue
+            # The packages are indented by two spaces and their fields by four
+            if in_packages and line.startswith("  ") and not line.startswith("   ") and line.endswith(":"):
+                yield line[:-1].strip().strip("'\"")
+
+    def _get_pnpm_locked_dependency(self, key: str) -> tuple:
+        """Returns the (name, semver, url) of a package of pnpm-lock.yaml, or None for the local ones"""
+        # Remove the leading slash (lockfile versions 5 and 6) and the peer dependencies suffix (6 and 9)
+        key = re.sub(r"\(.*\)$", "", key.lstrip("/"))
+        # Lockfile version 5: name/1.0.0 or @scope/name/1.0.0_peer@1.0.0
+        m = re.match(r"^(?P<name>(?:@[^/]+/)?[^/@]+)/(?P<version>\d[^_/]*)", key)
+        if m is not None:
+            name, version = m.group("name"), m.group("version")
+        else:
+            # Lockfile versions 6 and 9: name@1.0.0 or @scope/name@1.0.0
+            name, version = self._split_npm_descriptor(key)
+        if not version:
+            self.logger.debug(f"Unknown pnpm-lock.yaml package: {key}")
+            return None
+        return self._get_npm_locked_dependency(name, version, version)
+
+    def parse_pnpm_lock(self, item, content: str) -> list:
+        """
+        Parser for pnpm-lock.yaml, lockfile versions 5, 6 and 9
+        https://pnpm.io/git#lockfiles
+        """
+        dependencies = {}
+        try:
+            for key in self._iter_pnpm_lock_packages(content):
+                self._add_unique(dependencies, self._get_pnpm_locked_dependency(key))
+        except Exception as e:
+            self.logger.error(f"Error parsing pnpm-lock.yaml file {item['name']}: {e}")
+        return list(dependencies.values())
+
+    def _iter_poetry_lock_packages(self, content: str):
+        """Yields the name, version and source (type, url and reference) of the [[package]] tables of a poetry.lock file"""
+        package = None
+        table = None
+        for line in io.StringIO(content):
+            line = line.strip()
+            if line.startswith("["):
+                if line == "[[package]]":
+                    if package:
+                        yield package
+                    package = {}
+                table = line.strip("[]")
+                continue
+            m = re.match(r'^(?P<key>[\w-]+)\s*=\s*"(?P<value>.*)"$', line)
+            if package is None or m is None:
+                continue
+            if table == "package" and m.group("key") in ("name", "version"):
+                package[m.group("key")] = m.group("value")
+            elif table == "package.source" and m.group("key") in ("type", "url", "reference"):
+                package[f"source_{m.group('key')}"] = m.group("value")
+        if package:
+            yield package
+
+    def parse_poetry_lock(self, item, content: str) -> list:
+        """
+        Parser for poetry.lock
+        The packages of a private index ("legacy" sources) are searched by name in pypi.org, like the ones without source.
+        """
+        dependencies = {}
+        try:
+            for package in self._iter_poetry_lock_packages(content):
+                source_type = package.get("source_type")
+                if source_type in ("directory", "file"):
+                    continue
+                if source_type in ("git", "url"):
+                    locked = (package.get("name"), package.get("source_reference") or package.get("version", "*"), package.get("source_url"))
+                else:
+                    locked = (package.get("name"), package.get("version", "*"), None)
+                self._add_unique(dependencies, locked)
+        except Exception as e:
+            self.logger.error(f"Error parsing poetry.lock file {item['name']}: {e}")
+        return list(dependencies.values())
+
+    def parse_pipfile_lock(self, item, content: str) -> list:
+        """
+        Parser for Pipfile.lock
+        https://pipenv.pypa.io/en/latest/pipfile.html#pipfile-lock
+        """
+        dependencies = {}
+        try:
+            entries = self._iter_json_entries(content, lambda path: len(path) == 2 and path[0] in ("default", "develop"))
+            for path, fields in entries:
+                name = path[1]
+                if "git" in fields:
+                    locked = (name, fields.get("ref", "*"), fields["git"])
+                elif "path" in fields or ("file" in fields and not self.is_url(fields["file"])):
+                    # Installed from the local hard drive
+                    continue
+                else:
+                    locked = (name, fields.get("version", "*"), fields.get("file"))
+                self._add_unique(dependencies, locked)
+        except Exception as e:
+            self.logger.error(f"Error parsing json of file {item['name']}: {e}")
+        return list(dependencies.values())
+
+    def _iter_gemfile_lock_specs(self, content: str):
+        """Yields the (section, remote, name, version) of the gems of the GEM, GIT and PATH sections of a Gemfile.lock"""
+        section = remote = None
+        for line in io.StringIO(content):
+            line = line.rstrip()
+            if not line:
+                continue
+            if not line[0].isspace():
+                section, remote = line.strip(), None
+                continue
+            if line.startswith("  remote: "):
+                remote = line.split(":", 1)[1].strip()
+                continue
+            # The gems are indented by four spaces, their own dependencies by six
+            m = re.match(r"^    (?P<name>[^\s(]+) \((?P<version>[^)]+)\)$", line)
+            if m is not None and section in ("GEM", "GIT", "PATH"):
+                yield section, remote, m.group("name"), m.group("version")
+
+    def parse_gemfile_lock(self, item, content: str) -> list:
+        """
+        Parser for Gemfile.lock
+        The gems of the GEM sections are searched in rubygems.org, even the ones locked from a private remote: an internal gem
+        whose name is free in rubygems.org is what we are looking for. The gems of GIT sections get the URL of their repository.
+        """
+        dependencies = {}
+        try:
+            for section, remote, name, version in self._iter_gemfile_lock_specs(content):
+                if section == "PATH":
+                    # Ignore this gem, as its pulling it from the local hard drive
+                    continue
+                if section == "GIT":
+                    locked = (name, version, remote)
+                else:
+                    locked = (name, version, f"https://rubygems.org/api/v1/gems/{name}.json")
+                self._add_unique(dependencies, locked)
+        except Exception as e:
+            self.logger.error(f"Error parsing Gemfile.lock file {item['name']}: {e}")
+        return list(dependencies.values())
+
+    def parse_gosum(self, item, content: str) -> list:
+        """
+        Parser for go.sum: each module is listed with its versions and the versions of its go.mod file.
+        The repositories of the modules are found like the ones of go.mod
+        """
+        modules = []
+        try:
+            requirements = {}
+            for line in io.StringIO(content):
+                # <module> <version>[/go.mod] <hash>
+                parts = line.split()
+                if len(parts) == 3:
+                    requirements.setdefault(parts[0], parts[1].split("/")[0])
+            modules = self._resolve_go_modules(item, list(requirements.items()))
+        except Exception as e:
+            self.logger.error(f"Error parsing go.sum file {item['name']}: {e}")
+        return modules
+
     def is_url(self, package) -> bool:
         """Check if the package argument is a well-formed URL"""
         parsed = urlparse(package)
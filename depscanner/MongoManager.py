@@ -1,12 +1,13 @@
 import logging
-from pymongo import MongoClient, UpdateOne
+from pymongo import ASCENDING, DESCENDING, InsertOne, MongoClient, ReturnDocument, UpdateOne
 from pymongo.collection import Collection, Cursor
-from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure
 from datetime import datetime
 
 from depscanner.models.Package import Package
 from depscanner.models.Dependency import Dependency
 from depscanner.models.Scope import Scope
+from depscanner.WriteBuffer import WriteBuffer
 
 from bson import ObjectId
 
@@ -29,6 +30,26 @@ def logging_setup(arguments):
 class MongoManager:
     """This class is in charge of interacting with the Mongo database"""
 
+    # Indexes matching the queries of the scanner: (collection, keys, options). Created by ensure_indexes()
+    INDEXES = [
+        ("repositories", [("name", ASCENDING)], {"unique": True}),
+        ("repositories", [("full_name", ASCENDING), ("updated", DESCENDING)], {}),
+        ("repositories", [("owner.login", ASCENDING), ("updated", DESCENDING)], {}),
+        ("repositories", [("last_scan", ASCENDING)], {"sparse": True}),
+        ("packages", [("name", ASCENDING), ("registry", ASCENDING)], {"unique": True}),
+        ("packages", [("registry", ASCENDING), ("present", ASCENDING), ("updated", DESCENDING)], {}),
+        ("dependencies", [("repo_name", ASCENDING), ("package_name", ASCENDING), ("semver", ASCENDING), ("dependency_file", ASCENDING)], {"unique": True}),
+        ("dependencies", [("repo_id", ASCENDING), ("package_id", ASCENDING)], {}),
+        ("dependencies", [("package_id", ASCENDING)], {}),
+        ("explored_orgs", [("name", ASCENDING)], {"unique": True}),
+        ("scopes", [("name", ASCENDING)], {"unique": True}),
+        ("http_cache", [("url", ASCENDING), ("token_id", ASCENDING)], {"unique": True}),
+        ("parsed_depfiles", [("sha", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+        ("scans", [("status", ASCENDING), ("created", DESCENDING)], {}),
+        ("jobs", [("scan_id", ASCENDING), ("key", ASCENDING)], {"unique": True}),
+        ("jobs", [("scan_id", ASCENDING), ("type", ASCENDING), ("status", ASCENDING), ("lease_expires", ASCENDING)], {}),
+    ]
+
     def __init__(
         self, host: str, port: int, database: str, username: str, password: str, logger: logging.Logger = None
     ):
@@ -43,6 +64,8 @@ class MongoManager:
             host=host, port=port, username=username, password=password
         )
         self.db = self.client[database]
+        # Write-behind buffer of the per-row writes, disabled until enable_write_buffer() is called
+        self.write_buffer = None
 
     def _init_db_client(
         self, host: str, port: int, username: str, password: str
@@ -58,8 +81,107 @@ class MongoManager:
 
     def close_database(self):
         """Close connection with the Mongo database"""
+        self.flush()
         self.client.close()
 
+    def enable_write_buffer(self, max_operations: int = 500, flush_interval: float = 2.0):
+        """Buffer the per-row writes of packages and dependencies and write them in bulk"""
+        if self.write_buffer is None:
+            self.write_buffer = WriteBuffer(
+                db=self.db, logger=self.logger, max_operations=max_operations, flush_interval=flush_interval
+            )
+        self.write_buffer.start()
+
+    def flush(self):
+        """Write the buffered operations, if any"""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    def stop_write_buffer(self):
+        """Stop the background flushes and write the buffered operations"""
+        if self.write_buffer is not None:
+            self.write_buffer.stop()
+
+    def get_write_buffer_stats(self) -> dict:
+        """Return the flush counters and latencies of the write buffer, or None if it's not enabled"""
+        return self.write_buffer.get_stats() if self.write_buffer is not None else None
+
+    def ensure_indexes(self):
+        """Create the indexes of INDEXES that don't exist yet. Existing indexes with the same keys and options are left as they are"""
+        for collection, keys, options in self.INDEXES:
+            try:
+                self.db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                # E.g. an index with the same name and different options created by hand
+                self.logger.warning(f"Could not create the index {keys} of {collection}: {e}")
+
+    def _get_query_cursors(self) -> dict:
+        """Cursors of every query pattern of the scanner, with placeholder values, to explain their plans"""
+        placeholder_id = ObjectId()
+        return {
+            "packages by name and registry": self.db.packages.find({"name": "", "registry": ""}),
+            "get_packages(_id)": self.get_packages(_id=placeholder_id),
+            "get_packages(present, registry)": self.get_packages(present=False, registry=""),
+            "get_package_summary": self.db.packages.find({"_id": placeholder_id}, self.PACKAGE_SUMMARY_PROJECTION),
+            "get_package_summaries_by_names": self.get_package_summaries_by_names(names=[""], registry=""),
+            "get_dependencies(repo_id, package_id)": self.get_dependencies(repo_id=placeholder_id, package_id=placeholder_id),
+            "get_dependencies_by_packages": self.get_dependencies_by_packages(repo_id=placeholder_id, package_ids=[placeholder_id]),
+            "update_repository_dependency": self.db.dependencies.find(
+                {"repo_name": "", "package_name": "", "dependency_file": "", "semver": "", "repo_id": placeholder_id}
+            ),
+            "get_company_repos": self.get_company_repos(""),
+            "get_repositories(repo_name)": self.get_repositories(repo_name=""),
+            "get_repositories_by_names": self.get_repositories_by_names([""]),
+            "get_repository_updated(repo_name)": self.get_repository_updated(repo_name=""),
+            "get_repository_summaries(organisation)": self.get_repository_summaries(organisation=""),
+            "get_repository_scan_states": self.get_repository_scan_states(),
+            "get_dependencies(repo_id)": self.get_dependencies(repo_id=placeholder_id),
+            "get_missing_package_summaries": self.get_missing_package_summaries([placeholder_id]),
+            "get_explored_orgs(name)": self.get_explored_orgs(name=""),
+            "get_scopes(name)": self.get_scopes(name=""),
+            "get_http_cache": self.db.http_cache.find({"url": "", "token_id": ""}),
+            "get_parsed_depfiles": self.get_parsed_depfiles(shas=[""], parser_version=0),
+            "get_scans(unfinished)": self.get_scans(unfinished=True),
+            "lease_job": self.db.jobs.find(
+                {"scan_id": placeholder_id, "type": {"$in": [""]}, "status": "queued"}
+            ).sort("created", ASCENDING),
+        }
+
+    @staticmethod
+    def _get_plan_stages(plan) -> list[str]:
+        """Return all the stages of an explain() plan, in any nesting (inputStage, inputStages, queryPlan...)"""
+        stages = []
+        if isinstance(plan, dict):
+            if "stage" in plan:
+                stages.append(plan["stage"])
+            for value in plan.values():
+                stages.extend(MongoManager._get_plan_stages(value))
+        elif isinstance(plan, list):
+            for value in plan:
+                stages.extend(MongoManager._get_plan_stages(value))
+        return stages
+
+    def explain_queries(self) -> list[dict]:
+        """
+        Run explain() on every query pattern of the scanner.
+        Returns the query name, the stages of the winning plan and whether it scans the whole collection or sorts in memory
+        """
+        report = []
+        for name, cursor in self._get_query_cursors().items():
+            try:
+                winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+            except OperationFailure as e:
+                self.logger.error(f"Could not explain the query {name}: {e}")
+                continue
+            stages = self._get_plan_stages(winning_plan)
+            report.append({
+                "query": name,
+                "stages": stages,
+                "collection_scan": "COLLSCAN" in stages,
+                "in_memory_sort": "SORT" in stages,
+            })
+        return report
+
     def save_company_repos(self, company_repos: dict):
         """Save many repositories entries. Retrieved from GitHub API https://api.github.com/orgs/{organisation}/repos"""
         # Check if the repository exists by name, if it exists, it's an upsert command instead of an insert
@@ -116,24 +238,54 @@ class MongoManager:
         """
         pd = package.to_dict()
         pd=self._reduce_package_size(package_dict=pd)
+        if self.write_buffer is not None:
+            return self.write_buffer.add("packages", InsertOne(pd))
         return self.db.packages.insert_one(pd)
 
+    def save_packages(self, packages: list[Package]) -> list[Package]:
+        """
+        Save many packages in a single bulk write.
+        Each package is upserted by name and registry with $setOnInsert, so a package inserted meanwhile by another thread is left untouched.
+        Returns the packages that were actually inserted by this call.
+        """
+        operations = []
+        for package in packages:
+            pd = self._reduce_package_size(package_dict=package.to_dict())
+            operations.append(
+                UpdateOne(
+                    {"name": package.name, "registry": package.registry},
+                    {"$setOnInsert": pd},
+                    upsert=True,
+                )
+            )
+        if not operations:
+            return []
+
+        try:
+            upserted = self.db.packages.bulk_write(operations, ordered=False).bulk_api_result["upserted"]
+        except BulkWriteError as bwe:
+            # Concurrent upserts of the same package can collide in the unique index, the other thread won
+            self.logger.debug(f"Some packages were inserted concurrently: {bwe.details['writeErrors']}")
+            upserted = bwe.details["upserted"]
+        return [packages[u["index"]] for u in upserted]
+
     def update_package(self, package: Package):
         """Update a package entry"""
         package_without_id = package.to_dict()
         package_without_id=self._reduce_package_size(package_dict=package_without_id)
         del package_without_id["_id"]
-        return self.db.packages.update_one(
-            {"name": package.name, "registry": package.registry},
-            {
-                "$set": package_without_id
-            }
-        )
+        query = {"name": package.name, "registry": package.registry}
+        update = {"$set": package_without_id}
+        if self.write_buffer is not None:
+            return self.write_buffer.add("packages", UpdateOne(query, update))
+        return self.db.packages.update_one(query, update)
 
     def save_repository_dependency(
         self, dependency: Dependency
     ) -> Collection:
         """This saves the dependency and the information is extracted from a package object"""
+        if self.write_buffer is not None:
+            return self.write_buffer.add("dependencies", InsertOne(dependency.to_dict()))
         res = None
         try:
             res = self.db.dependencies.insert_one(dependency.to_dict())
@@ -141,12 +293,25 @@ class MongoManager:
             self.logger.debug(f"Duplicate key when inserting dependency: {dependency.to_dict()}")
         return res
 
+    def save_repository_dependencies(self, dependencies: list[Dependency]):
+        """Save many dependencies in a single bulk insert, ignoring the ones that are already in the database"""
+        if not dependencies:
+            return None
+        res = None
+        try:
+            res = self.db.dependencies.insert_many(
+                [dependency.to_dict() for dependency in dependencies], ordered=False
+            )
+        except BulkWriteError as bwe:
+            self.logger.debug(f"Duplicate keys when inserting dependencies: {bwe.details['writeErrors']}")
+        return res
+
     def get_explored_orgs(self, name: str=None, number_repos: int=None) -> Collection:
         """Save an entry in the organisations collection with the number of repositories it has on GitHub"""
         filter={}
         if name:
             filter["name"]=name
-        if name:
+        if number_repos:
             filter["number_repos"]=number_repos
         return self.db.explored_orgs.find(filter,{"name": 1, "number_repos": 1, "updated": 1})
 
@@ -196,14 +361,16 @@ class MongoManager:
         return None
 
     def update_scope(self, scope: Scope) -> Collection:
-        """This updates an scope object"""
+        """This updates an scope object, inserting it if it doesn't exist"""
         scope_without_id = scope.to_dict()
         del scope_without_id["_id"]
         return self.db.scopes.update_one(
             {"name": scope.name},
             {
-                "$set": scope_without_id
+                "$set": scope_without_id,
+                "$setOnInsert": {"_id": scope._id},
             },
+            upsert=True,
         )
 
     def update_repository_dependency(
@@ -212,37 +379,31 @@ class MongoManager:
         """Update a dependency document"""
         dependency_without_id = dependency.to_dict()
         del dependency_without_id["_id"]
-        return self.db.dependencies.update_one(
-            {
-                "repo_name": dependency.repo_name, 
-                "package_name": dependency.package_name, 
-                "dependency_file": dependency.dependency_file,
-                "semver": dependency.semver,
-                "repo_id": dependency.repo_id
-            },
-            {
-                "$set": {
-                    "package_id": dependency.package_id,
-                    "updated": datetime.now()
-                }
+        query = {
+            "repo_name": dependency.repo_name, 
+            "package_name": dependency.package_name, 
+            "dependency_file": dependency.dependency_file,
+            "semver": dependency.semver,
+            "repo_id": dependency.repo_id
+        }
+        update = {
+            "$set": {
+                "package_id": dependency.package_id,
+                "updated": datetime.now()
             }
-        )
+        }
+        if self.write_buffer is not None:
+            return self.write_buffer.add("dependencies", UpdateOne(query, update))
+        return self.db.dependencies.update_one(query, update)
 
     def get_company_repos(self, company_name: str):
         """Return all repositories of this company"""
-        repositories = self.db.repositories.find({"owner.login": company_name})
-        if repositories:
-            repositories.sort("timestamp")
-
-        return repositories
+        return self.db.repositories.find({"owner.login": company_name}).sort("updated", DESCENDING)
     
     def get_organisation_names(self)->list[str]:
         """Return all repositories of this company"""
-        organisation_names = set()
-        for org in list(self.db.repositories.find({},{"_id":0, "owner.login": 1})):
-            organisation_names.add(org['owner']['login'])
-
-        return organisation_names
+        # Answered from the owner.login index without reading the repositories
+        return set(self.db.repositories.distinct("owner.login"))
 
     def get_repository_updated(self, _id: ObjectId=None, repo_name: str = None, organisation: str = None):
         """Return a repository if its in the database"""
@@ -269,6 +430,10 @@ class MongoManager:
 
         return self.db.repositories.find(filter)
 
+    def get_repositories_by_names(self, repo_names: list[str]) -> Cursor:
+        """Return the repositories whose full name is in the list in a single query"""
+        return self.db.repositories.find({"full_name": {"$in": list(repo_names)}})
+
     def get_packages(
         self,
         _id: ObjectId = None,
@@ -298,12 +463,12 @@ class MongoManager:
         if response_code:
             search_filter["response_code"] = response_code
 
-        return self.db.packages.find(search_filter).sort("timestamp")
+        return self.db.packages.find(search_filter).sort("updated", DESCENDING)
 
     def get_dependencies(self, repo_id: ObjectId=None, repo_name: str=None, package_id: ObjectId=None, package_name: str=None):
         """Return a dependency entry between a repository name and a package"""
         filter = {}
-        if repo_name:
+        if repo_id:
             filter["repo_id"] = repo_id
         if repo_name:
             filter["repo_name"] = repo_name
@@ -314,3 +479,162 @@ class MongoManager:
 
         return self.db.dependencies.find(filter)
 
+    # Fields of the package documents read by the scanner: all but the registry metadata, which can be hundreds of KB.
+    # Every other field is included, so updating a package loaded with this projection doesn't reset them to their defaults
+    PACKAGE_SUMMARY_PROJECTION = {
+        "name": 1, "url": 1, "present": 1, "scope": 1, "scope_present": 1, "registry": 1,
+        "language": 1, "response_code": 1, "scope_response_code": 1, "updated": 1,
+    }
+
+    def get_package_summary(self, _id: ObjectId) -> dict:
+        """Return a package without its registry metadata, or None"""
+        return self.db.packages.find_one({"_id": _id}, self.PACKAGE_SUMMARY_PROJECTION)
+
+    def get_package_summaries_by_names(self, names: list[str], registry: str) -> Cursor:
+        """Return the packages of a registry whose name is in the list in a single query, without their registry metadata"""
+        return self.get_packages_by_names(names=names, registry=registry, projection=self.PACKAGE_SUMMARY_PROJECTION)
+
+    def get_repository_summaries(self, organisation: str = None) -> Cursor:
+        """Return only the full name and the updated date of the repositories, of an organisation or all of them"""
+        filter = {}
+        if organisation:
+            filter["owner.login"] = organisation
+        return self.db.repositories.find(filter, {"_id": 0, "full_name": 1, "updated": 1})
+
+    def get_missing_package_summaries(self, package_ids: list[ObjectId]) -> Cursor:
+        """Return the packages of the list that are not present in their registry, without their registry metadata"""
+        return self.db.packages.find(
+            {"_id": {"$in": list(package_ids)}, "present": False}, self.PACKAGE_SUMMARY_PROJECTION
+        )
+
+    def get_repository_scan_states(self) -> Cursor:
+        """Return the full name and the state of the last scan of the repositories scanned before"""
+        return self.db.repositories.find({"last_scan": {"$exists": True}}, {"_id": 0, "full_name": 1, "last_scan": 1})
+
+    def save_repository_scan_state(self, full_name: str, pushed_at: str, tree_sha: str):
+        """Store the pushed_at date and the tree of the default branch of a repository when its scan is completed"""
+        return self.db.repositories.update_one(
+            {"full_name": full_name},
+            {"$set": {"last_scan": {"pushed_at": pushed_at, "tree_sha": tree_sha, "scanned": datetime.now()}}},
+        )
+
+    def create_scan(self, scan: dict) -> ObjectId:
+        """Store a new scan document and return its id"""
+        return self.db.scans.insert_one(scan).inserted_id
+
+    def get_scan(self, scan_id: ObjectId) -> dict:
+        """Return a scan document, or None"""
+        return self.db.scans.find_one({"_id": scan_id})
+
+    def get_scans(self, unfinished: bool = False) -> Cursor:
+        """Return the scans, newest first, without their lists of repositories and pending lookups"""
+        filter = {}
+        if unfinished:
+            filter["status"] = {"$ne": "completed"}
+        return self.db.scans.find(filter, {"repos": 0, "completed": 0, "pending": 0}).sort("created", DESCENDING)
+
+    def update_scan(self, scan_id: ObjectId, update: dict):
+        """Apply an update to a scan document and set its updated date"""
+        update.setdefault("$set", {})["updated"] = datetime.now()
+        return self.db.scans.update_one({"_id": scan_id}, update)
+
+    def save_jobs(self, jobs: list[dict]) -> int:
+        """Insert many jobs in a single bulk insert, ignoring the ones already queued (same scan and key). Returns the number inserted"""
+        if not jobs:
+            return 0
+        try:
+            return len(self.db.jobs.insert_many(jobs, ordered=False).inserted_ids)
+        except BulkWriteError as bwe:
+            self.logger.debug(f"{len(bwe.details['writeErrors'])} jobs were already queued")
+            return bwe.details["nInserted"]
+
+    def lease_job(
+        self, scan_id: ObjectId, types: list[str], worker_id: str, now: datetime, lease_expires: datetime, max_attempts: int
+    ) -> dict:
+        """
+        Atomically take the oldest job of the scan that is queued or whose lease expired, and lease it to the worker.
+        A job whose lease expired max_attempts times (e.g. it kills or hangs its worker) is not taken again.
+        Returns the job, or None if there is none available
+        """
+        return self.db.jobs.find_one_and_update(
+            {
+                "scan_id": scan_id,
+                "type": {"$in": list(types)},
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "leased", "lease_expires": {"$lt": now}, "attempts": {"$lt": max_attempts}},
+                ],
+            },
+            {
+                "$set": {"status": "leased", "lease_owner": worker_id, "lease_expires": lease_expires, "updated": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def fail_expired_jobs(self, scan_id: ObjectId, now: datetime, max_attempts: int) -> int:
+        """Mark as failed the jobs whose lease expired and can't be leased again. Returns the number of jobs marked"""
+        result = self.db.jobs.update_many(
+            {"scan_id": scan_id, "status": "leased", "lease_expires": {"$lt": now}, "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": "failed", "error": "Lease expired", "updated": now}, "$unset": {"lease_expires": ""}},
+        )
+        return result.modified_count
+
+    def update_leased_job(self, job_id: ObjectId, worker_id: str, update: dict):
+        """Update a job only if it's still leased to the worker (the lease may have expired and been taken by another one)"""
+        update.setdefault("$set", {})["updated"] = datetime.now()
+        return self.db.jobs.update_one({"_id": job_id, "status": "leased", "lease_owner": worker_id}, update)
+
+    def count_jobs(self, scan_id: ObjectId) -> dict:
+        """Return the number of jobs of the scan by type and status"""
+        counts = {}
+        for row in self.db.jobs.aggregate([
+            {"$match": {"scan_id": scan_id}},
+            {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}},
+        ]):
+            counts.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+        return counts
+
+    def get_packages_by_names(self, names: list[str], registry: str, projection: dict = None) -> Cursor:
+        """Return the packages of a registry whose name is in the list in a single query"""
+        return self.db.packages.find({"name": {"$in": list(names)}, "registry": registry}, projection)
+
+    def get_dependencies_by_packages(self, repo_id, package_ids: list[ObjectId], projection: dict = None) -> Cursor:
+        """Return the dependencies between a repository and any of the packages in the list in a single query"""
+        return self.db.dependencies.find({"repo_id": repo_id, "package_id": {"$in": list(package_ids)}}, projection)
+
+    def get_http_cache(self, url: str, token_id: str) -> dict:
+        """Return the cached validators and body of a URL for a token, or None"""
+        return self.db.http_cache.find_one({"url": url, "token_id": token_id}, {"_id": 0})
+
+    def save_http_cache(self, url: str, token_id: str, etag: str, last_modified: str, status_code: int, headers: dict, body: bytes):
+        """Store the validators and body of a URL for a token, replacing the previous ones"""
+        return self.db.http_cache.update_one(
+            {"url": url, "token_id": token_id},
+            {"$set": {
+                "etag": etag,
+                "last_modified": last_modified,
+                "status_code": status_code,
+                "headers": headers,
+                "body": body,
+                "updated": datetime.now(),
+            }},
+            upsert=True,
+        )
+
+    def get_parsed_depfiles(self, shas: list[str], parser_version: int) -> Cursor:
+        """Return the parsed dependency files with any of the blob shas in a single query"""
+        return self.db.parsed_depfiles.find({"sha": {"$in": list(shas)}, "parser_version": parser_version}, {"_id": 0})
+
+    def save_parsed_depfile(self, sha: str, name: str, parser_version: int, dependencies: list[dict]):
+        """Store the dependencies parsed from a dependency file blob"""
+        return self.db.parsed_depfiles.update_one(
+            {"sha": sha, "name": name},
+            {"$set": {
+                "parser_version": parser_version,
+                "dependencies": dependencies,
+                "updated": datetime.now(),
+            }},
+            upsert=True,
+        )
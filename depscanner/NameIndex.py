@@ -0,0 +1,127 @@
+import array
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+
+from depscanner.ResolutionCache import ResolutionCache
+
+
+class NameIndex:
+    """
+    Offline index of all the package names published in a registry, stored in a memory-mapped file.
+    The file holds a bloom filter, to answer most of the negative lookups without touching the names,
+    and the sorted names with their offsets, to confirm the positive lookups with a binary search.
+    File layout (little endian):
+        header: magic, number of names, bloom filter size in bits, number of bloom hashes
+        bloom filter bits
+        offsets of the names (count + 1 uint64)
+        names (UTF-8, sorted, normalized the same way as the resolution cache)
+    """
+
+    MAGIC = b"DSNIDX01"
+    HEADER = struct.Struct("<8sQQI4x")
+
+    def __init__(self, path: str, registry: str):
+        self.path = path
+        self.registry = registry
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.bloom_bits, self.bloom_hashes = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a name index file")
+        self._bloom_start = self.HEADER.size
+        self._offsets_start = self._bloom_start + self._bloom_bytes(self.bloom_bits)
+        self._names_start = self._offsets_start + 8 * (self.count + 1)
+
+    @staticmethod
+    def _bloom_bytes(bits: int) -> int:
+        # Keep the offsets aligned to 8 bytes
+        return ((bits + 63) // 64) * 8
+
+    @staticmethod
+    def _bloom_positions(name: bytes, bits: int, hashes: int):
+        """Bit positions of a name in the bloom filter (double hashing)"""
+        digest = hashlib.blake2b(name, digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(hashes):
+            yield (h1 + i * h2) % bits
+
+    def _get_name(self, index: int) -> bytes:
+        start, end = struct.unpack_from("<QQ", self._mmap, self._offsets_start + 8 * index)
+        return self._mmap[self._names_start + start:self._names_start + end]
+
+    def __contains__(self, name: str) -> bool:
+        key = ResolutionCache.normalize_name(self.registry, name).encode("utf-8")
+        for position in self._bloom_positions(key, self.bloom_bits, self.bloom_hashes):
+            if not self._mmap[self._bloom_start + position // 8] & (1 << (position % 8)):
+                return False
+        # Binary search of the sorted names
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self.count and self._get_name(low) == key
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    @classmethod
+    def get_path(cls, directory: str, registry: str) -> str:
+        return os.path.join(directory, f"{registry}.idx")
+
+    @classmethod
+    def build(cls, names, path: str, registry: str, false_positive_rate: float = 0.01) -> int:
+        """Write the index file of a registry from an iterable of names. Returns the number of names indexed"""
+        keys = sorted(set(
+            ResolutionCache.normalize_name(registry, name).encode("utf-8") for name in names if name and name.strip()
+        ))
+        count = len(keys)
+        bits = max(64, int(-count * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(bits / max(count, 1) * math.log(2)))
+
+        bloom = bytearray(cls._bloom_bytes(bits))
+        offsets = [0]
+        for key in keys:
+            for position in cls._bloom_positions(key, bits, hashes):
+                bloom[position // 8] |= 1 << (position % 8)
+            offsets.append(offsets[-1] + len(key))
+
+        # Write to a temporary file and replace the index at once, the scanner may have the old one mapped
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, count, bits, hashes))
+            f.write(bloom)
+            offsets = array.array("Q", offsets)
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            f.write(offsets.tobytes())
+            for key in keys:
+                f.write(key)
+        os.replace(tmp_path, path)
+        return count
+
+    @classmethod
+    def load_all(cls, directory: str, registries: list[str], logger) -> dict:
+        """Open the index files available in the directory for the given registries"""
+        indexes = {}
+        for registry in set(registries):
+            path = cls.get_path(directory, registry)
+            if not os.path.exists(path):
+                continue
+            try:
+                indexes[registry] = cls(path, registry)
+                logger.info(f"📇 Loaded the name index of {registry} ({len(indexes[registry])} names)")
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Error loading the name index {path}: {e}")
+        return indexes
@@ -0,0 +1,183 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from depscanner.GithubGraphQL import GithubGraphQL
+from depscanner.HttpClient import HttpClient
+from depscanner.WorkerPool import WorkerPool
+
+
+class OrgEnumerator:
+    """
+    Enumerate all the repositories of GitHub organisations.
+    In "rest" mode, the first page tells the number of pages (Link header) and the rest of the pages are fetched concurrently in the worker pool.
+    In "graphql" mode, the repositories are paginated with a cursor but each page only has the fields the scanner uses.
+    Several organisations are enumerated in parallel.
+    Either way, the repositories are returned with the same shape as the REST API, keeping only REPO_FIELDS.
+    """
+
+    REPO_FIELDS = (
+        "id",
+        "name",
+        "full_name",
+        "owner",
+        "language",
+        "stargazers_count",
+        "default_branch",
+        "pushed_at",
+        "updated_at",
+        "fork",
+        "archived",
+        "private",
+        "html_url",
+    )
+
+    GRAPHQL_QUERY = """
+    query($login: String!, $cursor: String) {
+      organization(login: $login) {
+        repositories(first: 100, after: $cursor) {
+          pageInfo { hasNextPage endCursor }
+          nodes {
+            databaseId name nameWithOwner owner { login } primaryLanguage { name } stargazerCount
+            defaultBranchRef { name } pushedAt updatedAt isFork isArchived isPrivate url
+          }
+        }
+      }
+    }
+    """
+
+    def __init__(
+        self,
+        http: HttpClient,
+        headers: dict,
+        logger: logging.Logger,
+        pool: WorkerPool,
+        api_base: str = "https://api.github.com",
+        graphql: GithubGraphQL = None,
+        org_workers: int = 4,
+        per_page: int = 100,
+        backoff=None,
+        max_retries: int = 5,
+    ):
+        self.http = http
+        self.headers = headers
+        self.logger = logger
+        self.pool = pool
+        self.api_base = api_base
+        # GraphQL mode is used when a client is given
+        self.graphql = graphql
+        self.org_workers = org_workers
+        self.per_page = per_page
+        # Called with the number of rate limit hits and the url before retrying a page
+        self.backoff = backoff
+        self.max_retries = max_retries
+
+    def _trim(self, repo: dict) -> dict:
+        """Keep only the fields of the repository used by the scanner"""
+        trimmed = {field: repo.get(field) for field in self.REPO_FIELDS}
+        trimmed["owner"] = {"login": (repo.get("owner") or {}).get("login")}
+        return trimmed
+
+    def _get_page(self, organisation: str, page: int) -> requests.Response:
+        """Get a page of repositories of the organisation, retrying on rate limits. Returns None if it failed"""
+        url = f"{self.api_base}/orgs/{organisation}/repos?per_page={self.per_page}&page={page}"
+        wall_hit_times = 0
+        while wall_hit_times <= self.max_retries:
+            response = self.http.get(url, headers=self.headers)
+            if response.status_code in (200, 404):
+                return response
+            if response.status_code in (403, 429):
+                self.logger.info(f"Rate limit exceeded getting the repositories of {organisation} (page {page}, {wall_hit_times} times attempted)")
+                wall_hit_times += 1
+                if self.backoff is not None:
+                    self.backoff(wall_hit_times, url=url)
+            else:
+                break
+        self.logger.error(
+            f"Error getting repositories for {organisation} (page {page}): {response.text} [{response.status_code}]"
+        )
+        return None
+
+    @staticmethod
+    def _get_last_page(response: requests.Response) -> int:
+        """Number of pages, read from the 'last' link of the Link header"""
+        last = response.links.get("last", {}).get("url")
+        if last is None:
+            return 1
+        return int(parse_qs(urlparse(last).query).get("page", ["1"])[0])
+
+    def _get_repositories_rest(self, organisation: str) -> list:
+        first_page = self._get_page(organisation, 1)
+        if first_page is None:
+            return None
+        if first_page.status_code == 404:
+            return []
+
+        repos = first_page.json()
+        last_page = self._get_last_page(first_page)
+        if last_page > 1:
+            self.logger.debug(f"Getting {last_page} pages of repositories of {organisation}")
+            futures = [self.pool.submit(self._get_page, organisation, page) for page in range(2, last_page + 1)]
+            for future in futures:
+                response = future.result()
+                if response is None or response.status_code != 200:
+                    # A partial list would be stored as the complete list of the organisation
+                    return None
+                repos += response.json()
+        return [self._trim(repo) for repo in repos]
+
+    def _get_repositories_graphql(self, organisation: str) -> list:
+        repos = []
+        cursor = None
+        while True:
+            document = self.graphql.query(self.GRAPHQL_QUERY, {"login": organisation, "cursor": cursor})
+            if document is None or document.get("data") is None:
+                return None
+            org = document["data"].get("organization")
+            if org is None:
+                return []
+            for node in org["repositories"]["nodes"]:
+                repos.append(
+                    {
+                        "id": node["databaseId"],
+                        "name": node["name"],
+                        "full_name": node["nameWithOwner"],
+                        "owner": {"login": node["owner"]["login"]},
+                        "language": (node.get("primaryLanguage") or {}).get("name"),
+                        "stargazers_count": node["stargazerCount"],
+                        "default_branch": (node.get("defaultBranchRef") or {}).get("name"),
+                        "pushed_at": node["pushedAt"],
+                        "updated_at": node["updatedAt"],
+                        "fork": node["isFork"],
+                        "archived": node["isArchived"],
+                        "private": node["isPrivate"],
+                        "html_url": node["url"],
+                    }
+                )
+            page_info = org["repositories"]["pageInfo"]
+            if not page_info["hasNextPage"]:
+                return repos
+            cursor = page_info["endCursor"]
+
+    def get_repositories(self, organisation: str) -> list:
+        """
+        Return all the repositories of the organisation.
+        An empty list if the organisation doesn't exist, None if the enumeration failed.
+        """
+        try:
+            if self.graphql is not None:
+                return self._get_repositories_graphql(organisation)
+            return self._get_repositories_rest(organisation)
+        except Exception as e:
+            self.logger.error(f"Error getting repositories for {organisation}: {e}")
+            return None
+
+    def get_many(self, organisations: list[str]) -> dict:
+        """Enumerate the organisations in parallel. Returns the repositories (or None) of each organisation"""
+        if not organisations:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.org_workers, thread_name_prefix="orgs") as executor:
+            results = executor.map(self.get_repositories, organisations)
+            return dict(zip(organisations, results))
@@ -0,0 +1,44 @@
+import logging
+
+from depscanner.ModfileParser import DependencyInfo
+from depscanner.MongoManager import MongoManager
+
+
+class ParseCache:
+    """
+    Persistent cache of the parsed dependency files, keyed by the git blob sha of the file and its name
+    (the same content is parsed differently depending on the file name).
+    The code search and tree items carry the blob sha, so an unchanged file is neither downloaded nor parsed again.
+    """
+
+    # Increase it when a parser changes, so the files parsed by the old parsers are parsed again
+    PARSER_VERSION = 3
+
+    def __init__(self, mongomgr: MongoManager, logger: logging.Logger):
+        self.mongomgr = mongomgr
+        self.logger = logger
+
+    def get_many(self, items: list) -> list:
+        """Return the cached dependencies aligned with the items, None for the files not cached"""
+        keys = [(item.get("sha"), item["name"]) for item in items]
+        shas = [sha for sha, _ in keys if sha]
+        if not shas:
+            return [None] * len(items)
+        cached = {
+            (doc["sha"], doc["name"]): [DependencyInfo.from_dict(d) for d in doc.get("dependencies", [])]
+            for doc in self.mongomgr.get_parsed_depfiles(shas, parser_version=self.PARSER_VERSION)
+        }
+        hits = [cached.get(key) for key in keys]
+        self.logger.debug(f"{sum(hit is not None for hit in hits)}/{len(items)} dependency files already parsed")
+        return hits
+
+    def save(self, item: dict, dependencies: list[DependencyInfo]):
+        """Store the dependencies parsed from the blob of the item"""
+        if not item.get("sha"):
+            return
+        self.mongomgr.save_parsed_depfile(
+            sha=item["sha"],
+            name=item["name"],
+            parser_version=self.PARSER_VERSION,
+            dependencies=[d.to_dict() for d in dependencies],
+        )
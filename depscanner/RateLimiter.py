@@ -0,0 +1,201 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+
+class ResourceBucket:
+    """Quota of a GitHub API resource (core, search, code_search, graphql) of a token, as reported by the last responses"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0  # Epoch when the quota is restored
+        self.blocked_until = 0.0  # Set by Retry-After or an exhausted quota
+        self.next_slot = 0.0  # Next time a request can be sent when the requests are being paced
+
+
+class RateLimiter:
+    """
+    Scheduler of the GitHub API requests, with one bucket per token and rate limit resource.
+    The buckets are fed from the X-RateLimit-* and Retry-After headers of every response.
+    Before sending a request:
+     - The token with the most quota left for the resource of the request is picked. Exhausted tokens (or the ones GitHub
+       asked to retry later) are out of the rotation until their reset.
+     - If all the tokens are exhausted the request waits until the first reset, plus some jitter
+       so the waiting threads don't hit the API all at the same time.
+     - If less than pace_below of the quota of the token is left, its remaining requests are spread evenly until the reset
+       instead of burning them and hitting the wall.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        tokens: list[str] = None,
+        jitter: float = 0,
+        pace_below: float = 0.2,
+        reserve: int = 0,
+    ):
+        self.logger = logger
+        # None stands for the unauthenticated requests
+        self.tokens = list(tokens) if tokens else [None]
+        self.disabled = set()
+        self.jitter = jitter or 0
+        self.pace_below = pace_below
+        # Requests of each resource never used, e.g. to leave some quota for other tools using the same token
+        self.reserve = reserve
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_resource(url: str) -> str:
+        """Rate limit resource of a GitHub API endpoint"""
+        path = urlparse(url).path
+        if path.startswith("/search/code"):
+            return "code_search"
+        if path.startswith("/search/"):
+            return "search"
+        if path.startswith("/graphql"):
+            return "graphql"
+        return "core"
+
+    @staticmethod
+    def mask(token: str) -> str:
+        """Printable name of a token"""
+        return f"...{token[-4:]}" if token else "anonymous"
+
+    def _get_bucket(self, token: str, resource: str) -> ResourceBucket:
+        if (token, resource) not in self.buckets:
+            self.buckets[(token, resource)] = ResourceBucket(resource)
+        return self.buckets[(token, resource)]
+
+    def _get_wait(self, bucket: ResourceBucket, now: float) -> float:
+        """Seconds to wait until the resource can be used again. 0 if it's not blocked"""
+        if bucket.reset and now >= bucket.reset:
+            # A new window started, the quota will be known again with the next response
+            bucket.remaining = None
+            bucket.reset = 0.0
+        if bucket.blocked_until > now:
+            return bucket.blocked_until - now
+        if bucket.remaining is not None and bucket.remaining <= self.reserve and bucket.reset > now:
+            return bucket.reset - now
+        return 0
+
+    def _get_active_tokens(self) -> list:
+        active = [token for token in self.tokens if token not in self.disabled]
+        # If all the tokens were rejected, keep using them so the errors are visible to the callers
+        return active or self.tokens
+
+    def _select_token(self, resource: str, now: float) -> tuple:
+        """Return the available token with the most quota left, or None and the time until the first token is available"""
+        best_token, best_remaining, min_wait = None, None, None
+        for token in self._get_active_tokens():
+            bucket = self._get_bucket(token, resource)
+            wait = self._get_wait(bucket, now)
+            if wait > 0:
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+                continue
+            # Tokens with an unknown quota haven't been used in this window yet
+            remaining = bucket.remaining if bucket.remaining is not None else float("inf")
+            if best_remaining is None or remaining > best_remaining:
+                best_token, best_remaining = token, remaining
+        if best_remaining is None:
+            return None, min_wait
+        return best_token, 0
+
+    def acquire(self, url: str, token: str = None) -> str:
+        """
+        Block until a request to the url can be sent without exceeding the rate limit of its resource.
+        Returns the token to send the request with. When a token is given, only that token is considered.
+        """
+        resource = self.get_resource(url)
+        while True:
+            with self._lock:
+                now = time.time()
+                if token is not None:
+                    selected, wait = token, self._get_wait(self._get_bucket(token, resource), now)
+                else:
+                    selected, wait = self._select_token(resource, now)
+                if wait <= 0:
+                    bucket = self._get_bucket(selected, resource)
+                    # Spread the remaining requests until the reset
+                    if (
+                        bucket.remaining is not None
+                        and bucket.limit
+                        and bucket.remaining < bucket.limit * self.pace_below
+                    ):
+                        interval = (bucket.reset - now) / max(bucket.remaining - self.reserve, 1)
+                        start = max(now, bucket.next_slot)
+                        bucket.next_slot = start + interval
+                        wait = start - now
+                    if bucket.remaining is not None:
+                        bucket.remaining -= 1
+                    break
+            wait += random.uniform(0, self.jitter)
+            self.logger.info(f"😴 Rate limit of the GitHub {resource} API reached, sleeping for {wait:.0f} seconds")
+            time.sleep(wait)
+
+        if wait > 0:
+            time.sleep(wait)
+        return selected
+
+    def update(self, url: str, response: requests.Response, token: str = None):
+        """Update the bucket of the token and resource with the rate limit headers of a response"""
+        headers = response.headers
+        resource = headers.get("X-RateLimit-Resource") or self.get_resource(url)
+        now = time.time()
+        with self._lock:
+            if response.status_code == 401 and token is not None and token not in self.disabled:
+                self.logger.error(f"🔑 GitHub token {self.mask(token)} was rejected, removing it from the rotation")
+                self.disabled.add(token)
+                return
+
+            bucket = self._get_bucket(token, resource)
+            try:
+                if "X-RateLimit-Remaining" in headers:
+                    remaining = int(headers["X-RateLimit-Remaining"])
+                    reset = float(headers.get("X-RateLimit-Reset", 0))
+                    # Responses of the same window can arrive out of order, keep the lowest count
+                    if bucket.remaining is None or reset != bucket.reset:
+                        bucket.remaining = remaining
+                    else:
+                        bucket.remaining = min(bucket.remaining, remaining)
+                    bucket.reset = reset
+                    bucket.limit = int(headers.get("X-RateLimit-Limit", bucket.limit or 0)) or None
+
+                if response.status_code in (403, 429):
+                    if headers.get("Retry-After"):
+                        # Secondary rate limit
+                        bucket.blocked_until = max(bucket.blocked_until, now + float(headers["Retry-After"]))
+                    elif bucket.remaining == 0 and bucket.reset > now:
+                        bucket.blocked_until = max(bucket.blocked_until, bucket.reset)
+                    if bucket.blocked_until > now and len(self.tokens) > 1:
+                        self.logger.info(
+                            f"🔑 GitHub token {self.mask(token)} exhausted for the {resource} API, "
+                            f"out of the rotation for {bucket.blocked_until - now:.0f} seconds"
+                        )
+            except ValueError as e:
+                self.logger.debug(f"Invalid rate limit headers in the response of {url}: {e}")
+
+    def is_blocked(self, url: str) -> bool:
+        """True if the next request to the url will wait for the rate limit of all the tokens to reset"""
+        with self._lock:
+            _, wait = self._select_token(self.get_resource(url), time.time())
+            return wait > 0
+
+    def get_stats(self) -> dict:
+        """Return the last known quota of each resource, added up for all the tokens"""
+        stats = {}
+        with self._lock:
+            for (token, resource), bucket in self.buckets.items():
+                if token in self.disabled or bucket.remaining is None:
+                    continue
+                quota = stats.setdefault(resource, {"limit": 0, "remaining": 0, "tokens": 0})
+                quota["limit"] += bucket.limit or 0
+                quota["remaining"] += bucket.remaining
+                quota["tokens"] += 1
+        return stats
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+from urllib.parse import urlparse
+
+import aiohttp
+
+from depscanner.HttpClient import HttpClient
+from depscanner.Utils import get_response_emoji
+from depscanner.models.Dependency import Dependency
+from depscanner.models.Package import Package
+from depscanner.WorkerPool import WorkerPool
+
+
+class RegistryResolver:
+    """
+    asyncio engine to resolve packages against the public registries.
+    All the registry lookups run as coroutines on a single event loop living in a background thread,
+    so thousands of requests can be in flight without holding an OS thread each.
+    The number of concurrent requests per registry is limited with one semaphore per registry host.
+    The database calls are blocking, so they are run in the executor of the event loop (the scan-wide worker pool when provided).
+    The requests and errors are counted per host in the shared HttpClient, with the rest of the requests of the scan.
+    """
+
+    MAX_RETRIES = 5
+
+    def __init__(
+        self,
+        dep_scanner,
+        logger: logging.Logger,
+        concurrency: dict = None,
+        default_concurrency: int = 20,
+        timeout: int = 30,
+        proxy: str = None,
+        pool: WorkerPool = None,
+        http: HttpClient = None,
+    ):
+        self.dep_scanner = dep_scanner
+        self.logger = logger
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.timeout = timeout
+        self.proxy = proxy
+        self.pool = pool
+        self.http = http
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.semaphores = {}
+        self._start_lock = threading.Lock()
+
+    #### Event loop management ####
+    def start(self):
+        """Start the event loop in a background thread"""
+        with self._start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self._run_loop, name="RegistryResolver", daemon=True)
+                self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def close(self):
+        """Close the HTTP session and stop the event loop"""
+        if self.loop is None or not self.loop.is_running():
+            return
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+            self.session = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.semaphores = {}
+
+    #### Synchronous facade ####
+    def resolve(self, dependencies: list[Dependency]) -> list[Dependency]:
+        """
+        Resolve the packages of the dependencies in the registries and return the dependencies with their package attribute updated.
+        This method blocks until all the lookups are done, so it can be called from the scanner threads.
+        """
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._resolve_all(dependencies), self.loop)
+        return future.result()
+
+    #### Coroutines ####
+    async def _run_blocking(self, func, *args):
+        """Run a blocking call (e.g. database access) without blocking the event loop"""
+        # Use the scan-wide pool instead of a private executor of the loop
+        executor = self.pool.get_executor() if self.pool is not None else None
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, ssl=False),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    def _get_semaphore(self, netloc: str) -> asyncio.Semaphore:
+        """One semaphore per registry host to limit the requests in flight against it"""
+        if netloc not in self.semaphores:
+            self.semaphores[netloc] = asyncio.Semaphore(
+                int(self.concurrency.get(netloc, self.default_concurrency))
+            )
+        return self.semaphores[netloc]
+
+    async def _resolve_all(self, dependencies: list[Dependency]) -> list[Dependency]:
+        results = await asyncio.gather(
+            *[self._resolve_dependency(dependency) for dependency in dependencies],
+            return_exceptions=True,
+        )
+        resolved = []
+        for dependency, result in zip(dependencies, results):
+            if isinstance(result, BaseException):
+                self.logger.error(f"Error searching for the package {dependency.package_name} in the registries: {result}")
+            else:
+                resolved.append(result)
+        return resolved
+
+    async def _resolve_dependency(self, dependency: Dependency) -> Dependency:
+        """Asynchronous equivalent of DepScanner.search_registries"""
+        package = await self._run_blocking(self.dep_scanner._load_dependency_package, dependency)
+
+        # The URLs given in the dependency file are searched as they are, the rest of the packages are searched by name
+        if not self.dep_scanner._is_searched_by_name(package):
+            await self._resolve_cached(package, self.dep_scanner._get_resolution_key(package))
+        elif package.name is not None and len(package.name) > 0:
+            key = self.dep_scanner._get_resolution_key(package)
+            # No need to ask the registry for the packages we know are published
+            if self.dep_scanner._set_registry_url(package) and not self.dep_scanner._found_in_name_index(package):
+                await self._resolve_cached(package, key, probe=self.dep_scanner.registry_probe.get("enabled", True))
+
+        dependency.package = package
+        return dependency
+
+    async def _resolve_cached(self, package: Package, key: tuple, probe: bool = False) -> Package:
+        """Asynchronous equivalent of DepScanner._resolve_cached"""
+        async def search():
+            return self.dep_scanner._get_resolution(await self._search_by_url(package, probe=probe))
+
+        resolution = await self.dep_scanner.resolution_cache.get_or_compute_async(
+            key, search, cacheable=self.dep_scanner._is_resolution_cacheable
+        )
+        self.dep_scanner._apply_resolution(package, resolution)
+        return package
+
+    async def _request(self, method: str, url: str, netloc: str, **kwargs) -> tuple:
+        """Send a request to a registry respecting its concurrency limit. Returns the status code, the content type and the body"""
+        async with self._get_semaphore(netloc):
+            if self.http is not None:
+                self.http.count_request(netloc)
+            try:
+                async with self._get_session().request(
+                    method, url, proxy=self.proxy, allow_redirects=True, **kwargs
+                ) as response:
+                    text = await response.text(errors="replace") if method != "HEAD" else ""
+                    return response.status, response.headers.get("Content-Type", ""), text
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if self.http is not None:
+                    self.http.count_error(netloc)
+                raise
+
+    async def _head_status(self, url: str) -> int:
+        """Status code of a HEAD request to a registry"""
+        status, _, _ = await self._request("HEAD", url, urlparse(url).netloc)
+        return status
+
+    async def _enrich_package(self, package_object: Package):
+        """Asynchronous equivalent of DepScanner._enrich_package"""
+        package_url, package_netloc = self.dep_scanner._get_package_request_url(package_object)
+        try:
+            status, content_type, text = await self._request(
+                "GET", package_url, package_netloc, headers=self.dep_scanner._get_registry_request_headers()
+            )
+            if status == 200:
+                self.dep_scanner._apply_registry_metadata(package_object, content_type=content_type, text=text)
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            self.logger.debug(f"Error downloading the metadata of {package_url}: {e}")
+
+    async def _search_by_url(self, package_object: Package, probe: bool = False) -> Package:
+        """Asynchronous equivalent of DepScanner.search_registries_by_url"""
+        success_search_pubrepo = False
+        repos_wall_hit_times = 0
+        package_url, package_netloc = self.dep_scanner._get_package_request_url(package_object)
+        method, request_url, request_headers = self.dep_scanner._get_registry_request(package_object, probe=probe)
+
+        while not success_search_pubrepo and repos_wall_hit_times < self.MAX_RETRIES:
+            try:
+                status, content_type, text = await self._request(
+                    method,
+                    request_url,
+                    urlparse(request_url).netloc,
+                    headers=request_headers,
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.logger.error(f"Exception when contacting the HTTP server: {e}")
+                break
+
+            # The registry doesn't answer to the probe, ask for the full document instead
+            if status == 405 and method != "GET":
+                method, request_url, request_headers = self.dep_scanner._get_registry_request(package_object, probe=False)
+                probe = False
+                continue
+
+            try:
+                self.dep_scanner._apply_registry_response(
+                    package_object,
+                    package_netloc=package_netloc,
+                    status_code=self.dep_scanner._get_probe_status_code(status),
+                )
+                # If the package has a scope
+                if package_object.scope is not None and len(package_object.scope) > 0:
+                    scope = await self.dep_scanner.scope_resolver.resolve_async(
+                        package_object.scope, self._head_status, self._run_blocking
+                    )
+                    self.dep_scanner._apply_scope_result(package_object, scope)
+
+                # Check if we have to backoff for a while as we received a forbidden or rate limit response
+                if package_object.response_code in [429, 403]:
+                    self.logger.error(
+                        f"Error searching for {package_url}: Got response code {package_object.response_code}  {get_response_emoji(package_object.response_code)}"
+                    )
+                    repos_wall_hit_times += 1
+                    t = self.dep_scanner.backoffbase * repos_wall_hit_times + random.uniform(0, self.dep_scanner.jitter or 0)
+                    self.logger.info(f"😴 Sleeping for {t:.0f} seconds")
+                    await asyncio.sleep(t)
+                else:
+                    success_search_pubrepo = True
+                    if not probe:
+                        self.dep_scanner._apply_registry_metadata(package_object, content_type=content_type, text=text)
+                    elif package_object.present and self.dep_scanner.registry_probe.get("enrich_present", False):
+                        await self._enrich_package(package_object)
+
+            except json.JSONDecodeError as je:
+                self.logger.error(f"Error decoding the JSON response of {package_url}. Did we store the correct API endpoint?: {je}")
+
+            except Exception as e:
+                self.logger.error(f"Error searching for {package_url}: {e}")
+                break
+
+        return package_object
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ResolutionCache:
+    """
+    In-process cache of the registry lookups, keyed by (registry, normalized name).
+    - Entries expire after ttl seconds and the least recently used ones are evicted beyond max_entries.
+    - Concurrent lookups of the same key share a single in-flight request (for both the threads and the asyncio resolver):
+      the first caller computes the value and the rest wait for it.
+    - Failed lookups are not cached, so the next caller tries again.
+    """
+
+    def __init__(self, logger: logging.Logger, ttl: int = 3600, max_entries: int = 10000):
+        self.logger = logger
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expiration, value)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> concurrent.futures.Future
+        self._in_flight_async = {}  # key -> asyncio.Future, only used from the event loop thread
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize_name(registry: str, name: str) -> str:
+        """Normalize a package name the way its registry does, so the different spellings share an entry"""
+        name = (name or "").strip()
+        if registry == "pypi.org":
+            # PEP 503
+            return re.sub(r"[-_.]+", "-", name).lower()
+        return name
+
+    @classmethod
+    def get_key(cls, registry: str, name: str) -> tuple:
+        return (registry, cls.normalize_name(registry, name))
+
+    def get(self, key: tuple):
+        """Return the cached value of the key, or None if it's not cached or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expiration, value = entry
+            if expiration < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_or_compute(self, key: tuple, func, cacheable=None):
+        """
+        Return the cached value of the key, or compute it with func().
+        If another thread is already computing the key, wait for its result instead.
+        The value is only cached if cacheable(value) is True (when given).
+        """
+        value = self.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = func()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    async def get_or_compute_async(self, key: tuple, coro_func, cacheable=None):
+        """Asynchronous equivalent of get_or_compute. coro_func() returns the coroutine computing the value"""
+        value = self.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        future = self._in_flight_async.get(key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight_async[key] = future
+        self._count("misses")
+        try:
+            value = await coro_func()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved if nobody was waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight_async[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """Return the hit, miss, coalesced and eviction counters and the number of entries"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
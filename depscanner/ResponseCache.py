@@ -0,0 +1,77 @@
+import hashlib
+import logging
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from depscanner.MongoManager import MongoManager
+
+
+class ResponseCache:
+    """
+    Persistent cache of HTTP validators (ETag and Last-Modified) and bodies, keyed by URL and token and stored in Mongo.
+    GitHub doesn't count a 304 Not Modified response against the rate limit,
+    so re-scanning the same organisations only costs quota for the data that changed.
+    The same URL can answer differently to each token (e.g. the private repositories it can see), so the entries of a token are never served to another one.
+    """
+
+    # Response headers kept with the cached body. Link is needed to follow the pagination of cached pages
+    KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Link")
+
+    def __init__(self, mongomgr: MongoManager, logger: logging.Logger, max_body_bytes: int = 8 * 1024 * 1024):
+        self.mongomgr = mongomgr
+        self.logger = logger
+        # Mongo documents can't be larger than 16MB
+        self.max_body_bytes = max_body_bytes
+
+    @staticmethod
+    def get_token_id(headers: dict) -> str:
+        """Identifier of the token of a request: a hash of its Authorization header, or an empty string for the anonymous requests"""
+        authorization = CaseInsensitiveDict(headers or {}).get("Authorization")
+        if not authorization:
+            return ""
+        return hashlib.sha256(authorization.encode()).hexdigest()[:16]
+
+    def add_validators(self, url: str, token_id: str, headers: dict) -> dict:
+        """Return the cached entry of the URL for the token (or None) and add the conditional headers to the request headers"""
+        cached = self.mongomgr.get_http_cache(url, token_id)
+        if cached is None:
+            return None
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return cached
+
+    def build_response(self, cached: dict, not_modified: requests.Response) -> requests.Response:
+        """Build the response of a 304 Not Modified from the cached body"""
+        response = requests.Response()
+        response.status_code = cached["status_code"]
+        response._content = bytes(cached["body"])
+        response.headers = CaseInsensitiveDict(cached.get("headers", {}))
+        # Keep the fresh headers of the 304 response, such as the rate limit ones
+        response.headers.update(not_modified.headers)
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    def save(self, url: str, token_id: str, response: requests.Response):
+        """Store the validators and the body of a successful response to the token"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        if len(response.content) > self.max_body_bytes:
+            self.logger.debug(f"Not caching the response of {url}: body too large ({len(response.content)} bytes)")
+            return
+        self.mongomgr.save_http_cache(
+            url=url,
+            token_id=token_id,
+            etag=etag,
+            last_modified=last_modified,
+            status_code=response.status_code,
+            headers={k: response.headers[k] for k in self.KEEP_HEADERS if k in response.headers},
+            body=response.content,
+        )
@@ -0,0 +1,96 @@
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from depscanner.MongoManager import MongoManager
+
+
+class ScanCheckpoint:
+    """
+    Persistent state of a scan, stored in the scans collection, so a scan killed halfway can be resumed.
+    - The targets and options of the scan, and the list of repositories to explore once it's resolved.
+    - The repositories completed. A repository is marked only after the buffered database writes are flushed,
+      so everything it found is already in the database.
+    - The registry lookups in flight of each repository (the package ids being searched). The packages are saved before
+      being searched, so a resumed scan would take them as fresh and never search them without this list.
+    """
+
+    def __init__(self, mongomgr: MongoManager, logger: logging.Logger):
+        self.mongomgr = mongomgr
+        self.logger = logger
+        self.scan_id = None
+        self.completed = set()
+
+    def start(self, targets: dict, options: dict) -> str:
+        """Create the scan document and return the scan id"""
+        now = datetime.now()
+        self.scan_id = self.mongomgr.create_scan({
+            "status": "running",
+            "created": now,
+            "updated": now,
+            "targets": targets,
+            "options": options,
+            "repos": None,
+            "total_repos": 0,
+            "completed": [],
+            "completed_repos": 0,
+            "pending": {},
+        })
+        self.completed = set()
+        return str(self.scan_id)
+
+    def get(self, scan_id: str) -> dict:
+        """Return the scan document of a scan without changing it. Raises ValueError if the scan doesn't exist"""
+        try:
+            scan = self.mongomgr.get_scan(ObjectId(scan_id))
+        except InvalidId:
+            scan = None
+        if scan is None:
+            raise ValueError(f"Scan {scan_id} not found")
+        return scan
+
+    def load(self, scan_id: str) -> dict:
+        """Load the scan document of a scan to resume it. Raises ValueError if the scan doesn't exist"""
+        scan = self.get(scan_id)
+        self.scan_id = scan["_id"]
+        self.completed = set(scan.get("completed") or [])
+        self.mongomgr.update_scan(self.scan_id, {"$set": {"status": "running"}})
+        return scan
+
+    def set_repositories(self, repo_full_names: list[str]):
+        """Store the list of repositories to explore, once the targets are resolved"""
+        self.mongomgr.update_scan(
+            self.scan_id, {"$set": {"repos": repo_full_names, "total_repos": len(repo_full_names)}}
+        )
+
+    def set_queued(self):
+        """Record that all the repositories of a distributed scan are in the job queue"""
+        self.mongomgr.update_scan(self.scan_id, {"$set": {"queued": True}})
+
+    def add_pending(self, repo_id, package_ids: list[ObjectId]):
+        """Record the packages of a repository about to be searched in the registries"""
+        if len(package_ids) > 0:
+            self.mongomgr.update_scan(
+                self.scan_id, {"$addToSet": {f"pending.{repo_id}": {"$each": list(package_ids)}}}
+            )
+
+    def complete_repository(self, repo_id, repo_full_name: str):
+        """Mark a repository as completed and forget its pending lookups"""
+        # What the repository found must be in the database before it's skipped by a resumed scan
+        self.mongomgr.flush()
+        self.completed.add(repo_full_name)
+        self.mongomgr.update_scan(
+            self.scan_id,
+            {
+                "$addToSet": {"completed": repo_full_name},
+                "$inc": {"completed_repos": 1},
+                "$unset": {f"pending.{repo_id}": ""},
+            },
+        )
+
+    def finish(self, status: str = "completed"):
+        """Set the final status of the scan"""
+        if self.scan_id is not None:
+            self.mongomgr.update_scan(self.scan_id, {"$set": {"status": status, "pending": {}}})
@@ -0,0 +1,143 @@
+import logging
+import queue
+import threading
+
+
+class PipelineStage:
+    """
+    A stage of the scan pipeline.
+    The function of the stage receives one item and returns the list of items handed to the next stage.
+    An empty list (or None) means the item finished its journey through the pipeline in this stage.
+    When a batch_size is set, the function receives a list with the items already waiting in the queue (up to batch_size)
+    and returns one list of outputs per item.
+    """
+
+    def __init__(self, name: str, func, workers: int = 1, queue_size: int = 100, batch_size: int = None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+
+class ScanPipeline:
+    """
+    Staged pipeline connecting the stages with bounded queues.
+    Each stage has its own worker threads. When the queue of a stage is full the previous stage blocks,
+    so a slow stage applies backpressure to the ones before it instead of letting the work pile up in memory.
+    This way the latency of the different stages (e.g. GitHub API and registries) overlaps instead of adding up.
+    """
+
+    _SENTINEL = object()
+
+    def __init__(self, stages: list[PipelineStage], logger: logging.Logger, on_item_done=None):
+        self.stages = stages
+        self.logger = logger
+        # Called with the stage name and the item when an item leaves the pipeline (finished, filtered or failed)
+        self.on_item_done = on_item_done
+        self.queues = []
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._counters = {
+            stage.name: {"in_progress": 0, "processed": 0, "errors": 0}
+            for stage in self.stages
+        }
+
+    def _count(self, stage_name: str, counter: str, value: int = 1):
+        with self._lock:
+            self._counters[stage_name][counter] += value
+
+    def _item_done(self, stage: PipelineStage, item):
+        if self.on_item_done is not None:
+            try:
+                self.on_item_done(stage.name, item)
+            except Exception:
+                self.logger.exception(f"Error finishing an item of the stage {stage.name}")
+
+    def _worker(self, index: int, exited: list):
+        stage = self.stages[index]
+        input_queue = self.queues[index]
+        next_queue = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        finished = False
+        while not finished:
+            item = input_queue.get()
+            if item is self._SENTINEL:
+                break
+
+            # Take the items already waiting in the queue to process them in batch, without waiting for more
+            batch = [item]
+            while stage.batch_size is not None and len(batch) < stage.batch_size:
+                try:
+                    item = input_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._SENTINEL:
+                    finished = True
+                    break
+                batch.append(item)
+
+            self._count(stage.name, "in_progress", len(batch))
+            batch_outputs = [None] * len(batch)
+            try:
+                if stage.batch_size is not None:
+                    batch_outputs = stage.func(batch)
+                else:
+                    batch_outputs = [stage.func(batch[0])]
+            except Exception:
+                self.logger.exception(f"Error in the {stage.name} stage of the pipeline. Moving on.")
+                self._count(stage.name, "errors", len(batch))
+            finally:
+                self._count(stage.name, "in_progress", -len(batch))
+                self._count(stage.name, "processed", len(batch))
+
+            for item, outputs in zip(batch, batch_outputs):
+                if next_queue is not None and outputs:
+                    for output in outputs:
+                        # Blocks while the next stage is full (backpressure)
+                        next_queue.put(output)
+                else:
+                    self._item_done(stage, item)
+
+        # The last worker of this stage to exit tells the workers of the next stage to finish
+        with self._lock:
+            exited[index] += 1
+            last_worker = exited[index] == stage.workers
+        if last_worker and next_queue is not None:
+            for _ in range(self.stages[index + 1].workers):
+                next_queue.put(self._SENTINEL)
+
+    def run(self, items):
+        """Feed the items to the first stage and block until every item went through the pipeline"""
+        self._reset_counters()
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        exited = [0] * len(self.stages)
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index, exited),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            self.queues[0].put(item)
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(self._SENTINEL)
+
+        for thread in threads:
+            thread.join()
+
+    def get_progress(self) -> dict:
+        """Return the number of queued, in progress, processed and failed items of each stage"""
+        with self._lock:
+            progress = {name: dict(counters) for name, counters in self._counters.items()}
+        for stage, stage_queue in zip(self.stages, self.queues):
+            progress[stage.name]["queued"] = stage_queue.qsize()
+        return progress
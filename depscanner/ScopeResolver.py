@@ -0,0 +1,119 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from depscanner.HttpClient import HttpClient
+from depscanner.MongoManager import MongoManager
+from depscanner.ResolutionCache import ResolutionCache
+from depscanner.models.Scope import Scope
+
+
+class ScopeResolver:
+    """
+    Find out whether the npm scopes (organisations) exist.
+    - The scopes are looked up in memory first, then in the scopes collection, and only asked to npm when neither knows them
+      or what they know is older than ttl seconds.
+    - Concurrent lookups of the same scope share one request (in threads and in the asyncio resolver),
+      so there is at most one request per scope and ttl.
+    - The answers of npm are upserted in the scopes collection. Rate limits and errors are neither cached nor stored.
+    """
+
+    REGISTRY = "registry.npmjs.org"
+
+    def __init__(
+        self,
+        http: HttpClient,
+        mongomgr: MongoManager,
+        logger: logging.Logger,
+        ttl: int = 86400,
+        max_entries: int = 10000,
+    ):
+        self.http = http
+        self.mongomgr = mongomgr
+        self.logger = logger
+        self.ttl = ttl
+        self.cache = ResolutionCache(logger=logger, ttl=ttl, max_entries=max_entries)
+        self.database_hits = 0
+        self.requests = 0
+        # The lookups run in the scan threads and in the event loop of the asyncio resolver
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def get_scope_url(scope: str) -> str:
+        """URL of the npm registry API listing the packages of a scope/organisation"""
+        # This API call is made when nmp cli issues this command:
+        # npm access list packages @scope
+        return f"https://registry.npmjs.org/-/org/{scope}/package"
+
+    @staticmethod
+    def _get_key(scope: str) -> tuple:
+        return ("registry.npmjs.org/-/org", scope)
+
+    @staticmethod
+    def _is_cacheable(scope: Scope) -> bool:
+        """Only conclusive answers of npm are cached, not the failures or rate limits"""
+        return scope.response_code not in (None, 403, 429)
+
+    def _is_fresh(self, scope: Scope) -> bool:
+        try:
+            updated = scope.updated if isinstance(scope.updated, datetime) else datetime.fromisoformat(scope.updated)
+        except (TypeError, ValueError):
+            return False
+        return datetime.now() - updated < timedelta(seconds=self.ttl)
+
+    def _get_from_database(self, name: str) -> Scope:
+        """Return the scope stored in the database if it was checked less than ttl seconds ago"""
+        scopes = list(self.mongomgr.get_scopes(name=name))
+        if len(scopes) == 0:
+            return None
+        if len(scopes) > 1:
+            self.logger.warning(f"More than one scope in the db with name {name}. Investigate.")
+        scope = Scope.from_dict(scopes[0])
+        if not self._is_fresh(scope):
+            return None
+        with self._stats_lock:
+            self.database_hits += 1
+        return scope
+
+    def _save(self, name: str, status_code: int) -> Scope:
+        """Build the scope from the response code of npm and store it if the answer is conclusive"""
+        scope = Scope(name=name, response_code=status_code, present=(status_code == 200))
+        if self._is_cacheable(scope):
+            self.mongomgr.update_scope(scope)
+        return scope
+
+    def _lookup(self, name: str) -> Scope:
+        scope = self._get_from_database(name)
+        if scope is not None:
+            return scope
+        with self._stats_lock:
+            self.requests += 1
+        status_code = self.http.head(self.get_scope_url(name), allow_redirects=True).status_code
+        return self._save(name, status_code)
+
+    def resolve(self, name: str) -> Scope:
+        """Return the scope with the response code of npm, from memory, the database or npm"""
+        return self.cache.get_or_compute(self._get_key(name), lambda: self._lookup(name), cacheable=self._is_cacheable)
+
+    async def resolve_async(self, name: str, request_status, run_blocking) -> Scope:
+        """
+        Asynchronous equivalent of resolve for the asyncio resolver.
+        request_status(url) is the coroutine returning the status code of a HEAD request, run_blocking(func, *args) runs the database calls.
+        """
+
+        async def lookup():
+            scope = await run_blocking(self._get_from_database, name)
+            if scope is not None:
+                return scope
+            with self._stats_lock:
+                self.requests += 1
+            status_code = await request_status(self.get_scope_url(name))
+            return await run_blocking(self._save, name, status_code)
+
+        return await self.cache.get_or_compute_async(self._get_key(name), lookup, cacheable=self._is_cacheable)
+
+    def get_stats(self) -> dict:
+        """Return the lookups answered from the database and the requests sent to npm, with the memory cache counters"""
+        with self._stats_lock:
+            stats = {"database_hits": self.database_hits, "requests": self.requests}
+        return {**stats, **self.cache.get_stats()}
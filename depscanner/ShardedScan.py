@@ -0,0 +1,199 @@
+import hashlib
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+import time
+
+from depscanner.DepScanner import DepScanner
+
+
+def _run_shard(index: int, workers: int, targets: dict, tokens: list, options: dict, log_level: int, events, progress_interval: float):
+    """Scan the targets of a shard in a child process, sending its logs, progress and summary to the parent through events"""
+    # The records are written by the parent, so the processes don't write to the same log file and console
+    logger = logging.getLogger(f"depscanner.shard{index + 1}")
+    logger.setLevel(log_level)
+    logger.propagate = False
+    handler = logging.handlers.QueueHandler(events)
+    handler.setFormatter(logging.Formatter(f"[{index + 1}/{workers}] %(message)s"))
+    logger.addHandler(handler)
+
+    summary = {"repositories": 0, "findings": 0, "status": "Completed"}
+    ds = None
+    finished = threading.Event()
+    try:
+        ds = DepScanner(gh_token=tokens, logger=logger, **options)
+        ds.shard = f"{index + 1}/{workers}"
+        ds.set_targets(**targets)
+
+        def report_progress():
+            while not finished.wait(progress_interval):
+                events.put(("progress", index, ds.get_scan_progress()))
+
+        threading.Thread(target=report_progress, name="ShardProgress", daemon=True).start()
+        if ds.is_user_authenticated():
+            ds.scan()
+        else:
+            summary["status"] = "Not authenticated"
+            logger.error("User not autenticated successfully. Stopping")
+    except Exception as e:
+        logger.exception(f"Error in the scan of process {index + 1}/{workers}")
+        summary["status"] = f"Error: {e}"
+    finally:
+        finished.set()
+        if ds is not None:
+            summary["repositories"] = len(ds.repos_to_explore)
+            summary["findings"] = ds.findings
+            events.put(("progress", index, ds.get_scan_progress()))
+        events.put(("finished", index, summary))
+
+
+class ShardedScan:
+    """
+    Run a scan in several local processes, so the parsing and JSON decoding of the scan are not limited to one core by the GIL.
+    - The organisations (or repositories) are split between the processes by a hash of their name, so a target is always
+      scanned by the same process of a given number of processes.
+    - Each process has its own DepScanner, HTTP connection pools and Mongo client, and stores its results in the database as usual.
+    - The GitHub tokens are split between the processes when there are enough of them, otherwise they are shared.
+    - The parent process writes the logs of all the processes and aggregates their progress and findings.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        logger: logging.Logger,
+        gh_token: str | list[str] = None,
+        organisation_file: str = None,
+        repositories_file: str = None,
+        domains_file: str = None,
+        progress_interval: float = 30,
+        **options,
+    ):
+        self.workers = workers
+        self.logger = logger
+        self.tokens = DepScanner._parse_tokens(gh_token)
+        self.progress_interval = progress_interval
+        # Rest of the DepScanner arguments (force, proxy, config, webhook_url, stars, incremental...)
+        self.options = options
+        self.targets = self._load_targets(organisation_file, repositories_file, domains_file)
+        self._progress = {}
+        self._summaries = {}
+
+    @staticmethod
+    def _load_targets(organisation_file: str, repositories_file: str, domains_file: str) -> dict:
+        """Read the target files with the same rules as DepScanner"""
+        organisations = DepScanner.load_organisations(organisation_file)
+        repositories = DepScanner.load_repositories(repositories_file)
+        domains = []
+        if len(organisations) == 0 and domains_file is not None:
+            with open(domains_file, "r", encoding="UTF-8") as f:
+                domains = sorted(set(domain.split(".")[0] for domain in f.read().splitlines() if domain))
+        return {"organisations": organisations, "repositories": repositories, "domains": domains}
+
+    @staticmethod
+    def get_shard(name: str, workers: int) -> int:
+        """Index of the process scanning a target. Python's hash() is salted per process, so a digest of the name is used"""
+        # The repositories of an organisation go to the same process
+        owner = name.split("/")[0].lower()
+        return int.from_bytes(hashlib.sha1(owner.encode("utf-8")).digest()[:8], "big") % workers
+
+    def shard_targets(self) -> list[dict]:
+        """Split the targets between the processes. Processes without targets are left out"""
+        shards = [{"organisations": [], "repositories": [], "domains": []} for _ in range(self.workers)]
+        for kind, names in self.targets.items():
+            for name in names:
+                shards[self.get_shard(name, self.workers)][kind].append(name)
+        for shard in shards:
+            # The organisation names of the domains are scanned as organisations
+            if shard["domains"]:
+                shard["organisations"] = list(shard["domains"])
+        return [shard for shard in shards if any(shard.values())]
+
+    def _get_tokens(self, index: int, shards: int) -> list[str]:
+        """Give each process its own tokens when there are at least as many tokens as processes"""
+        if len(self.tokens) >= shards:
+            return self.tokens[index::shards]
+        return self.tokens
+
+    def _handle_events(self, events, processes: dict):
+        """Write the log records of the processes and keep their last progress and summary, until all of them finish"""
+        last_report = time.monotonic()
+        while len(self._summaries) < len(processes):
+            try:
+                event = events.get(timeout=1)
+            except queue.Empty:
+                # A process killed before it sent its summary
+                for index, process in processes.items():
+                    if index not in self._summaries and not process.is_alive():
+                        self._summaries[index] = {"repositories": 0, "findings": 0, "status": f"Exit code {process.exitcode}"}
+                event = None
+            if isinstance(event, logging.LogRecord):
+                self.logger.handle(event)
+            elif event is not None:
+                kind, index, data = event
+                if kind == "progress":
+                    self._progress[index] = data
+                elif kind == "finished":
+                    self._summaries[index] = data
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                progress = self.get_scan_progress()
+                self.logger.info(
+                    f"📊 {progress['current']}/{progress['total']} repositories scanned ({progress['percentage']}%) "
+                    f"by {len(processes) - len(self._summaries)} processes"
+                )
+
+    def scan(self):
+        """Scan the shards in their own processes and wait for all of them"""
+        shards = self.shard_targets()
+        if len(shards) == 0:
+            self.logger.warning("No targets to scan")
+            return
+        self.logger.info(f"🔀 Scanning {sum(len(v) for v in self.targets.values())} targets in {len(shards)} processes")
+
+        # A fresh interpreter per process, the Mongo clients and connection pools must not be inherited through fork
+        context = multiprocessing.get_context("spawn")
+        events = context.Queue()
+        processes = {}
+        for index, targets in enumerate(shards):
+            process = context.Process(
+                target=_run_shard,
+                name=f"depscanner-{index + 1}",
+                args=(
+                    index,
+                    len(shards),
+                    targets,
+                    self._get_tokens(index, len(shards)),
+                    self.options,
+                    self.logger.getEffectiveLevel(),
+                    events,
+                    self.progress_interval,
+                ),
+            )
+            process.start()
+            processes[index] = process
+
+        try:
+            self._handle_events(events, processes)
+        finally:
+            for process in processes.values():
+                process.join()
+
+        for index in sorted(self._summaries):
+            summary = self._summaries[index]
+            self.logger.info(
+                f"🧩 Process {index + 1}/{len(shards)}: {summary['repositories']} repositories, "
+                f"{summary['findings']} missing packages ({summary['status']})"
+            )
+        self.logger.info(
+            f"🏁 {sum(s['repositories'] for s in self._summaries.values())} repositories scanned, "
+            f"{sum(s['findings'] for s in self._summaries.values())} missing packages found"
+        )
+
+    def get_scan_progress(self) -> dict:
+        """Return the progress of all the processes together"""
+        current = sum(p.get("current", 0) for p in self._progress.values())
+        total = sum(p.get("total", 0) for p in self._progress.values())
+        percentage = int((current / total) * 100) if total else 0
+        return {"current": current, "total": total, "percentage": percentage}
@@ -0,0 +1,61 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class WorkerPool:
+    """
+    Long-lived pool of worker threads shared by the whole scan.
+    The number of threads is fixed, and the number of tasks waiting for a thread is bounded:
+    submit() blocks when the queue is full, so producers can't pile up work (and memory) faster than the workers consume it.
+    A failing task only fails its own future, the workers and the rest of the tasks keep going.
+    """
+
+    def __init__(self, logger: logging.Logger, max_workers: int = 32, queue_size: int = 256, name: str = "depscan"):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.name = name
+        self.executor = None
+        self._lock = threading.Lock()
+        # One slot per running task plus one per queued task
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Return the underlying executor, creating it the first time it's needed or after a shutdown"""
+        with self._lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            return self.executor
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Submit a task to the pool. Blocks while the submission queue is full"""
+        self._slots.acquire()
+        try:
+            future = self.get_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def run_all(self, fn, items: list) -> list:
+        """
+        Run fn for each item in the pool and wait for all of them.
+        Returns the results of the tasks that succeeded. The failures are logged and skipped.
+        """
+        futures = [(item, self.submit(fn, item)) for item in items]
+        results = []
+        for item, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                self.logger.error(f"Task {getattr(fn, '__name__', fn)} failed for {item}: {e}")
+        return results
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker threads. The pool is recreated if more tasks are submitted afterwards"""
+        with self._lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer of the Mongo writes made in the hot loops of the scan.
+    - The operations (InsertOne, UpdateOne...) are collected per collection and written with ordered bulk_write calls,
+      so each collection receives them in the order they were made.
+    - The buffer is flushed when it holds max_operations operations, every flush_interval seconds from a background thread,
+      and when flush() is called (end of the scan, daemon stop).
+    - An operation failing in a batch (e.g. a duplicate key) is logged and the rest of the batch is written.
+    - When a batch can't be written at all (e.g. the server is down), its operations are put back at the front of the buffer
+      and retried by the next flush. The error is only raised by stop(), at the end of the scan, if they are still not written.
+    """
+
+    def __init__(self, db: Database, logger: logging.Logger, max_operations: int = 500, flush_interval: float = 2.0):
+        self.db = db
+        self.logger = logger
+        self.max_operations = max_operations
+        self.flush_interval = flush_interval
+        self._operations = {}  # collection name -> list of operations
+        self._size = 0
+        self._lock = threading.Lock()
+        # Only one flush at a time, so the batches of a collection are written in order
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.operations_written = 0
+        self.write_errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+        self.last_error = None
+
+    def start(self):
+        """Start the background thread flushing the buffer every flush_interval seconds"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="WriteBuffer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Error flushing the write buffer: {e}")
+
+    def stop(self):
+        """Stop the background thread and write the operations left. Raises the last write error if some operations could not be written"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._lock:
+            pending = self._size
+        if pending > 0 and self.last_error is not None:
+            raise self.last_error
+
+    def add(self, collection: str, operation):
+        """Buffer an operation of a collection. The buffer is flushed by the caller when it's full"""
+        with self._lock:
+            self._operations.setdefault(collection, []).append(operation)
+            self._size += 1
+            full = self._size >= self.max_operations
+        if full:
+            self.flush()
+
+    def _write(self, collection: str, operations: list) -> list:
+        """Write the operations in order, skipping the ones that fail. Returns the operations not written because the bulk write itself failed"""
+        while operations:
+            try:
+                self.db[collection].bulk_write(operations, ordered=True)
+                self.operations_written += len(operations)
+                return []
+            except BulkWriteError as bwe:
+                # An ordered bulk write stops at the first error, write the operations after it
+                failed = bwe.details["writeErrors"][0]
+                self.logger.debug(f"Buffered write to {collection} failed: {failed.get('errmsg')}")
+                self.write_errors += 1
+                self.operations_written += failed["index"]
+                operations = operations[failed["index"] + 1:]
+            except Exception as e:
+                self.logger.error(f"Error writing {len(operations)} buffered operations to {collection}, they will be retried: {e}")
+                self.last_error = e
+                return operations
+        return []
+
+    def _requeue(self, unwritten: dict):
+        """Put the operations not written back at the front of the buffer, before the ones added during the flush"""
+        with self._lock:
+            for collection, operations in unwritten.items():
+                self._operations[collection] = operations + self._operations.get(collection, [])
+                self._size += len(operations)
+                self.write_errors += len(operations)
+
+    def flush(self):
+        """Write all the buffered operations"""
+        with self._flush_lock:
+            with self._lock:
+                batches, self._operations = self._operations, {}
+                self._size = 0
+            if not batches:
+                return
+            start = time.monotonic()
+            self.last_error = None
+            unwritten = {}
+            for collection, operations in batches.items():
+                operations = self._write(collection, operations)
+                if operations:
+                    unwritten[collection] = operations
+            if unwritten:
+                self._requeue(unwritten)
+            latency = time.monotonic() - start
+            self.flushes += 1
+            self.total_latency += latency
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def get_stats(self) -> dict:
+        """Return the number of flushes, operations written and failed, operations waiting and the flush latencies in seconds"""
+        with self._lock:
+            pending = self._size
+        return {
+            "flushes": self.flushes,
+            "operations": self.operations_written,
+            "errors": self.write_errors,
+            "pending": pending,
+            "last_latency": self.last_latency,
+            "avg_latency": self.total_latency / self.flushes if self.flushes else 0.0,
+            "max_latency": self.max_latency,
+        }
@@ -2,7 +2,22 @@ from .DepScanner import DepScanner
 from .DepScannerDaemon import DepScannerDaemon
 from .MongoManager import MongoManager
 from .DiscordBell import DiscordBell
-from .ModfileParser import ModfileParser
+from .ModfileParser import ModfileParser, DependencyInfo
+from .ParseCache import ParseCache
+from .HttpClient import HttpClient
+from .ResponseCache import ResponseCache
+from .GithubGraphQL import GithubGraphQL
+from .OrgEnumerator import OrgEnumerator
+from .WorkerPool import WorkerPool
+from .ResolutionCache import ResolutionCache
+from .NameIndex import NameIndex
+from .GoModuleResolver import GoModuleResolver, GoModule
+from .ScopeResolver import ScopeResolver
+from .WriteBuffer import WriteBuffer
+from .ScanCheckpoint import ScanCheckpoint
+from .JobQueue import JobQueue
+from .ShardedScan import ShardedScan
+from .ScanPipeline import ScanPipeline, PipelineStage
 from .models.Package import Package
 from .models.Dependency import Dependency
 from .models.Scope import Scope
@@ -8,8 +8,11 @@ db.createCollection('packages');
 db.createCollection('scopes');
 
 // Create indexes for better performance
+// The scanner also creates the indexes of its queries at startup (MongoManager.ensure_indexes)
 db.repositories.createIndex({ "name": 1 }, { unique: true });
 db.repositories.createIndex({ "owner.login": 1}, {collation: {locale: 'en', strength: 1}});
 db.packages.createIndex({ "name": 1, "registry": 1}, {unique: true});
 db.dependencies.createIndex({ "repo_name": 1, "package_name": 1, "semver": 1, "dependency_file": 1}, {unique: true});
 db.scopes.createIndex({ "name": 1}, {unique: true});
+db.http_cache.createIndex({ "url": 1}, {unique: true});
+db.parsed_depfiles.createIndex({ "sha": 1, "name": 1}, {unique: true});
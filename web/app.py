@@ -31,6 +31,32 @@ def read_config_file():
         print(f"Configuration file {config_file_path} not found.")
         return {}
 
+def get_unfinished_scans():
+    """Return the scans that were interrupted before completing, to offer resuming them"""
+    mongo_config = config.get("mongo",{})
+    mongomgr = None
+    try:
+        mongomgr = MongoManager(
+            host = mongo_config["host"],
+            port = int(mongo_config["port"]),
+            database = mongo_config["database"],
+            username = mongo_config["username"],
+            password = mongo_config["password"],
+        )
+        scans = list(mongomgr.get_scans(unfinished=True))
+    except Exception as e:
+        logging.error(f"Error reading the scans from the database: {e}")
+        return []
+    finally:
+        # Don't leave a client (connection pool and monitor threads) behind on every request
+        if mongomgr is not None:
+            mongomgr.close_database()
+    # The running scan can't be resumed
+    running_scan_id = None
+    if daemon.running and daemon.dep_scanner and daemon.dep_scanner.checkpoint:
+        running_scan_id = daemon.dep_scanner.checkpoint.scan_id
+    return [scan for scan in scans if scan["_id"] != running_scan_id]
+
 def setup_logging():
     logging_config = {}
     with open("logging.yml","r") as lf:
@@ -128,7 +154,7 @@ def run():
     if request.method == "GET":
         file_type = request.args.get("file_type")
         if file_type is None:
-            return render_template("run.html", files=[])
+            return render_template("run.html", files=[], scans=get_unfinished_scans())
         else:
             if file_type == "organizations":
                 folder = os.path.join(app.config["UPLOAD_FOLDER"], "organizations")
@@ -165,9 +191,11 @@ def run():
         file_name = request.form.get("file_name")
         file_type = request.form.get("file_type")
         discord_webhook = request.form.get("discordWebhook")
+        # Several tokens can be separated with commas, the scanner rotates between them
         github_token = request.form.get("githubToken")
         num_stars = int(request.form.get("numStars")) if len(request.form.get("numStars")) else 0
         force = request.form.get("forceRefresh", "false").lower() == "on"
+        incremental = request.form.get("incrementalScan", "false").lower() == "on"
 
         if not file_name or not file_type or not github_token:
             flash("Github Token and file name are required to run.", "danger")
@@ -182,6 +210,7 @@ def run():
             gh_token=github_token,
             webhook_url=discord_webhook,
             force=force,
+            incremental=incremental,
             stars=num_stars,
             organisation_file=os.path.join(os.path.dirname(__file__), file_name) if file_type == "organizations" else None,
             repositories_file=os.path.join(os.path.dirname(__file__), file_name) if file_type == "repositories" else None,
@@ -199,6 +228,30 @@ def run():
     else:
         return redirect("index.html")
 
+@app.route("/scan/resume", methods=["POST"])
+def resume_scan():
+    """Continue an interrupted scan where it stopped"""
+    scan_id = request.form.get("scan_id")
+    # Tokens are not stored with the scan, they have to be given again
+    github_token = request.form.get("githubToken")
+    if not scan_id or not github_token:
+        flash("The scan id and a Github Token are required to resume a scan.", "danger")
+        return redirect(url_for("run"))
+    if daemon.running:
+        flash("A scan is already running. Go to <a href='/logs'>logs</a> to see how it is going", "warning")
+        return redirect(url_for("run"))
+
+    daemon.dep_scanner = DepScanner(
+        gh_token=github_token,
+        webhook_url=request.form.get("discordWebhook"),
+        resume=scan_id,
+        logger=logging.getLogger('depScannerThread'),
+        config=os.path.join(os.path.dirname(__file__), "../config.yml"),
+    )
+    daemon.start()
+    flash(f"Scan {scan_id} resumed.", "success")
+    return render_template("run.html", files=[], progress=0)
+
 @app.route("/get-files", methods=["POST"])
 def get_files():
     file_type = request.json.get("file_type")